@@ -1,122 +1,98 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import numpy as np
-from collections import defaultdict
-import calendar
-
-# Importar listas de tickers
-try:
-    from tickers_fundamentus import get_tickers_fundamentus, METADATA
-    USE_FUNDAMENTUS = True
-except:
-    from acoes_b3_completa import get_acoes_b3_completas, get_fiis_completos
-    USE_FUNDAMENTUS = False
 
-# --- Configurações da Página Streamlit ---
-st.set_page_config(layout="wide", page_title="🎯 Otimizador de Carteira de Dividendos")
+from universo_b3 import tickers_by_category, categorize_ticker
+from cadastro_ativos import get_cadastro
+from manutencao_universo import get_universe_health, describe_universe_report
+from motor_analise import run_concurrent_analysis, DEFAULT_MAX_WORKERS, MAX_WORKERS_LIMIT
+from download_lote import download_batch, fetch_stock_metadata, fetch_batch_record, batch_miss_reason
+from cliente_mercado import get_market_client
+from armazem_dados import get_market_store, get_dividends_incremental
+from simulacao_carteira import simulate_portfolio_history, create_dividend_calendar
+from metricas_lote import build_ranking
+from historico_dividendos import get_history_store, concat_rankings, without_history
+from snapshot_ranking import load_latest_snapshot, refresh_ranking_prices
+from filtro_ranking import RankingIndex, page_count, page_positions
+from projecao_renda import project_income, DEFAULT_PATHS, MAX_HORIZON_YEARS
+from backtest_carteira import (matrices_from_frames, portfolio_weights, backtest_portfolio,
+                               backtest_summary, REBALANCE_FREQUENCIES)
+from cache_compartilhado import (shared_cache, clear_local_cache, cache_stats, get_negative_cache,
+                                  MOTIVO_ERRO)
+from registro_compacto import dividends_to_arrays, arrays_to_dividends, compact_record, expand_record
+from otimizador_carteira import optimize_portfolio, DEFAULT_MAX_PESO_ATIVO, DEFAULT_MAX_PESO_SETOR
 
-# --- Lista Curada de Tickers da B3 ---
+# Tickers por grupo na análise em streaming (o ranking parcial é atualizado a cada grupo)
+STREAM_GROUP_SIZE = 25
 
-def get_all_b3_tickers():
-    """Retorna lista atualizada de tickers da B3 (Fundamentus + ETFs/BDRs)."""
-    
-    # Usar lista atualizada do Fundamentus (418 tickers)
-    tickers_fundamentus = get_tickers_fundamentus()
-    
-    # Adicionar BDRs populares que podem não estar no Fundamentus
-    bdrs_extras = [
-        "AAPL34.SA", "MSFT34.SA", "AMZO34.SA", "GOGL34.SA", "META34.SA",
-        "TSLA34.SA", "NVDC34.SA", "NFLX34.SA", "DIS34.SA", "COCA34.SA",
-        "NIKE34.SA", "VISA34.SA", "PYPL34.SA", "BABA34.SA", "DISB34.SA"
-    ]
-    
-    # Adicionar ETFs populares que podem não estar no Fundamentus
-    etfs_extras = [
-        "BOVA11.SA", "SMAL11.SA", "IVVB11.SA", "SPXI11.SA", "MATB11.SA",
-        "PIBB11.SA", "ISUS11.SA", "FIND11.SA", "DIVO11.SA", "BOVX11.SA",
-        "GOVE11.SA", "BRAX11.SA", "XBOV11.SA", "BOVV11.SA"
-    ]
-    
-    # Combinar e remover duplicatas
-    all_tickers = list(set(tickers_fundamentus + bdrs_extras + etfs_extras))
-    
-    return sorted(all_tickers)
+# Valores iniciais dos controles das abas. Só a aba aberta executa, e o Streamlit
+# descarta o valor dos widgets que não rodaram; mantidos no session_state (e os
+# widgets criados só com key), as escolhas sobrevivem à troca de aba.
+CONTROLES_ABAS = {
+    'filtro_categoria': 'Todos',
+    'filtro_setor': 'Todos',
+    'filtro_dy_minimo': 0.0,
+    'filtro_dy_maximo': 40.0,
+    'filtro_consistencia': 0,
+    'linhas_pagina': 50,
+    'capital_total': 50000.0,
+    'lote_minimo': 100,
+    'dy_minimo_port': 4.0,
+    'metodo_alocacao': "Maximizar renda (com limites)",
+    'max_peso_ativo': int(DEFAULT_MAX_PESO_ATIVO * 100),
+    'max_peso_setor': int(DEFAULT_MAX_PESO_SETOR * 100),
+    'anos_projecao': 5,
+    'n_caminhos': DEFAULT_PATHS,
+    'anos_simulacao': 5,
+    'anos_backtest': 5,
+    'rebalanceamento': "Nenhum",
+    'reinvestir': True
+}
 
-def categorize_ticker(ticker):
-    """Categoriza o ticker em: Ação, FII, BDR ou ETF."""
-    ticker_clean = ticker.replace(".SA", "").upper()
-    
-    # ETFs específicos
-    etfs_list = ["BOVA11", "SMAL11", "IVVB11", "SPXI11", "MATB11", "PIBB11", 
-                 "ISUS11", "FIND11", "DIVO11", "BOVX11", "GOVE11", "BRAX11", 
-                 "XBOV11", "BOVV11"]
-    if ticker_clean in etfs_list:
-        return "ETF"
-    
-    # FIIs terminam em 11 (mas não são ETFs)
-    if ticker_clean.endswith("11"):
-        return "FII"
-    
-    # BDRs terminam em 34 ou 35
-    if ticker_clean.endswith("34") or ticker_clean.endswith("35"):
-        return "BDR"
-    
-    # Default: Ação
-    return "Ação"
+# --- Configurações da Página Streamlit ---
+st.set_page_config(layout="wide", page_title="🎯 Otimizador de Carteira de Dividendos")
 
 # --- Funções Auxiliares ---
 
-@st.cache_resource(ttl=1800)
-def get_stock_object_yf(ticker_symbol):
-    """Retorna o objeto Ticker do yfinance com retry."""
+@shared_cache(ttl=1800)
+def get_stock_info_yf(ticker_symbol):
+    """Busca informações gerais da ação (dict pequeno e serializável)."""
     import time
+    import yfinance as yf
+    stock = yf.Ticker(ticker_symbol)
+    info = {}
     max_retries = 3
     
     for attempt in range(max_retries):
-        try:
-            stock = yf.Ticker(ticker_symbol)
-            # Forçar download de dados para validar ticker
-            _ = stock.history(period="5d")
-            if hasattr(stock, 'info'):
-                return stock
-            return None
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(1)  # Aguardar antes de tentar novamente
-                continue
-            return None
-    return None
-
-@st.cache_data(ttl=1800)
-def get_stock_info_yf(_stock_obj, ticker_symbol):
-    """Busca informações gerais da ação."""
-    if _stock_obj is None:
-        return None
-    try:
         # Tentar obter info de múltiplas formas
-        info = {}
         try:
-            info = _stock_obj.info
-        except:
+            info = stock.info or {}
+        except Exception:
+            info = {}
+        if info:
+            break
+        try:
             # Fallback: obter preço do histórico recente
-            hist = _stock_obj.history(period="5d")
+            hist = stock.history(period="5d")
             if not hist.empty:
                 info = {'currentPrice': hist['Close'].iloc[-1]}
-        
-        if not info:
-            return None
-        
+                break
+        except Exception:
+            pass
+        if attempt < max_retries - 1:
+            time.sleep(1)  # Aguardar antes de tentar novamente
+    
+    if not info:
+        return None
+    
+    try:
         # Obter preço de forma mais robusta
         preco = info.get('regularMarketPrice') or info.get('currentPrice') or info.get('previousClose', 0)
         
         # Se ainda não temos preço, tentar do histórico
         if preco == 0:
             try:
-                hist = _stock_obj.history(period="5d")
+                hist = stock.history(period="5d")
                 if not hist.empty:
                     preco = hist['Close'].iloc[-1]
             except:
@@ -134,285 +110,290 @@ def get_stock_info_yf(_stock_obj, ticker_symbol):
     except Exception as e:
         return None
 
-@st.cache_data(ttl=1800)
-def get_dividends_history(_stock_obj, years=5):
-    """Busca histórico de dividendos com retry."""
-    if _stock_obj is None:
-        return pd.DataFrame()
-    
+def _fetch_dividends_yf(fetch, max_retries=3):
+    """Executa a busca de dividendos no Yahoo com retry (só em erro: série vazia é um resultado)."""
     import time
-    max_retries = 3
     
     for attempt in range(max_retries):
         try:
-            end_date = datetime.today()
-            start_date = end_date - timedelta(days=years*365 + 100)
-            
-            # Usar .dividends com retry
-            dividends = _stock_obj.dividends
+            dividends = fetch()
             
             if dividends is None or dividends.empty:
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                    continue
-                return pd.DataFrame()
+                return pd.Series(dtype=float)
             
-            # Filtrar período
-            dividends_index = dividends.index.tz_localize(None) if dividends.index.tz else dividends.index
-            start_dt = pd.to_datetime(start_date)
-            end_dt = pd.to_datetime(end_date)
-            
-            dividends_filtered = dividends[(dividends_index >= start_dt) & (dividends_index <= end_dt)]
-            
-            return dividends_filtered
+            return dividends[dividends > 0]
         except Exception as e:
             if attempt < max_retries - 1:
                 time.sleep(1)
                 continue
-            return pd.DataFrame()
+            raise
     
-    return pd.DataFrame()
+    return pd.Series(dtype=float)
 
-@st.cache_data(ttl=1800)
-def calculate_dividend_metrics(ticker_symbol, years=5):
-    """Calcula métricas de dividendos para uma ação."""
-    stock = get_stock_object_yf(ticker_symbol)
-    if stock is None:
-        return None
-    
-    info = get_stock_info_yf(stock, ticker_symbol)
-    if info is None or info['preco_atual'] == 0:
-        return None
-    
-    dividends = get_dividends_history(stock, years)
-    if dividends.empty:
-        return None
-    
-    # Calcular métricas
-    preco_atual = info['preco_atual']
-    
-    # DY dos últimos 12 meses
+@shared_cache(ttl=1800)
+def get_dividend_arrays(ticker_symbol, years=5):
+    """Dividendos do armazém local (só o delta vem do Yahoo) como arrays (datas int64, valores float64)."""
+    import yfinance as yf
     end_date = datetime.today()
-    start_12m = end_date - timedelta(days=365)
-    dividends_index = dividends.index.tz_localize(None) if dividends.index.tz else dividends.index
-    dividends_12m = dividends[dividends_index >= pd.to_datetime(start_12m)]
-    dy_12m = (dividends_12m.sum() / preco_atual * 100) if not dividends_12m.empty and preco_atual > 0 else 0
-    
-    # Dividendos anuais
-    dividends_by_year = dividends.groupby(dividends.index.year).sum()
-    dy_medio = dividends_by_year.mean() / preco_atual * 100 if preco_atual > 0 else 0
+    start_date = end_date - timedelta(days=years*365 + 100)
+    stock = yf.Ticker(ticker_symbol)
     
-    # Consistência (% de anos com dividendos)
-    anos_com_dividendos = len(dividends_by_year)
-    consistencia = (anos_com_dividendos / years) * 100
+    dividends = get_dividends_incremental(
+        get_market_store(), ticker_symbol,
+        fetch_full=lambda: _fetch_dividends_yf(lambda: stock.dividends),
+        fetch_since=lambda since: _fetch_dividends_yf(
+            lambda: stock.history(start=since.strftime('%Y-%m-%d'), actions=True)['Dividends']
+        ),
+        start=start_date
+    )
     
-    # Crescimento (CAGR)
-    if len(dividends_by_year) >= 2:
-        start_val = dividends_by_year.iloc[0]
-        end_val = dividends_by_year.iloc[-1]
-        num_years = len(dividends_by_year) - 1
-        if start_val > 0 and num_years > 0:
-            cagr = ((end_val / start_val) ** (1 / num_years) - 1) * 100
-        else:
-            cagr = 0
-    else:
-        cagr = 0
+    # Filtrar período (o armazém devolve o índice ordenado: busca binária)
+    fim = dividends.index.searchsorted(pd.Timestamp(end_date), side='right')
+    return dividends_to_arrays(dividends.iloc[:fim])
+
+def get_dividends_history(ticker_symbol, years=5):
+    """Busca histórico de dividendos (Series remontada dos arrays em cache)."""
+    datas, valores = get_dividend_arrays(ticker_symbol, years)
+    if len(datas) == 0:
+        return pd.DataFrame()
+    return arrays_to_dividends(datas, valores)
+
+@shared_cache(ttl=86400)
+def get_stock_metadata_yf(ticker_symbol):
+    """Busca nome e setor da ação (mudam raramente, cache de 24h)."""
+    return fetch_stock_metadata(ticker_symbol)
+
+@shared_cache(ttl=1800)
+def _fetch_ticker_record(ticker_symbol, years=5, _batch=None):
+    """Registro compacto (dividendos em arrays) de preço, nome, setor e dividendos."""
+    if _batch is not None:
+        record = fetch_batch_record(ticker_symbol, _batch, years, get_stock_metadata_yf)
+        if record is None and ticker_symbol in _batch.falhas:
+            # Erro de busca é passageiro: a exceção não entra no cache (um None ficaria 30 min)
+            raise RuntimeError(f"falha ao baixar {ticker_symbol}")
+        return compact_record(record)
     
-    # Categoria
-    categoria = categorize_ticker(ticker_symbol)
+    info = get_stock_info_yf(ticker_symbol)
+    if info is None or info['preco_atual'] == 0:
+        return None
     
-    # Score composto (ponderação: DY 40%, Consistência 30%, Crescimento 30%)
-    score = (dy_12m * 0.4) + (consistencia * 0.3) + (max(0, min(cagr, 20)) * 0.3)
+    datas, valores = get_dividend_arrays(ticker_symbol, years)
+    if len(datas) == 0:
+        return None
     
     return {
         'ticker': ticker_symbol,
         'nome': info['nome_longo'],
-        'categoria': categoria,
+        'categoria': categorize_ticker(ticker_symbol),
         'setor': info['setor'],
-        'preco': preco_atual,
-        'dy_12m': round(dy_12m, 2),
-        'dy_medio': round(dy_medio, 2),
-        'consistencia': round(consistencia, 1),
-        'cagr_dividendos': round(cagr, 2),
-        'anos_com_div': anos_com_dividendos,
-        'score': round(score, 2),
-        'dividends_history': dividends
+        'preco': info['preco_atual'],
+        'div_datas': datas,
+        'div_valores': valores
     }
 
-def analyze_selected_stocks(selected_tickers, progress_bar=None, status_container=None):
-    """Analisa os tickers selecionados com feedback detalhado."""
-    results = []
-    failed_tickers = []
-    total = len(selected_tickers)
+def fetch_ticker_data(ticker_symbol, years=5, _batch=None):
+    """Busca preço, nome, setor e dividendos de uma ação (sem calcular métricas).
     
-    for idx, ticker in enumerate(selected_tickers):
-        if progress_bar:
-            progress_bar.progress((idx + 1) / total, f"Analisando {ticker}... ({idx + 1}/{total})")
-        
-        if status_container:
-            status_container.info(f"🔍 Baixando dados de {ticker}...")
-        
-        try:
-            metrics = calculate_dividend_metrics(ticker)
-            if metrics:
-                results.append(metrics)
-                if status_container:
-                    status_container.success(f"✅ {ticker} analisado com sucesso!")
-            else:
-                failed_tickers.append(ticker)
-                if status_container:
-                    status_container.warning(f"⚠️ {ticker} sem dados de dividendos")
-        except Exception as e:
-            failed_tickers.append(ticker)
-            if status_container:
-                status_container.error(f"❌ Erro ao analisar {ticker}: {str(e)}")
-    
-    # Mostrar resumo ao final
-    if status_container:
-        if results:
-            status_container.success(f"✅ **Sucesso:** {len(results)} ativos analisados com sucesso!")
-        if failed_tickers:
-            status_container.warning(f"⚠️ **Aviso:** {len(failed_tickers)} ativos não puderam ser analisados: {', '.join(failed_tickers[:10])}")
-    
-    return pd.DataFrame(results)
+    Se `_batch` (resultado de download_batch) for informado, preço e dividendos
+    são lidos do lote em memória em vez de chamadas individuais ao Yahoo.
+    """
+    return expand_record(_fetch_ticker_record(ticker_symbol, years, _batch))
 
-def optimize_portfolio(df_stocks, capital_total, min_acoes_por_empresa=100):
-    """Otimiza o portfólio para maximizar DY e diversificação."""
-    if df_stocks.empty or capital_total <= 0:
+@shared_cache(ttl=1800)
+def calculate_dividend_metrics(ticker_symbol, years=5, _batch=None):
+    """Calcula métricas de dividendos para uma ação (histórico em arrays compactos)."""
+    record = fetch_ticker_data(ticker_symbol, years, _batch)
+    if record is None:
         return None
     
-    # Ordenar por score
-    df_sorted = df_stocks.sort_values('score', ascending=False).copy()
+    df_metrics = build_ranking([record], years)
+    if df_metrics.empty:
+        return None
     
-    # Selecionar top ações (máximo 10 para diversificação)
-    max_acoes = min(10, len(df_sorted))
-    df_selected = df_sorted.head(max_acoes).copy()
+    registro = df_metrics.iloc[0].to_dict()
+    registro['div_datas'], registro['div_valores'] = get_history_store(df_metrics).arrays(ticker_symbol)
+    return registro
+
+def iter_selected_stocks(selected_tickers, max_workers=DEFAULT_MAX_WORKERS, usar_cliente_async=False,
+                         tamanho_grupo=STREAM_GROUP_SIZE, on_result=None, on_chunk=None):
+    """Analisa os tickers em grupos e gera o resultado de cada grupo assim que fica pronto.
     
-    # Distribuir capital proporcionalmente ao score
-    df_selected['peso'] = df_selected['score'] / df_selected['score'].sum()
-    df_selected['capital_alocado'] = df_selected['peso'] * capital_total
+    Gera (df_grupo, falhas_grupo, concluidos, total). As métricas são por ticker,
+    então os DataFrames dos grupos podem ser concatenados num ranking parcial.
+    """
+    selected_tickers = list(selected_tickers)
+    total = len(selected_tickers)
+    concluidos = 0
+    download_fn = get_market_client().download if usar_cliente_async else None
     
-    # Calcular quantidade de ações (lotes de 100 para ações, 1 para FIIs/BDRs/ETFs)
-    def calcular_quantidade(row):
-        if row['categoria'] == 'Ação':
-            lote = min_acoes_por_empresa
-        else:
-            lote = 1  # FIIs, BDRs e ETFs geralmente não têm lote mínimo
+    for inicio in range(0, total, tamanho_grupo):
+        grupo = selected_tickers[inicio:inicio + tamanho_grupo]
         
-        qtd_ideal = row['capital_alocado'] / row['preco']
-        qtd_lotes = (qtd_ideal // lote) * lote
-        return int(qtd_lotes) if qtd_lotes > 0 else lote
-    
-    df_selected['quantidade'] = df_selected.apply(calcular_quantidade, axis=1)
-    
-    # Recalcular valores reais
-    df_selected['valor_investido'] = df_selected['quantidade'] * df_selected['preco']
-    
-    # Remover linhas com valor zero
-    df_selected = df_selected[df_selected['valor_investido'] > 0]
-    
-    if df_selected.empty:
-        return None
-    
-    df_selected['percentual_carteira'] = (df_selected['valor_investido'] / df_selected['valor_investido'].sum()) * 100
-    
-    # Dividendos esperados (baseado em DY 12m)
-    df_selected['dividendos_anuais_estimados'] = df_selected['valor_investido'] * (df_selected['dy_12m'] / 100)
-    df_selected['dividendos_mensais_estimados'] = df_selected['dividendos_anuais_estimados'] / 12
+        # Baixar preços e proventos do grupo de uma vez
+        if on_chunk:
+            on_chunk(concluidos, total)
+        batch = download_batch(grupo, download_fn=download_fn, store=get_market_store())
+        # Sem cotação recente conta uma falha para a quarentena do universo
+        get_universe_health().record_batch(batch, grupo)
+        motivos = {}
+        
+        def on_grupo(n, _total, ticker, record, erro):
+            if not record:
+                motivos[ticker] = MOTIVO_ERRO if erro is not None else batch_miss_reason(batch, ticker)
+            if on_result:
+                on_result(concluidos + n, total, ticker, record, erro)
+        
+        records, failed_tickers = run_concurrent_analysis(
+            grupo, lambda ticker: fetch_ticker_data(ticker, _batch=batch),
+            max_workers, on_grupo
+        )
+        # Nome/setor aprendidos do .info vão para o cadastro numa gravação por grupo
+        get_cadastro().flush()
+        # Sem preço/dividendos (ou erro) vai para o cache negativo, com TTL próprio por motivo
+        get_negative_cache().record({t: m for t, m in motivos.items() if m is not None})
+        concluidos += len(grupo)
+        
+        # Calcular as métricas do grupo de uma vez
+        yield build_ranking(records), failed_tickers, concluidos, total
+
+def analyze_selected_stocks(selected_tickers, progress_bar=None, status_container=None,
+                            max_workers=DEFAULT_MAX_WORKERS, usar_cliente_async=False, on_partial=None):
+    """Analisa os tickers selecionados em paralelo com feedback detalhado.
     
-    return df_selected[['ticker', 'nome', 'categoria', 'setor', 'preco', 'quantidade', 'valor_investido', 
-                        'percentual_carteira', 'dy_12m', 'dividendos_anuais_estimados', 
-                        'dividendos_mensais_estimados', 'score', 'dividends_history']]
-
-def simulate_portfolio_history(portfolio_df, years=5):
-    """Simula o histórico do portfólio nos últimos N anos."""
-    if portfolio_df is None or portfolio_df.empty:
-        return None, None
+    Com usar_cliente_async, cotações e proventos vêm do cliente assíncrono
+    (cliente_mercado), com limite global de requisições e backoff.
+    on_partial(df_parcial, concluidos, total) recebe o ranking acumulado a
+    cada grupo concluído, para a interface exibir resultados parciais.
+    """
     
-    # Preparar dados históricos
-    end_date = datetime.today()
-    start_date = end_date - timedelta(days=years*365)
+    def on_result(concluidos, total, ticker, record, erro):
+        if progress_bar:
+            progress_bar.progress(concluidos / total, f"Analisado {ticker}... ({concluidos}/{total})")
+        
+        if status_container:
+            if erro is not None:
+                status_container.error(f"❌ Erro ao analisar {ticker}: {str(erro)}")
+            elif record:
+                status_container.success(f"✅ {ticker} analisado com sucesso!")
+            else:
+                status_container.warning(f"⚠️ {ticker} sem dados de dividendos")
     
-    monthly_dividends = defaultdict(float)
-    annual_dividends = defaultdict(float)
+    def on_chunk(concluidos, total):
+        if status_container:
+            status_container.info(f"🔍 Baixando preços e proventos em lote... ({concluidos}/{total})")
     
-    for _, row in portfolio_df.iterrows():
-        dividends = row['dividends_history']
-        quantidade = row['quantidade']
-        
-        if dividends.empty:
+    partes = []
+    failed_tickers = []
+    for df_grupo, falhas, concluidos, total in iter_selected_stocks(
+            selected_tickers, max_workers, usar_cliente_async, on_result=on_result, on_chunk=on_chunk):
+        failed_tickers.extend(falhas)
+        if df_grupo.empty:
             continue
-        
-        for date, div_value in dividends.items():
-            date_naive = date.tz_localize(None) if hasattr(date, 'tz_localize') else date
-            
-            if date_naive >= pd.to_datetime(start_date):
-                year = date_naive.year
-                month_key = f"{date_naive.year}-{date_naive.month:02d}"
-                
-                total_dividend = div_value * quantidade
-                monthly_dividends[month_key] += total_dividend
-                annual_dividends[year] += total_dividend
+        partes.append(df_grupo)
+        if on_partial:
+            on_partial(concat_rankings(partes), concluidos, total)
     
-    # Criar DataFrames
-    df_monthly = pd.DataFrame([
-        {'mes': k, 'dividendos': v} for k, v in sorted(monthly_dividends.items())
-    ])
+    df_ranking = concat_rankings(partes)
     
-    df_annual = pd.DataFrame([
-        {'ano': k, 'dividendos': v} for k, v in sorted(annual_dividends.items())
-    ])
+    # Mostrar resumo ao final
+    if status_container:
+        if not df_ranking.empty:
+            status_container.success(f"✅ **Sucesso:** {len(df_ranking)} ativos analisados com sucesso!")
+        if failed_tickers:
+            status_container.warning(f"⚠️ **Aviso:** {len(failed_tickers)} ativos não puderam ser analisados: {', '.join(failed_tickers[:10])}")
     
-    return df_monthly, df_annual
+    return df_ranking
 
-def create_dividend_calendar(portfolio_df):
-    """Cria calendário de pagamento de dividendos."""
-    if portfolio_df is None or portfolio_df.empty:
-        return None
-    
-    # Analisar últimos 24 meses para identificar padrão
-    end_date = datetime.today()
-    start_date = end_date - timedelta(days=730)
-    
-    dividend_calendar = defaultdict(lambda: defaultdict(list))
-    
-    for _, row in portfolio_df.iterrows():
-        ticker = row['ticker']
-        dividends = row['dividends_history']
-        quantidade = row['quantidade']
-        
-        if dividends.empty:
-            continue
-        
-        for date, div_value in dividends.items():
-            date_naive = date.tz_localize(None) if hasattr(date, 'tz_localize') else date
-            
-            if date_naive >= pd.to_datetime(start_date):
-                month = date_naive.month
-                total_dividend = div_value * quantidade
-                dividend_calendar[month][ticker].append(total_dividend)
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_ranking_charts(top_dy, contagem_categoria):
+    """Figuras do ranking filtrado (top 15 por score e contagem por categoria), em cache pelos dados."""
+    import plotly.express as px
+    fig_dy = px.bar(top_dy, x='ticker', y='dy_12m',
+                   title='Top 15 - Dividend Yield (12M)',
+                   labels={'dy_12m': 'DY (%)', 'ticker': 'Ativo'},
+                   color='categoria', 
+                   color_discrete_map={'Ação': '#1f77b4', 'FII': '#ff7f0e', 
+                                      'BDR': '#2ca02c', 'ETF': '#d62728'})
+    fig_cat = px.pie(names=contagem_categoria.index, values=contagem_categoria.values,
+                    title='Distribuição por Categoria',
+                    color_discrete_map={'Ação': '#1f77b4', 'FII': '#ff7f0e', 
+                                      'BDR': '#2ca02c', 'ETF': '#d62728'})
+    return fig_dy, fig_cat
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_portfolio_charts(alocacao, calendario):
+    """Figuras da carteira (capital por ativo/categoria e calendário mensal), em cache pelos dados."""
+    import plotly.express as px
+    fig_pizza = px.pie(alocacao, values='Valor Investido (R$)', names='Ticker',
+                       title='Distribuição do Capital por Ativo')
+    fig_cat_port = px.pie(alocacao, values='Valor Investido (R$)', names='Categoria',
+                          title='Distribuição do Capital por Categoria',
+                          color='Categoria',
+                          color_discrete_map={'Ação': '#1f77b4', 'FII': '#ff7f0e', 
+                                             'BDR': '#2ca02c', 'ETF': '#d62728'})
+    fig_calendario = None
+    if calendario is not None and not calendario.empty:
+        fig_calendario = px.bar(calendario, x='mes', y='valor_estimado',
+                               title='Fluxo Mensal Estimado de Dividendos',
+                               labels={'valor_estimado': 'Valor (R$)', 'mes': 'Mês'},
+                               text='valor_estimado')
+        fig_calendario.update_traces(texttemplate='R$ %{text:.0f}', textposition='outside')
+    return fig_pizza, fig_cat_port, fig_calendario
+
+def render_summary_metrics(df_ranking):
+    """Estatísticas gerais do ranking (total, médias e categorias)."""
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Total de Ativos", len(df_ranking))
+    col2.metric("DY Médio (12M)", f"{df_ranking['dy_12m'].mean():.2f}%")
+    col3.metric("Consistência Média", f"{df_ranking['consistencia'].mean():.1f}%")
+    col4.metric("CAGR Médio", f"{df_ranking['cagr_dividendos'].mean():.2f}%")
     
-    # Calcular média por mês
-    monthly_summary = []
-    for month in range(1, 13):
-        month_name = calendar.month_name[month]
-        total_month = 0
-        tickers_pagantes = []
-        
-        if month in dividend_calendar:
-            for ticker, values in dividend_calendar[month].items():
-                avg_value = np.mean(values)
-                total_month += avg_value
-                tickers_pagantes.append(f"{ticker.replace('.SA', '')}")
+    # Contar por categoria
+    categorias_count = df_ranking['categoria'].value_counts().to_dict()
+    col5.metric("Categorias", len(categorias_count))
+
+def render_ranking_preview(placeholder, df_parcial, concluidos, total):
+    """Ranking parcial durante a análise: métricas, tabela por score e top 10 de DY."""
+    import plotly.express as px
+    df_parcial = df_parcial.sort_values('score', ascending=False)
+    with placeholder.container():
+        st.caption(f"⏳ Ranking parcial: {concluidos}/{total} ativos processados, "
+                   f"{len(df_parcial)} com dividendos. A tabela é atualizada a cada grupo.")
+        render_summary_metrics(df_parcial)
         
-        monthly_summary.append({
-            'mes_num': month,
-            'mes': month_name,
-            'valor_estimado': total_month,
-            'acoes_pagantes': ', '.join(tickers_pagantes) if tickers_pagantes else 'Nenhuma'
-        })
+        col1, col2 = st.columns(2)
+        with col1:
+            st.dataframe(
+                without_history(df_parcial[['ticker', 'categoria', 'preco', 'dy_12m', 'consistencia', 'score']]),
+                hide_index=True, width="stretch", height=350
+            )
+        with col2:
+            fig_top = px.bar(df_parcial.nlargest(10, 'dy_12m'), x='ticker', y='dy_12m',
+                             title='Top 10 - Dividend Yield (12M) parcial',
+                             labels={'dy_12m': 'DY (%)', 'ticker': 'Ativo'},
+                             color='categoria',
+                             color_discrete_map={'Ação': '#1f77b4', 'FII': '#ff7f0e',
+                                                 'BDR': '#2ca02c', 'ETF': '#d62728'})
+            st.plotly_chart(fig_top, width="stretch", key=f"preview_top10_{concluidos}")
+
+def lazy_tabs(rotulos, key):
+    """Abas em que só o conteúdo da aba selecionada é executado.
     
-    return pd.DataFrame(monthly_summary)
+    Versões do Streamlit sem st.tabs(on_change=...) executam todas, como antes.
+    """
+    try:
+        return st.tabs(rotulos, key=key, on_change="rerun")
+    except TypeError:
+        return st.tabs(rotulos)
+
+def tab_is_open(aba):
+    """Se a aba deve ser renderizada (.open é None quando a seleção não é rastreada)."""
+    return getattr(aba, 'open', None) is not False
+
+def keep_tab_controls(padroes=CONTROLES_ABAS):
+    """Reatribui os valores dos controles das abas para o Streamlit não descartá-los."""
+    for chave, padrao in padroes.items():
+        st.session_state[chave] = st.session_state.get(chave, padrao)
 
 # --- Interface Principal ---
 st.title("🎯 Otimizador de Carteira de Dividendos - B3 Completa")
@@ -445,439 +426,654 @@ if categoria_etf:
 if not categorias_ativas:
     st.sidebar.warning("⚠️ Selecione pelo menos um segmento!")
 
-# Criar abas principais
-tab1, tab2, tab3 = st.tabs(["📊 Ranking de Ativos", "💼 Otimizador de Portfólio", "📈 Simulação Histórica"])
+# Paralelismo da análise
+st.sidebar.markdown("---")
+st.sidebar.header("⚡ Desempenho")
+max_workers = st.sidebar.slider(
+    "Downloads simultâneos", 1, MAX_WORKERS_LIMIT, DEFAULT_MAX_WORKERS, 1,
+    help="Quantidade de ativos baixados/analisados em paralelo"
+)
+usar_cliente_async = st.sidebar.checkbox(
+    "Cliente assíncrono com limite de taxa", value=False,
+    help="Baixa cotações por um pool de conexões compartilhado, com limite global de requisições "
+         "e backoff exponencial (evita bloqueio do Yahoo em análises grandes)"
+)
+incluir_quarentena = st.sidebar.checkbox(
+    "Reconsultar tickers em quarentena", value=False,
+    help="Tickers sem cotação em análises seguidas ficam fora até a data de reavaliação "
+         "(que dobra a cada nova falha); marque para consultá-los mesmo assim"
+)
+contagem_negativos = get_negative_cache().counts()
+reconsultar_negativos = st.sidebar.checkbox(
+    "Reconsultar ativos sem dados", value=False,
+    help="Ativos sem dividendos (7 dias), sem preço (1 dia) ou com erro de busca (1 hora) são pulados "
+         "até o prazo vencer; marque para consultá-los mesmo assim. "
+         + (", ".join(f"{n} {motivo}" for motivo, n in contagem_negativos.items()) or "Nenhum no momento.")
+)
+stats_cache = cache_stats()
+st.sidebar.caption(
+    f"Cache: {stats_cache['hits_memoria']} acertos em memória, "
+    f"{stats_cache['hits_compartilhado']} compartilhados, {stats_cache['misses']} faltas "
+    f"({stats_cache['bytes_memoria'] / 1024**2:.1f} MB em memória, "
+    f"{stats_cache['bytes_memoria'] / max(stats_cache['itens_memoria'], 1) / 1024:.1f} KB por item)"
+)
+
+# Carregar o ranking pré-calculado (snapshot_ranking.py) na primeira execução da sessão
+if 'df_ranking' not in st.session_state:
+    snapshot = load_latest_snapshot()
+    if snapshot is not None:
+        st.session_state['df_ranking'] = snapshot['ranking']
+        st.session_state['ranking_gerado_em'] = snapshot['gerado_em']
+
+# Criar abas principais (gráficos e tabelas só da aba selecionada)
+keep_tab_controls()
+tab1, tab2, tab3 = lazy_tabs(["📊 Ranking de Ativos", "💼 Otimizador de Portfólio", "📈 Simulação Histórica"],
+                             key="aba_principal")
 
 # ===== TAB 1: RANKING DE ATIVOS =====
 with tab1:
-    st.header("📊 Ranking dos Melhores Ativos para Dividendos")
-    
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        categorias_str = ", ".join(categorias_ativas) if categorias_ativas else "Nenhum"
-        st.info(f"🔍 Segmentos selecionados: **{categorias_str}**")
-    with col2:
-        if st.button("🔄 Limpar Cache", type="secondary"):
-            st.cache_data.clear()
-            st.success("Cache limpo!")
-    
-    if categorias_ativas:
-        if st.button("🚀 Analisar Ativos Selecionados", type="primary"):
-            with st.spinner("Analisando ativos..."):
-                # Buscar todos os tickers
-                all_tickers = get_all_b3_tickers()
-                
-                # Filtrar por categoria
-                filtered_tickers = []
-                for ticker in all_tickers:
-                    categoria = categorize_ticker(ticker)
-                    if categoria in categorias_ativas:
-                        filtered_tickers.append(ticker)
-                
-                st.info(f"✅ Encontrados {len(filtered_tickers)} ativos para análise")
-                
-                # Analisar com feedback detalhado
-                progress_bar = st.progress(0)
-                status_container = st.empty()
-                
-                with st.spinner("🔄 Baixando dados do Yahoo Finance..."):
-                    df_ranking = analyze_selected_stocks(filtered_tickers, progress_bar, status_container)
-                
-                progress_bar.empty()
-                status_container.empty()
-                
-                if not df_ranking.empty:
-                    st.session_state['df_ranking'] = df_ranking
-                    st.success(f"✅ Análise concluída! {len(df_ranking)} ativos com dados de dividendos.")
-                else:
-                    st.error("❌ Nenhum ativo com dados de dividendos encontrado. Possíveis causas:")
-                    st.warning("""
-                    **Soluções possíveis:**
-                    1. Verifique sua conexão com a internet
-                    2. O Yahoo Finance pode estar temporariamente indisponível
-                    3. Tente novamente em alguns minutos
-                    4. Limpe o cache do app (barra lateral → Settings → Clear cache)
-                    """)
-    
-    if 'df_ranking' in st.session_state:
-        df_ranking = st.session_state['df_ranking']
-        
-        # Mostrar estatísticas gerais
-        col1, col2, col3, col4, col5 = st.columns(5)
-        col1.metric("Total de Ativos", len(df_ranking))
-        col2.metric("DY Médio (12M)", f"{df_ranking['dy_12m'].mean():.2f}%")
-        col3.metric("Consistência Média", f"{df_ranking['consistencia'].mean():.1f}%")
-        col4.metric("CAGR Médio", f"{df_ranking['cagr_dividendos'].mean():.2f}%")
-        
-        # Contar por categoria
-        categorias_count = df_ranking['categoria'].value_counts().to_dict()
-        col5.metric("Categorias", len(categorias_count))
-        
-        # Filtros adicionais
-        st.subheader("🔍 Filtros Adicionais")
-        col1, col2, col3, col4, col5 = st.columns(5)
+    if tab_is_open(tab1):
+        st.header("📊 Ranking dos Melhores Ativos para Dividendos")
         
+        col1, col2 = st.columns([3, 1])
         with col1:
-            categorias_disponiveis = ['Todos'] + sorted(df_ranking['categoria'].unique().tolist())
-            categoria_filtro = st.selectbox("Categoria", categorias_disponiveis)
-        
+            categorias_str = ", ".join(categorias_ativas) if categorias_ativas else "Nenhum"
+            st.info(f"🔍 Segmentos selecionados: **{categorias_str}**")
         with col2:
-            setores_disponiveis = ['Todos'] + sorted(df_ranking['setor'].unique().tolist())
-            setor_filtro = st.selectbox("Setor", setores_disponiveis)
-        
-        with col3:
-            dy_minimo = st.slider("DY Mínimo (12M)", 0.0, 15.0, 0.0, 0.5)
-        
-        with col4:
-            dy_maximo = st.slider("DY Máximo (12M)", 0.0, 50.0, 40.0, 1.0, 
-                                 help="Filtra outliers com DY muito alto")
+            if st.button("🔄 Limpar Cache", type="secondary"):
+                clear_local_cache()
+                # Erros de busca são reconsultados; sem dividendos/preço seguem pulados até o TTL vencer
+                get_negative_cache().clear([MOTIVO_ERRO])
+                mantidos = sum(get_negative_cache().counts().values())
+                st.success(f"Cache limpo! {mantidos} ativos sem dividendos/preço seguem no cache negativo."
+                           if mantidos else "Cache limpo!")
         
-        with col5:
-            consistencia_minima = st.slider("Consistência Mínima (%)", 0, 100, 0, 10)
-        
-        # Aplicar filtros
-        df_filtrado = df_ranking.copy()
-        if categoria_filtro != 'Todos':
-            df_filtrado = df_filtrado[df_filtrado['categoria'] == categoria_filtro]
-        if setor_filtro != 'Todos':
-            df_filtrado = df_filtrado[df_filtrado['setor'] == setor_filtro]
-        df_filtrado = df_filtrado[df_filtrado['dy_12m'] >= dy_minimo]
-        df_filtrado = df_filtrado[df_filtrado['dy_12m'] <= dy_maximo]  # NOVO: Filtro máximo
-        df_filtrado = df_filtrado[df_filtrado['consistencia'] >= consistencia_minima]
-        df_filtrado = df_filtrado.sort_values('score', ascending=False)
-        
-        # Exibir ranking
-        st.subheader(f"🏆 Top Ativos ({len(df_filtrado)} resultados)")
-        
-        # Preparar DataFrame para exibição
-        df_display = df_filtrado[['ticker', 'nome', 'categoria', 'setor', 'preco', 'dy_12m', 'dy_medio', 
-                                   'consistencia', 'cagr_dividendos', 'anos_com_div', 'score']].copy()
-        df_display.columns = ['Ticker', 'Nome', 'Categoria', 'Setor', 'Preço (R$)', 'DY 12M (%)', 
-                              'DY Médio (%)', 'Consistência (%)', 'CAGR Div (%)', 
-                              'Anos c/ Div', 'Score']
-        
-        st.dataframe(
-            df_display.style.background_gradient(subset=['Score'], cmap='RdYlGn')
-                           .format({'Preço (R$)': 'R$ {:.2f}', 
-                                   'DY 12M (%)': '{:.2f}%',
-                                   'DY Médio (%)': '{:.2f}%',
-                                   'Consistência (%)': '{:.1f}%',
-                                   'CAGR Div (%)': '{:.2f}%',
-                                   'Score': '{:.2f}'}),
-            width="stretch",
-            height=400
-        )
-        
-        # Gráficos
-        st.subheader("📊 Visualizações")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            fig_dy = px.bar(df_filtrado.head(15), x='ticker', y='dy_12m',
-                           title='Top 15 - Dividend Yield (12M)',
-                           labels={'dy_12m': 'DY (%)', 'ticker': 'Ativo'},
-                           color='categoria', 
-                           color_discrete_map={'Ação': '#1f77b4', 'FII': '#ff7f0e', 
-                                              'BDR': '#2ca02c', 'ETF': '#d62728'})
-            st.plotly_chart(fig_dy, width="stretch")
-        
-        with col2:
-            fig_cat = px.pie(df_filtrado, names='categoria', title='Distribuição por Categoria',
-                            color_discrete_map={'Ação': '#1f77b4', 'FII': '#ff7f0e', 
-                                              'BDR': '#2ca02c', 'ETF': '#d62728'})
-            st.plotly_chart(fig_cat, width="stretch")
-        
-        # Análise por categoria
-        st.subheader("📦 Análise por Categoria")
-        df_categoria = df_filtrado.groupby('categoria').agg({
-            'dy_12m': 'mean',
-            'consistencia': 'mean',
-            'score': 'mean',
-            'ticker': 'count'
-        }).round(2)
-        df_categoria.columns = ['DY Médio (%)', 'Consistência Média (%)', 'Score Médio', 'Qtd. Ativos']
-        df_categoria = df_categoria.sort_values('Score Médio', ascending=False)
-        
-        st.dataframe(df_categoria, width="stretch")
-
-# ===== TAB 2: OTIMIZADOR DE PORTFÓLIO =====
-with tab2:
-    st.header("💼 Otimizador de Portfólio")
-    
-    if 'df_ranking' not in st.session_state:
-        st.warning("⚠️ Por favor, gere o ranking de ativos primeiro na aba 'Ranking de Ativos'")
-    else:
-        df_ranking = st.session_state['df_ranking']
-        
-        # Inputs do usuário
-        st.subheader("💰 Configurações do Portfólio")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            capital_total = st.number_input(
-                "Capital Total para Investimento (R$)",
-                min_value=1000.0,
-                max_value=10000000.0,
-                value=50000.0,
-                step=1000.0,
-                format="%.2f"
-            )
-        
-        with col2:
-            lote_minimo = st.number_input(
-                "Lote Mínimo de Ações",
-                min_value=1,
-                max_value=1000,
-                value=100,
-                step=1,
-                help="FIIs, BDRs e ETFs usam lote 1"
-            )
-        
-        with col3:
-            dy_minimo_port = st.slider(
-                "DY Mínimo para Seleção (%)",
-                0.0, 15.0, 4.0, 0.5
-            )
-        
-        # Botão para otimizar
-        if st.button("🚀 Otimizar Portfólio", type="primary", key="btn_otimizar"):
-            with st.spinner("Otimizando portfólio..."):
-                # Filtrar ações com DY mínimo
-                df_elegivel = df_ranking[df_ranking['dy_12m'] >= dy_minimo_port].copy()
-                
-                st.info(f"🔍 Debug: {len(df_ranking)} ativos no ranking, {len(df_elegivel)} com DY >= {dy_minimo_port}%")
-                
-                if df_elegivel.empty:
-                    st.error("Nenhum ativo encontrado com o DY mínimo especificado. Tente reduzir o valor.")
-                else:
-                    st.info(f"💰 Otimizando com capital de R$ {capital_total:,.2f} e lote mínimo de {lote_minimo}")
+        if categorias_ativas:
+            if st.button("🚀 Analisar Ativos Selecionados", type="primary"):
+                with st.spinner("Analisando ativos..."):
+                    # Tickers do universo nas categorias selecionadas, sem os que estão em quarentena
+                    filtered_tickers, relatorio_universo = get_universe_health().effective_universe(
+                        tickers_by_category(categorias_ativas), incluir_quarentena
+                    )
+                    # Sem dividendos/preço em análises recentes: pulados antes do download
+                    negativos = {} if reconsultar_negativos else get_negative_cache().lookup(filtered_tickers)
+                    filtered_tickers = [t for t in filtered_tickers if t not in negativos]
+                    
+                    st.info(f"✅ Encontrados {len(filtered_tickers)} ativos para análise "
+                            f"({describe_universe_report(relatorio_universo)}"
+                            f"{f'; {len(negativos)} pulados pelo cache negativo' if negativos else ''})")
                     
-                    # Otimizar
-                    portfolio = optimize_portfolio(df_elegivel, capital_total, lote_minimo)
+                    # Analisar com feedback detalhado
+                    progress_bar = st.progress(0)
+                    status_container = st.empty()
+                    preview_container = st.empty()
                     
-                    if portfolio is not None and not portfolio.empty:
-                        st.session_state['portfolio_otimizado'] = portfolio
-                        st.session_state['otimizacao_completa'] = True
-                        st.success(f"✅ Portfólio otimizado com sucesso! {len(portfolio)} ativos selecionados.")
-                        st.rerun()
+                    def on_partial(df_parcial, concluidos, total):
+                        # Guardar o parcial: se a execução for interrompida, o ranking já fica utilizável
+                        st.session_state['df_ranking'] = df_parcial
+                        st.session_state['ranking_parcial'] = (concluidos, total)
+                        st.session_state.pop('ranking_gerado_em', None)
+                        render_ranking_preview(preview_container, df_parcial, concluidos, total)
+                    
+                    df_ranking = analyze_selected_stocks(filtered_tickers, progress_bar, status_container,
+                                                         max_workers, usar_cliente_async, on_partial)
+                    
+                    progress_bar.empty()
+                    status_container.empty()
+                    preview_container.empty()
+                    st.session_state.pop('ranking_parcial', None)
+                    
+                    if not df_ranking.empty:
+                        st.session_state['df_ranking'] = df_ranking
+                        st.session_state.pop('ranking_gerado_em', None)
+                        st.success(f"✅ Análise concluída! {len(df_ranking)} ativos com dados de dividendos.")
                     else:
-                        st.error("❌ Não foi possível criar um portfólio com os parâmetros especificados.")
-                        st.warning("💡 Dicas: Tente aumentar o capital ou reduzir o lote mínimo.")
+                        st.error("❌ Nenhum ativo com dados de dividendos encontrado. Possíveis causas:")
+                        st.warning("""
+                        **Soluções possíveis:**
+                        1. Verifique sua conexão com a internet
+                        2. O Yahoo Finance pode estar temporariamente indisponível
+                        3. Tente novamente em alguns minutos
+                        4. Limpe o cache do app (barra lateral → Settings → Clear cache)
+                        """)
         
-        # Exibir portfólio otimizado
-        if 'portfolio_otimizado' in st.session_state:
-            portfolio = st.session_state['portfolio_otimizado']
+        if 'df_ranking' in st.session_state:
+            df_ranking = st.session_state['df_ranking']
+            
+            if 'ranking_gerado_em' in st.session_state:
+                st.caption(f"📦 Ranking pré-calculado em {st.session_state['ranking_gerado_em']:%d/%m/%Y %H:%M}. "
+                           "Clique em **Analisar Ativos Selecionados** para atualizar.")
             
-            st.subheader("📋 Portfólio Otimizado")
+            if 'ranking_parcial' in st.session_state:
+                concluidos, total = st.session_state['ranking_parcial']
+                st.warning(f"⏸️ Ranking parcial: a análise foi interrompida após {concluidos}/{total} ativos. "
+                           "Clique em **Analisar Ativos Selecionados** para completar.")
             
-            # Métricas gerais
-            total_investido = portfolio['valor_investido'].sum()
-            dy_medio_carteira = (portfolio['dividendos_anuais_estimados'].sum() / total_investido) * 100 if total_investido > 0 else 0
-            dividendos_anuais = portfolio['dividendos_anuais_estimados'].sum()
-            dividendos_mensais = dividendos_anuais / 12
+            # Só preços mudaram: DY e score saem dos agregados de dividendos, sem baixar histórico
+            if st.button("⚡ Atualizar Preços", help="Atualiza preço, DY e score do ranking atual sem "
+                                                       "rebaixar o histórico de dividendos"):
+                with st.spinner("Atualizando cotações..."):
+                    download_fn = get_market_client().download if usar_cliente_async else None
+                    df_ranking, n_precos = refresh_ranking_prices(df_ranking, store=get_market_store(),
+                                                                  download_fn=download_fn)
+                st.session_state['df_ranking'] = df_ranking
+                st.success(f"✅ {n_precos} de {len(df_ranking)} preços atualizados.")
             
-            col1, col2, col3, col4 = st.columns(4)
-            col1.metric("💰 Total Investido", f"R$ {total_investido:,.2f}")
-            col2.metric("📊 DY Médio da Carteira", f"{dy_medio_carteira:.2f}%")
-            col3.metric("📅 Dividendos/Ano", f"R$ {dividendos_anuais:,.2f}")
-            col4.metric("📆 Dividendos/Mês (Estimado)", f"R$ {dividendos_mensais:,.2f}")
+            # Mostrar estatísticas gerais
+            render_summary_metrics(df_ranking)
             
-            # Tabela de alocação
-            st.subheader("🎯 Alocação Detalhada")
+            # Filtros adicionais
+            st.subheader("🔍 Filtros Adicionais")
+            col1, col2, col3, col4, col5 = st.columns(5)
             
-            df_port_display = portfolio[['ticker', 'nome', 'categoria', 'setor', 'preco', 'quantidade', 
-                                         'valor_investido', 'percentual_carteira', 'dy_12m',
-                                         'dividendos_anuais_estimados']].copy()
-            df_port_display.columns = ['Ticker', 'Nome', 'Categoria', 'Setor', 'Preço (R$)', 'Quantidade',
-                                       'Valor Investido (R$)', '% Carteira', 'DY 12M (%)',
-                                       'Dividendos/Ano (R$)']
+            # Índices ordenados por dimensão de filtro, montados uma vez por ranking
+            indice = st.session_state.get('indice_ranking')
+            if indice is None or not indice.matches(df_ranking):
+                indice = RankingIndex(df_ranking)
+                st.session_state['indice_ranking'] = indice
+            
+            with col1:
+                categorias_disponiveis = ['Todos'] + indice.values('categoria')
+                if st.session_state['filtro_categoria'] not in categorias_disponiveis:
+                    st.session_state['filtro_categoria'] = 'Todos'
+                categoria_filtro = st.selectbox("Categoria", categorias_disponiveis, key="filtro_categoria")
+            
+            with col2:
+                setores_disponiveis = ['Todos'] + indice.values('setor')
+                if st.session_state['filtro_setor'] not in setores_disponiveis:
+                    st.session_state['filtro_setor'] = 'Todos'
+                setor_filtro = st.selectbox("Setor", setores_disponiveis, key="filtro_setor")
             
+            with col3:
+                dy_minimo = st.slider("DY Mínimo (12M)", 0.0, 15.0, step=0.5, key="filtro_dy_minimo")
+            
+            with col4:
+                dy_maximo = st.slider("DY Máximo (12M)", 0.0, 50.0, step=1.0, key="filtro_dy_maximo",
+                                     help="Filtra outliers com DY muito alto")
+            
+            with col5:
+                consistencia_minima = st.slider("Consistência Mínima (%)", 0, 100, step=10, key="filtro_consistencia")
+            
+            # Aplicar filtros: posições das linhas, já ordenadas por score
+            posicoes = indice.filter(categoria_filtro, setor_filtro, dy_minimo, dy_maximo, consistencia_minima)
+            
+            # Exibir ranking
+            st.subheader(f"🏆 Top Ativos ({len(posicoes)} resultados)")
+            
+            col_tamanho, col_pagina, _ = st.columns([1, 1, 3])
+            with col_tamanho:
+                tamanho_pagina = st.selectbox("Linhas por página", [25, 50, 100, 250], key="linhas_pagina")
+            with col_pagina:
+                pagina = st.number_input("Página", min_value=1, max_value=page_count(len(posicoes), tamanho_pagina),
+                                         value=1, step=1)
+            
+            # Preparar DataFrame para exibição (apenas a página visível é materializada e estilizada)
+            df_display = without_history(df_ranking.iloc[page_positions(posicoes, pagina, tamanho_pagina)][
+                ['ticker', 'nome', 'categoria', 'setor', 'preco', 'dy_12m', 'dy_medio', 
+                 'consistencia', 'cagr_dividendos', 'anos_com_div', 'score']])
+            df_display.columns = ['Ticker', 'Nome', 'Categoria', 'Setor', 'Preço (R$)', 'DY 12M (%)', 
+                                  'DY Médio (%)', 'Consistência (%)', 'CAGR Div (%)', 
+                                  'Anos c/ Div', 'Score']
+            
+            # Escala de cor do score comum a todas as páginas do resultado filtrado
+            scores = df_ranking['score'].to_numpy()[posicoes]
             st.dataframe(
-                df_port_display.style.format({
-                    'Preço (R$)': 'R$ {:.2f}',
-                    'Valor Investido (R$)': 'R$ {:.2f}',
-                    '% Carteira': '{:.1f}%',
-                    'DY 12M (%)': '{:.2f}%',
-                    'Dividendos/Ano (R$)': 'R$ {:.2f}'
-                }).background_gradient(subset=['% Carteira'], cmap='Blues'),
-                width="stretch"
+                df_display.style.background_gradient(subset=['Score'], cmap='RdYlGn',
+                                                     vmin=scores.min() if len(scores) else None,
+                                                     vmax=scores.max() if len(scores) else None)
+                               .format({'Preço (R$)': 'R$ {:.2f}', 
+                                       'DY 12M (%)': '{:.2f}%',
+                                       'DY Médio (%)': '{:.2f}%',
+                                       'Consistência (%)': '{:.1f}%',
+                                       'CAGR Div (%)': '{:.2f}%',
+                                       'Score': '{:.2f}'}),
+                width="stretch",
+                height=400
             )
             
             # Gráficos
+            st.subheader("📊 Visualizações")
+            
+            # Figuras em cache pelos dados filtrados (paginação e demais reruns as reaproveitam)
+            fig_dy, fig_cat = build_ranking_charts(
+                without_history(df_ranking.iloc[posicoes[:15]][['ticker', 'dy_12m', 'categoria']]),
+                indice.count_by('categoria', posicoes)
+            )
+            
             col1, col2 = st.columns(2)
             
             with col1:
-                fig_pizza = px.pie(df_port_display, values='Valor Investido (R$)', names='Ticker',
-                                   title='Distribuição do Capital por Ativo')
-                st.plotly_chart(fig_pizza, width="stretch")
+                st.plotly_chart(fig_dy, width="stretch")
             
             with col2:
-                fig_cat_port = px.pie(df_port_display, values='Valor Investido (R$)', names='Categoria',
-                                      title='Distribuição do Capital por Categoria',
-                                      color='Categoria',
-                                      color_discrete_map={'Ação': '#1f77b4', 'FII': '#ff7f0e', 
-                                                         'BDR': '#2ca02c', 'ETF': '#d62728'})
-                st.plotly_chart(fig_cat_port, width="stretch")
-            
-            # Calendário de dividendos
-            st.subheader("📅 Calendário Estimado de Dividendos")
-            st.info("Baseado no padrão de pagamentos dos últimos 24 meses")
-            
-            calendario = create_dividend_calendar(portfolio)
-            if calendario is not None and not calendario.empty:
-                # Gráfico mensal
-                fig_calendario = px.bar(calendario, x='mes', y='valor_estimado',
-                                       title='Fluxo Mensal Estimado de Dividendos',
-                                       labels={'valor_estimado': 'Valor (R$)', 'mes': 'Mês'},
-                                       text='valor_estimado')
-                fig_calendario.update_traces(texttemplate='R$ %{text:.0f}', textposition='outside')
-                st.plotly_chart(fig_calendario, width="stretch")
-                
-                # Tabela detalhada
-                with st.expander("📊 Detalhes Mensais"):
-                    df_cal_display = calendario[['mes', 'valor_estimado', 'acoes_pagantes']].copy()
-                    df_cal_display.columns = ['Mês', 'Valor Estimado (R$)', 'Ativos Pagantes']
-                    st.dataframe(
-                        df_cal_display.style.format({'Valor Estimado (R$)': 'R$ {:.2f}'}),
-                        width="stretch"
-                    )
-            else:
-                st.warning("Não foi possível gerar o calendário de dividendos")
-            
-            # Botão para baixar portfólio
-            st.subheader("💾 Exportar Portfólio")
-            csv = df_port_display.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Baixar Portfólio (CSV)",
-                data=csv,
-                file_name=f"portfolio_dividendos_{datetime.today().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
+                st.plotly_chart(fig_cat, width="stretch")
+            
+            # Análise por categoria
+            st.subheader("📦 Análise por Categoria")
+            df_categoria = df_ranking.iloc[posicoes].groupby('categoria').agg({
+                'dy_12m': 'mean',
+                'consistencia': 'mean',
+                'score': 'mean',
+                'ticker': 'count'
+            }).round(2)
+            df_categoria.columns = ['DY Médio (%)', 'Consistência Média (%)', 'Score Médio', 'Qtd. Ativos']
+            df_categoria = df_categoria.sort_values('Score Médio', ascending=False)
+            
+            st.dataframe(df_categoria, width="stretch")
 
-# ===== TAB 3: SIMULAÇÃO HISTÓRICA =====
-with tab3:
-    st.header("📈 Simulação Histórica do Portfólio")
-    
-    if 'portfolio_otimizado' not in st.session_state:
-        st.warning("⚠️ Por favor, otimize um portfólio primeiro na aba 'Otimizador de Portfólio'")
-    else:
-        portfolio = st.session_state['portfolio_otimizado']
-        
-        st.info("Simulação do desempenho do portfólio nos últimos anos com os dividendos realmente pagos")
-        
-        anos_simulacao = st.slider("Anos de Histórico", 1, 5, 5)
-        
-        if st.button("📊 Simular Histórico", type="primary"):
-            with st.spinner("Simulando histórico..."):
-                df_monthly, df_annual = simulate_portfolio_history(portfolio, anos_simulacao)
-                
-                if df_monthly is not None and not df_monthly.empty:
-                    st.session_state['simulacao_monthly'] = df_monthly
-                    st.session_state['simulacao_annual'] = df_annual
-                    st.success("✅ Simulação concluída!")
-                else:
-                    st.error("Não foi possível simular o histórico")
+# ===== TAB 2: OTIMIZADOR DE PORTFÓLIO =====
+with tab2:
+    if tab_is_open(tab2):
+        st.header("💼 Otimizador de Portfólio")
         
-        if 'simulacao_monthly' in st.session_state:
-            df_monthly = st.session_state['simulacao_monthly']
-            df_annual = st.session_state['simulacao_annual']
+        if 'df_ranking' not in st.session_state:
+            st.warning("⚠️ Por favor, gere o ranking de ativos primeiro na aba 'Ranking de Ativos'")
+        else:
+            df_ranking = st.session_state['df_ranking']
             
-            # Métricas gerais
-            total_dividendos = df_annual['dividendos'].sum()
-            media_anual = df_annual['dividendos'].mean()
-            media_mensal = df_monthly['dividendos'].mean()
+            # Inputs do usuário
+            st.subheader("💰 Configurações do Portfólio")
             
             col1, col2, col3 = st.columns(3)
-            col1.metric("💰 Total de Dividendos Recebidos", f"R$ {total_dividendos:,.2f}")
-            col2.metric("📅 Média Anual", f"R$ {media_anual:,.2f}")
-            col3.metric("📆 Média Mensal", f"R$ {media_mensal:,.2f}")
-            
-            # Gráfico anual
-            st.subheader("📊 Dividendos Anuais Históricos")
-            fig_annual = px.bar(df_annual, x='ano', y='dividendos',
-                               title='Dividendos Recebidos por Ano',
-                               labels={'dividendos': 'Dividendos (R$)', 'ano': 'Ano'},
-                               text='dividendos')
-            fig_annual.update_traces(texttemplate='R$ %{text:,.0f}', textposition='outside')
-            st.plotly_chart(fig_annual, width="stretch")
-            
-            # Gráfico mensal
-            st.subheader("📈 Evolução Mensal dos Dividendos")
-            fig_monthly = go.Figure()
-            fig_monthly.add_trace(go.Scatter(x=df_monthly['mes'], y=df_monthly['dividendos'],
-                                           mode='lines+markers', name='Dividendos'))
-            fig_monthly.add_hline(y=media_mensal, line_dash="dash", line_color="red",
-                                 annotation_text=f"Média: R$ {media_mensal:.2f}")
-            fig_monthly.update_layout(title='Dividendos Mensais Históricos',
-                                     xaxis_title='Mês', yaxis_title='Dividendos (R$)')
-            st.plotly_chart(fig_monthly, width="stretch")
-            
-            # Análise estatística
-            st.subheader("📊 Análise Estatística")
-            
-            col1, col2 = st.columns(2)
             
             with col1:
-                st.write("**Dividendos Anuais:**")
-                if not df_annual.empty:
-                    stats_annual = df_annual['dividendos'].describe()
-                    st.dataframe(
-                        pd.DataFrame({
-                            'Estatística': ['Média', 'Mediana', 'Desvio Padrão', 'Mínimo', 'Máximo'],
-                            'Valor (R$)': [
-                                stats_annual['mean'],
-                                df_annual['dividendos'].median(),
-                                stats_annual['std'],
-                                stats_annual['min'],
-                                stats_annual['max']
-                            ]
-                        }).style.format({'Valor (R$)': 'R$ {:.2f}'}),
-                        width="stretch"
-                    )
+                capital_total = st.number_input(
+                    "Capital Total para Investimento (R$)",
+                    min_value=1000.0,
+                    max_value=10000000.0,
+                    step=1000.0,
+                    format="%.2f",
+                    key="capital_total"
+                )
             
             with col2:
-                st.write("**Dividendos Mensais:**")
-                if not df_monthly.empty:
-                    stats_monthly = df_monthly['dividendos'].describe()
-                    st.dataframe(
-                        pd.DataFrame({
-                            'Estatística': ['Média', 'Mediana', 'Desvio Padrão', 'Mínimo', 'Máximo'],
-                            'Valor (R$)': [
-                                stats_monthly['mean'],
-                                df_monthly['dividendos'].median(),
-                                stats_monthly['std'],
-                                stats_monthly['min'],
-                                stats_monthly['max']
-                            ]
-                        }).style.format({'Valor (R$)': 'R$ {:.2f}'}),
-                        width="stretch"
-                    )
+                lote_minimo = st.number_input(
+                    "Lote Mínimo de Ações",
+                    min_value=1,
+                    max_value=1000,
+                    step=1,
+                    help="FIIs, BDRs e ETFs usam lote 1",
+                    key="lote_minimo"
+                )
+            
+            with col3:
+                dy_minimo_port = st.slider(
+                    "DY Mínimo para Seleção (%)",
+                    0.0, 15.0, step=0.5, key="dy_minimo_port"
+                )
+            
+            metodos_alocacao = {
+                "Maximizar renda (com limites)": "renda",
+                "Proporcional ao score (top 10)": "proporcional"
+            }
+            metodo_alocacao = st.radio("Método de Alocação", list(metodos_alocacao.keys()), horizontal=True,
+                                       key="metodo_alocacao")
+            modo_alocacao = metodos_alocacao[metodo_alocacao]
+            
+            max_peso_ativo, max_peso_setor = DEFAULT_MAX_PESO_ATIVO, DEFAULT_MAX_PESO_SETOR
+            if modo_alocacao == 'renda':
+                col1, col2 = st.columns(2)
+                with col1:
+                    max_peso_ativo = st.slider(
+                        "Máximo por Ativo (%)", 5, 100, step=5, key="max_peso_ativo",
+                        help="Limite do capital total em um único ativo"
+                    ) / 100
+                with col2:
+                    max_peso_setor = st.slider(
+                        "Máximo por Setor (%)", 10, 100, step=5, key="max_peso_setor",
+                        help="Limite do capital total em um mesmo setor"
+                    ) / 100
+            
+            # Botão para otimizar
+            if st.button("🚀 Otimizar Portfólio", type="primary", key="btn_otimizar"):
+                with st.spinner("Otimizando portfólio..."):
+                    # Filtrar ações com DY mínimo
+                    df_elegivel = df_ranking[df_ranking['dy_12m'] >= dy_minimo_port].copy()
+                    
+                    st.info(f"🔍 Debug: {len(df_ranking)} ativos no ranking, {len(df_elegivel)} com DY >= {dy_minimo_port}%")
+                    
+                    if df_elegivel.empty:
+                        st.error("Nenhum ativo encontrado com o DY mínimo especificado. Tente reduzir o valor.")
+                    else:
+                        st.info(f"💰 Otimizando com capital de R$ {capital_total:,.2f} e lote mínimo de {lote_minimo}")
+                        
+                        # Otimizar
+                        portfolio = optimize_portfolio(df_elegivel, capital_total, lote_minimo, modo_alocacao,
+                                                       max_peso_ativo, max_peso_setor)
+                        
+                        if portfolio is not None and not portfolio.empty:
+                            st.session_state['portfolio_otimizado'] = portfolio
+                            st.session_state['otimizacao_completa'] = True
+                            st.session_state.pop('projecao_renda', None)
+                            st.session_state.pop('backtest_carteira', None)
+                            st.success(f"✅ Portfólio otimizado com sucesso! {len(portfolio)} ativos selecionados.")
+                            st.rerun()
+                        else:
+                            st.error("❌ Não foi possível criar um portfólio com os parâmetros especificados.")
+                            st.warning("💡 Dicas: Tente aumentar o capital ou reduzir o lote mínimo.")
+            
+            # Exibir portfólio otimizado
+            if 'portfolio_otimizado' in st.session_state:
+                portfolio = st.session_state['portfolio_otimizado']
+                
+                st.subheader("📋 Portfólio Otimizado")
+                
+                # Métricas gerais
+                total_investido = portfolio['valor_investido'].sum()
+                dy_medio_carteira = (portfolio['dividendos_anuais_estimados'].sum() / total_investido) * 100 if total_investido > 0 else 0
+                dividendos_anuais = portfolio['dividendos_anuais_estimados'].sum()
+                dividendos_mensais = dividendos_anuais / 12
+                
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("💰 Total Investido", f"R$ {total_investido:,.2f}")
+                col2.metric("📊 DY Médio da Carteira", f"{dy_medio_carteira:.2f}%")
+                col3.metric("📅 Dividendos/Ano", f"R$ {dividendos_anuais:,.2f}")
+                col4.metric("📆 Dividendos/Mês (Estimado)", f"R$ {dividendos_mensais:,.2f}")
+                
+                # Tabela de alocação
+                st.subheader("🎯 Alocação Detalhada")
+                
+                df_port_display = without_history(portfolio[['ticker', 'nome', 'categoria', 'setor', 'preco', 'quantidade', 
+                                             'valor_investido', 'percentual_carteira', 'dy_12m',
+                                             'dividendos_anuais_estimados']])
+                df_port_display.columns = ['Ticker', 'Nome', 'Categoria', 'Setor', 'Preço (R$)', 'Quantidade',
+                                           'Valor Investido (R$)', '% Carteira', 'DY 12M (%)',
+                                           'Dividendos/Ano (R$)']
+                
+                st.dataframe(
+                    df_port_display.style.format({
+                        'Preço (R$)': 'R$ {:.2f}',
+                        'Valor Investido (R$)': 'R$ {:.2f}',
+                        '% Carteira': '{:.1f}%',
+                        'DY 12M (%)': '{:.2f}%',
+                        'Dividendos/Ano (R$)': 'R$ {:.2f}'
+                    }).background_gradient(subset=['% Carteira'], cmap='Blues'),
+                    width="stretch"
+                )
+                
+                # Calendário recalculado só quando o portfólio muda; figuras em cache pelos dados
+                calendario_salvo = st.session_state.get('calendario_portfolio')
+                if calendario_salvo is None or calendario_salvo[0] is not portfolio:
+                    calendario_salvo = (portfolio, create_dividend_calendar(portfolio))
+                    st.session_state['calendario_portfolio'] = calendario_salvo
+                calendario = calendario_salvo[1]
+                fig_pizza, fig_cat_port, fig_calendario = build_portfolio_charts(
+                    df_port_display[['Ticker', 'Categoria', 'Valor Investido (R$)']], calendario
+                )
+                
+                # Gráficos
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.plotly_chart(fig_pizza, width="stretch")
+                
+                with col2:
+                    st.plotly_chart(fig_cat_port, width="stretch")
+                
+                # Calendário de dividendos
+                st.subheader("📅 Calendário Estimado de Dividendos")
+                st.info("Baseado no padrão de pagamentos dos últimos 24 meses")
+                
+                if fig_calendario is not None:
+                    # Gráfico mensal
+                    st.plotly_chart(fig_calendario, width="stretch")
+                    
+                    # Tabela detalhada
+                    with st.expander("📊 Detalhes Mensais"):
+                        df_cal_display = calendario[['mes', 'valor_estimado', 'acoes_pagantes']].copy()
+                        df_cal_display.columns = ['Mês', 'Valor Estimado (R$)', 'Ativos Pagantes']
+                        st.dataframe(
+                            df_cal_display.style.format({'Valor Estimado (R$)': 'R$ {:.2f}'}),
+                            width="stretch"
+                        )
+                else:
+                    st.warning("Não foi possível gerar o calendário de dividendos")
+                
+                # Projeção de renda por Monte Carlo
+                st.subheader("🎲 Projeção de Renda (Monte Carlo)")
+                st.info("Cada ano futuro de cada ativo é sorteado entre os últimos 5 anos de proventos pagos, "
+                        "preservando sazonalidade e anos de corte. As faixas mostram os percentis dos caminhos simulados.")
+                
+                col1, col2, col3 = st.columns([2, 2, 1])
+                with col1:
+                    anos_projecao = st.slider("Horizonte (anos)", 1, MAX_HORIZON_YEARS, key="anos_projecao")
+                with col2:
+                    n_caminhos = st.select_slider("Caminhos simulados", [1000, 2000, 5000, 10000], key="n_caminhos")
+                with col3:
+                    st.write("")
+                    projetar = st.button("🎲 Projetar Renda")
+                
+                if projetar:
+                    with st.spinner(f"Simulando {n_caminhos:,} caminhos..."):
+                        st.session_state['projecao_renda'] = project_income(portfolio, anos_projecao, n_caminhos)
+                
+                projecao = st.session_state.get('projecao_renda')
+                if projecao is not None:
+                    import plotly.graph_objects as go
+                    df_anual_proj = projecao['anual']
+                    
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("📅 Renda no 1º Ano (mediana)", f"R$ {df_anual_proj['p50'].iloc[0]:,.2f}",
+                                f"{(df_anual_proj['p50'].iloc[0] / dividendos_anuais - 1) * 100:+.1f}% vs. DY 12M"
+                                if dividendos_anuais > 0 else None)
+                    col2.metric("🔻 Cenário Pessimista (p5)", f"R$ {df_anual_proj['p5'].iloc[0]:,.2f}")
+                    col3.metric("🔺 Cenário Otimista (p95)", f"R$ {df_anual_proj['p95'].iloc[0]:,.2f}")
+                    
+                    df_mensal_proj = projecao['mensal']
+                    fig_proj = go.Figure()
+                    fig_proj.add_trace(go.Scatter(x=df_mensal_proj['mes'], y=df_mensal_proj['p95'], mode='lines',
+                                                  line=dict(width=0), showlegend=False, hoverinfo='skip'))
+                    fig_proj.add_trace(go.Scatter(x=df_mensal_proj['mes'], y=df_mensal_proj['p5'], mode='lines',
+                                                  line=dict(width=0), fill='tonexty', fillcolor='rgba(31,119,180,0.15)',
+                                                  name='p5–p95'))
+                    fig_proj.add_trace(go.Scatter(x=df_mensal_proj['mes'], y=df_mensal_proj['p75'], mode='lines',
+                                                  line=dict(width=0), showlegend=False, hoverinfo='skip'))
+                    fig_proj.add_trace(go.Scatter(x=df_mensal_proj['mes'], y=df_mensal_proj['p25'], mode='lines',
+                                                  line=dict(width=0), fill='tonexty', fillcolor='rgba(31,119,180,0.35)',
+                                                  name='p25–p75'))
+                    fig_proj.add_trace(go.Scatter(x=df_mensal_proj['mes'], y=df_mensal_proj['p50'], mode='lines',
+                                                  line=dict(color='#1f77b4', width=2), name='Mediana'))
+                    fig_proj.update_layout(title='Renda Mensal Projetada', xaxis_title='Mês', yaxis_title='Valor (R$)')
+                    st.plotly_chart(fig_proj, width="stretch")
+                    
+                    with st.expander("📊 Percentis por Ano"):
+                        df_anual_display = df_anual_proj.copy()
+                        df_anual_display.columns = ['Ano', 'p5 (R$)', 'p25 (R$)', 'Mediana (R$)', 'p75 (R$)',
+                                                    'p95 (R$)', 'Média (R$)']
+                        st.dataframe(
+                            df_anual_display.style.format({c: 'R$ {:,.2f}' for c in df_anual_display.columns[1:]}),
+                            width="stretch", hide_index=True
+                        )
+                
+                # Botão para baixar portfólio
+                st.subheader("💾 Exportar Portfólio")
+                csv = df_port_display.to_csv(index=False).encode('utf-8')
+                st.download_button(
+                    label="📥 Baixar Portfólio (CSV)",
+                    data=csv,
+                    file_name=f"portfolio_dividendos_{datetime.today().strftime('%Y%m%d')}.csv",
+                    mime="text/csv"
+                )
+
+# ===== TAB 3: SIMULAÇÃO HISTÓRICA =====
+with tab3:
+    if tab_is_open(tab3):
+        st.header("📈 Simulação Histórica do Portfólio")
+        
+        if 'portfolio_otimizado' not in st.session_state:
+            st.warning("⚠️ Por favor, otimize um portfólio primeiro na aba 'Otimizador de Portfólio'")
+        else:
+            portfolio = st.session_state['portfolio_otimizado']
             
-            # Análise de rentabilidade
-            st.subheader("💹 Análise de Rentabilidade")
+            st.info("Simulação do desempenho do portfólio nos últimos anos com os dividendos realmente pagos")
             
-            portfolio_total = st.session_state.get('portfolio_otimizado', pd.DataFrame())
-            if not portfolio_total.empty:
-                valor_investido_total = portfolio_total['valor_investido'].sum()
+            anos_simulacao = st.slider("Anos de Histórico", 1, 5, key="anos_simulacao")
+            
+            if st.button("📊 Simular Histórico", type="primary"):
+                with st.spinner("Simulando histórico..."):
+                    df_monthly, df_annual = simulate_portfolio_history(portfolio, anos_simulacao)
+                    
+                    if df_monthly is not None and not df_monthly.empty:
+                        st.session_state['simulacao_monthly'] = df_monthly
+                        st.session_state['simulacao_annual'] = df_annual
+                        st.success("✅ Simulação concluída!")
+                    else:
+                        st.error("Não foi possível simular o histórico")
+            
+            if 'simulacao_monthly' in st.session_state:
+                import plotly.express as px
+                import plotly.graph_objects as go
+                df_monthly = st.session_state['simulacao_monthly']
+                df_annual = st.session_state['simulacao_annual']
+                
+                # Métricas gerais
+                total_dividendos = df_annual['dividendos'].sum()
+                media_anual = df_annual['dividendos'].mean()
+                media_mensal = df_monthly['dividendos'].mean()
                 
                 col1, col2, col3 = st.columns(3)
+                col1.metric("💰 Total de Dividendos Recebidos", f"R$ {total_dividendos:,.2f}")
+                col2.metric("📅 Média Anual", f"R$ {media_anual:,.2f}")
+                col3.metric("📆 Média Mensal", f"R$ {media_mensal:,.2f}")
+                
+                # Gráfico anual
+                st.subheader("📊 Dividendos Anuais Históricos")
+                fig_annual = px.bar(df_annual, x='ano', y='dividendos',
+                                   title='Dividendos Recebidos por Ano',
+                                   labels={'dividendos': 'Dividendos (R$)', 'ano': 'Ano'},
+                                   text='dividendos')
+                fig_annual.update_traces(texttemplate='R$ %{text:,.0f}', textposition='outside')
+                st.plotly_chart(fig_annual, width="stretch")
+                
+                # Gráfico mensal
+                st.subheader("📈 Evolução Mensal dos Dividendos")
+                fig_monthly = go.Figure()
+                fig_monthly.add_trace(go.Scatter(x=df_monthly['mes'], y=df_monthly['dividendos'],
+                                               mode='lines+markers', name='Dividendos'))
+                fig_monthly.add_hline(y=media_mensal, line_dash="dash", line_color="red",
+                                     annotation_text=f"Média: R$ {media_mensal:.2f}")
+                fig_monthly.update_layout(title='Dividendos Mensais Históricos',
+                                         xaxis_title='Mês', yaxis_title='Dividendos (R$)')
+                st.plotly_chart(fig_monthly, width="stretch")
                 
-                roi_total = (total_dividendos / valor_investido_total) * 100 if valor_investido_total > 0 else 0
-                roi_anual = roi_total / anos_simulacao if anos_simulacao > 0 else 0
+                # Análise estatística
+                st.subheader("📊 Análise Estatística")
                 
-                col1.metric("💼 Valor Investido", f"R$ {valor_investido_total:,.2f}")
-                col2.metric("📈 ROI Total (Dividendos)", f"{roi_total:.2f}%")
-                col3.metric("📅 ROI Médio Anual", f"{roi_anual:.2f}%")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write("**Dividendos Anuais:**")
+                    if not df_annual.empty:
+                        stats_annual = df_annual['dividendos'].describe()
+                        st.dataframe(
+                            pd.DataFrame({
+                                'Estatística': ['Média', 'Mediana', 'Desvio Padrão', 'Mínimo', 'Máximo'],
+                                'Valor (R$)': [
+                                    stats_annual['mean'],
+                                    df_annual['dividendos'].median(),
+                                    stats_annual['std'],
+                                    stats_annual['min'],
+                                    stats_annual['max']
+                                ]
+                            }).style.format({'Valor (R$)': 'R$ {:.2f}'}),
+                            width="stretch"
+                        )
+                
+                with col2:
+                    st.write("**Dividendos Mensais:**")
+                    if not df_monthly.empty:
+                        stats_monthly = df_monthly['dividendos'].describe()
+                        st.dataframe(
+                            pd.DataFrame({
+                                'Estatística': ['Média', 'Mediana', 'Desvio Padrão', 'Mínimo', 'Máximo'],
+                                'Valor (R$)': [
+                                    stats_monthly['mean'],
+                                    df_monthly['dividendos'].median(),
+                                    stats_monthly['std'],
+                                    stats_monthly['min'],
+                                    stats_monthly['max']
+                                ]
+                            }).style.format({'Valor (R$)': 'R$ {:.2f}'}),
+                            width="stretch"
+                        )
+                
+                # Análise de rentabilidade
+                st.subheader("💹 Análise de Rentabilidade")
+                
+                portfolio_total = st.session_state.get('portfolio_otimizado', pd.DataFrame())
+                if not portfolio_total.empty:
+                    valor_investido_total = portfolio_total['valor_investido'].sum()
+                    
+                    col1, col2, col3 = st.columns(3)
+                    
+                    roi_total = (total_dividendos / valor_investido_total) * 100 if valor_investido_total > 0 else 0
+                    roi_anual = roi_total / anos_simulacao if anos_simulacao > 0 else 0
+                    
+                    col1.metric("💼 Valor Investido", f"R$ {valor_investido_total:,.2f}")
+                    col2.metric("📈 ROI Total (Dividendos)", f"{roi_total:.2f}%")
+                    col3.metric("📅 ROI Médio Anual", f"{roi_anual:.2f}%")
+                    
+                    st.info(f"""
+                    **Interpretação:** 
+                    - Nos últimos {anos_simulacao} anos, você teria recebido R$ {total_dividendos:,.2f} em dividendos
+                    - Isso representa um retorno de {roi_total:.2f}% sobre o capital investido (apenas dividendos)
+                    - Média anual de {roi_anual:.2f}% em dividendos
+                    - **Importante:** Esta análise considera apenas dividendos; o retorno total, com a variação dos preços, está no backtest abaixo
+                    """)
+            
+            # Backtest de retorno total (preços + dividendos)
+            st.markdown("---")
+            st.subheader("🔁 Backtest de Retorno Total")
+            st.info("Compra do portfólio no início do período com os pesos otimizados, acompanhando os preços diários e os dividendos pagos")
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                anos_backtest = st.slider("Anos de Backtest", 1, 10, key="anos_backtest")
+            with col2:
+                rebalanceamento = st.selectbox("Rebalanceamento", ["Nenhum"] + list(REBALANCE_FREQUENCIES),
+                                               key="rebalanceamento")
+            with col3:
+                reinvestir = st.checkbox("Reinvestir dividendos (DRIP)", key="reinvestir")
+            
+            if st.button("🔁 Executar Backtest"):
+                with st.spinner("Carregando preços e simulando..."):
+                    tickers_carteira = portfolio['ticker'].unique().tolist()
+                    download_fn = get_market_client().download if usar_cliente_async else None
+                    batch = download_batch(tickers_carteira, years=anos_backtest, download_fn=download_fn,
+                                           store=get_market_store())
+                    inicio = pd.Timestamp(datetime.today() - timedelta(days=anos_backtest*365)).normalize()
+                    precos, dividendos = matrices_from_frames(batch, tickers_carteira, start=inicio)
+                    curva = backtest_portfolio(precos, dividendos, portfolio_weights(portfolio),
+                                               portfolio['valor_investido'].sum(), reinvestir,
+                                               None if rebalanceamento == "Nenhum" else rebalanceamento,
+                                               precos_ajustados=True)
+                    if curva.empty:
+                        st.error("Não foi possível obter preços para o backtest")
+                        st.session_state.pop('backtest_carteira', None)
+                    else:
+                        st.session_state['backtest_carteira'] = curva
+            
+            curva = st.session_state.get('backtest_carteira')
+            if curva is not None:
+                import plotly.graph_objects as go
+                resumo = backtest_summary(curva)
+                col1, col2, col3, col4, col5 = st.columns(5)
+                col1.metric("💰 Valor Final", f"R$ {curva['valor'].iloc[-1]:,.2f}")
+                col2.metric("📈 Retorno Total", f"{resumo['retorno_total']:.2f}%")
+                col3.metric("📅 CAGR", f"{resumo['cagr']:.2f}%")
+                col4.metric("📉 Máx. Drawdown", f"{resumo['max_drawdown']:.2f}%")
+                col5.metric("💵 Dividendos", f"R$ {resumo['dividendos_totais']:,.2f}")
                 
-                st.info(f"""
-                **Interpretação:** 
-                - Nos últimos {anos_simulacao} anos, você teria recebido R$ {total_dividendos:,.2f} em dividendos
-                - Isso representa um retorno de {roi_total:.2f}% sobre o capital investido (apenas dividendos)
-                - Média anual de {roi_anual:.2f}% em dividendos
-                - **Importante:** Esta análise considera apenas dividendos, não inclui valorização/desvalorização dos ativos
-                """)
+                fig_backtest = go.Figure()
+                fig_backtest.add_trace(go.Scatter(x=curva.index, y=curva['valor'], mode='lines',
+                                                  name='Patrimônio'))
+                fig_backtest.add_trace(go.Scatter(x=curva.index, y=curva['dividendos_acumulados'], mode='lines',
+                                                  name='Dividendos acumulados', line=dict(dash='dot')))
+                fig_backtest.update_layout(title='Evolução do Patrimônio', xaxis_title='Data',
+                                           yaxis_title='Valor (R$)', hovermode='x unified')
+                st.plotly_chart(fig_backtest, width="stretch")
+                st.caption(f"Volatilidade anualizada: {resumo['volatilidade']:.2f}% · "
+                           "Preços de fechamento ajustados convertidos para preços de mercado; frações de cotas permitidas.")
 
 st.markdown("---")
 st.caption("""
@@ -4,42 +4,36 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import numpy as np
-import traceback # Para debug de erros
+import re
+from armazem_dados import get_market_store, get_prices_incremental
+from cache_compartilhado import shared_cache
+from historico_dividendos import DividendHistoryStore
+from analise_historica import (annual_dividends_from_index, calculate_historical_dy,
+                               calculate_fibonacci_levels, compare_tickers)
+from motor_analise import run_concurrent_analysis, DEFAULT_MAX_WORKERS
 
 # --- Configurações da Página Streamlit ---
 st.set_page_config(layout="wide", page_title="Análise Aprofundada de Ações para Dividendos")
 
 # --- Funções Auxiliares ---
 
-@st.cache_resource(ttl=1800) # Cache de 30 minutos para o objeto Ticker
-def get_stock_object_yf(ticker_symbol):
-    """Retorna o objeto Ticker do yfinance. Cacheado como recurso."""
-    # st.write(f"DEBUG: Criando/Buscando objeto Ticker para: {ticker_symbol}") # Para debug
+@shared_cache(ttl=1800) # Cache para os dados extraídos
+def get_stock_info_yf(ticker_symbol):
+    """Busca informações gerais e métricas de valuation atuais da ação via yfinance (dict serializável)."""
     try:
         stock = yf.Ticker(ticker_symbol)
-        if hasattr(stock, 'info') and stock.info and stock.info.get('regularMarketPrice') is not None:
-            return stock
-        elif hasattr(stock, '_history') and stock._history is not None and len(stock._history) > 0:
-             return stock
-        else:
-            return None
-    except Exception as e:
-        return None
-
-@st.cache_data(ttl=1800) # Cache para os dados extraídos
-def get_stock_info_yf(_stock_obj, ticker_symbol_arg_for_error_msg):
-    """Busca informações gerais e métricas de valuation atuais da ação via yfinance, usando o objeto Ticker."""
-    if _stock_obj is None: return None
-    try:
-        info = _stock_obj.info
+        info = stock.info
+        if not info or info.get('regularMarketPrice') is None:
+            # Ticker sem cotação no .info: aceitar apenas se houver histórico recente
+            if stock.history(period="5d").empty:
+                return None
         if not info:
-             return { "nome_longo": ticker_symbol_arg_for_error_msg, "setor": "N/A", "industria": "N/A", "resumo_negocio": "N/A",
+             return { "nome_longo": ticker_symbol, "setor": "N/A", "industria": "N/A", "resumo_negocio": "N/A",
                      "pl_atual": "N/A", "pvp_atual": "N/A", "payout_ratio": "N/A", "beta": "N/A",
                      "market_cap": 0, "preco_atual": "N/A", "website": "#"}
         
         data = {
-            "nome_longo": info.get('longName', info.get('shortName', ticker_symbol_arg_for_error_msg)),
+            "nome_longo": info.get('longName', info.get('shortName', ticker_symbol)),
             "setor": info.get('sector', 'N/A'),
             "industria": info.get('industry', 'N/A'),
             "resumo_negocio": info.get('longBusinessSummary', 'N/A'),
@@ -52,134 +46,158 @@ def get_stock_info_yf(_stock_obj, ticker_symbol_arg_for_error_msg):
             "website": info.get('website', "#")
         }
         return data
-    except Exception as e:
-        st.error(f"Erro crítico ao buscar informações detalhadas para {ticker_symbol_arg_for_error_msg} via yfinance: {e}")
+    except Exception:
         return None
 
-@st.cache_data(ttl=1800)
-def calculate_dy_last_12_months(_stock_obj, current_price_arg, ticker_symbol_arg_for_error_msg):
-    if _stock_obj is None: return "N/A"
+@shared_cache(ttl=1800)
+def get_dividend_index_yf(ticker_symbol):
+    """Histórico completo de dividendos indexado por data (somas de prefixo, consultas O(log n))."""
+    return DividendHistoryStore.from_series(ticker_symbol, yf.Ticker(ticker_symbol).dividends)
+
+def calculate_dy_last_12_months(ticker_symbol, current_price_arg):
+    try:
+        indice = get_dividend_index_yf(ticker_symbol)
+    except Exception: return "N/A"
     if not isinstance(current_price_arg, (int, float)) or current_price_arg <= 0: return 0.0
 
     try:
-        end_date_dy = datetime.today().date()
-        start_date_dy = end_date_dy - timedelta(days=365)
-        dividends_all = _stock_obj.dividends
-        if dividends_all.empty: return 0.0
-
-        dividends_index_naive = dividends_all.index.tz_localize(None)
-        start_dt_naive = pd.to_datetime(start_date_dy)
-        end_dt_naive = pd.to_datetime(end_date_dy)
-        dividends_l12m = dividends_all[(dividends_index_naive >= start_dt_naive) & (dividends_index_naive <= end_dt_naive)]
-        
-        if dividends_l12m.empty: return 0.0
-        sum_dividends_l12m = dividends_l12m.sum()
+        sum_dividends_l12m = indice.trailing_sums([ticker_symbol], datetime.today(), dias=365)[0]
         if sum_dividends_l12m <= 0: return 0.0
             
         dy_l12m = (sum_dividends_l12m / current_price_arg) * 100
         return round(dy_l12m, 2)
     except Exception: return "N/A"
 
-@st.cache_data(ttl=3600)
-def get_historical_prices_yf(_stock_obj, start_date, end_date, ticker_symbol_arg_for_error_msg):
-    if _stock_obj is None: return None
+@shared_cache(ttl=3600)
+def get_historical_prices_yf(start_date, end_date, ticker_symbol):
+    """Preços históricos lidos do armazém local; só o trecho faltante vem do Yahoo."""
     try:
-        hist_data = _stock_obj.history(start=datetime(start_date.year, start_date.month, start_date.day), 
-                                       end=datetime(end_date.year, end_date.month, end_date.day) + timedelta(days=1))
+        stock = yf.Ticker(ticker_symbol)
+
+        def fetch_range(inicio, fim):
+            hist = stock.history(start=datetime(inicio.year, inicio.month, inicio.day),
+                                 end=datetime(fim.year, fim.month, fim.day) + timedelta(days=1))
+            return hist[['Close', 'Volume']] if not hist.empty else None
+
+        hist_data = get_prices_incremental(get_market_store(), ticker_symbol,
+                                           start_date, end_date, fetch_range)
         if hist_data.empty: return None
         return hist_data[['Close', 'Volume']]
     except Exception: return None
 
-@st.cache_data(ttl=3600)
-def get_dividend_data_yf(_stock_obj, start_date_period, end_date_period, ticker_symbol_arg_for_error_msg):
-    if _stock_obj is None: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+def get_dividend_data_yf(start_date_period, end_date_period, ticker_symbol):
     try:
-        dividends = _stock_obj.dividends
-        if dividends.empty: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+        indice = get_dividend_index_yf(ticker_symbol)
+    except Exception: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+    return annual_dividends_from_index(indice, ticker_symbol, start_date_period, end_date_period)
 
-        start_dt_naive = pd.to_datetime(start_date_period)
-        end_dt_naive = pd.to_datetime(end_date_period)
-        dividends_index_naive = dividends.index.tz_localize(None)
-        dividends_in_period = dividends[(dividends_index_naive >= start_dt_naive) & (dividends_index_naive <= end_dt_naive)]
-        
-        if dividends_in_period.empty: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+# --- Comparação de Ativos ---
 
-        annual_dividends_list = []
-        for year, group_df in dividends_in_period.groupby(dividends_in_period.index.year):
-            annual_dividends_list.append({'Ano': year, 'Dividendos Anuais (R$)': group_df.sum()})
-        
-        return pd.DataFrame(annual_dividends_list).sort_values(by='Ano') if annual_dividends_list else pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
-    except Exception: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+MODO_COMPARACAO = "Comparação de Ativos"
+MAX_TICKERS_COMPARACAO = 50
 
-def calculate_cagr(series_values):
-    numeric_series = pd.to_numeric(series_values, errors='coerce').dropna()
-    positive_series = numeric_series[numeric_series > 0]
-    if len(positive_series) < 2: return "N/A"
-    start_value, end_value = positive_series.iloc[0], positive_series.iloc[-1]
-    num_years = positive_series.index.max() - positive_series.index.min()
-    if isinstance(series_values.index, pd.RangeIndex) or num_years == 0 :
-         num_years = len(positive_series) -1
-    if num_years <= 0 : return "N/A (período insuficiente)"
-    if start_value <= 0: return "N/A (valor inicial <=0)"
-    cagr = ((end_value / start_value) ** (1 / num_years)) - 1
-    return round(cagr * 100, 2)
-
-def calculate_historical_dy(annual_dividends_df, historical_prices_df):
-    if annual_dividends_df.empty or historical_prices_df is None or historical_prices_df.empty:
-        return pd.DataFrame(columns=['Ano', 'Preço Base (R$)', 'DY Anual (%)']), "N/A", "N/A"
-    
-    historical_dys_calc = []
-    prices_df_naive_index = historical_prices_df.copy()
-    if prices_df_naive_index.index.tz is not None:
-        prices_df_naive_index.index = prices_df_naive_index.index.tz_localize(None)
-
-    for _, row in annual_dividends_df.iterrows():
-        year, annual_dividend_value = int(row['Ano']), row['Dividendos Anuais (R$)']
-        if not isinstance(annual_dividend_value, (int, float)) or annual_dividend_value <= 0:
-            historical_dys_calc.append({'Ano': year, 'Preço Base (R$)': 'N/A', 'DY Anual (%)': 'N/A (Div Inválido)'})
-            continue
-        
-        price_target_date_end_prev_year = pd.to_datetime(datetime(year - 1, 12, 31))
-        price_target_date_start_prev_year = pd.to_datetime(datetime(year - 1, 12, 1))
-        prices_prev_year = prices_df_naive_index[(prices_df_naive_index.index >= price_target_date_start_prev_year) & (prices_df_naive_index.index <= price_target_date_end_prev_year)]
-        base_price = prices_prev_year['Close'].iloc[-1] if not prices_prev_year.empty else np.nan
-
-        if pd.notna(base_price) and base_price > 0:
-            historical_dys_calc.append({'Ano': year, 'Preço Base (R$)': round(base_price,2), 'DY Anual (%)': round((annual_dividend_value / base_price) * 100, 2)})
-        else:
-            historical_dys_calc.append({'Ano': year, 'Preço Base (R$)': 'N/D (Preço)', 'DY Anual (%)': 'N/D (Preço)'})
-    
-    df_historical_dys_final = pd.DataFrame(historical_dys_calc)
-    valid_dys = pd.to_numeric(df_historical_dys_final['DY Anual (%)'], errors='coerce').dropna()
-    avg_dy_value = round(valid_dys.mean(), 2) if not valid_dys.empty else "N/A"
-    
-    divs_for_cagr = annual_dividends_df.set_index('Ano')['Dividendos Anuais (R$)']
-    cagr_dividends_value = calculate_cagr(divs_for_cagr)
-    return df_historical_dys_final, avg_dy_value, cagr_dividends_value
-
-def calculate_fibonacci_levels(price_series_period):
-    if price_series_period is None or len(price_series_period) < 2: return None, None
-    max_price, min_price = price_series_period.max(), price_series_period.min()
-    price_range = max_price - min_price
-    if price_range == 0: return None, None
-
-    fib_retracement_levels = {
-        "0.0% (Mín)": min_price, "23.6%": max_price - (price_range * 0.236),
-        "38.2%": max_price - (price_range * 0.382), "50.0%": max_price - (price_range * 0.5),
-        "61.8%": max_price - (price_range * 0.618), "78.6%": max_price - (price_range * 0.786),
-        "100.0% (Máx)": max_price
-    }
-    fib_projection_levels = {
-        "127.2%": max_price + (price_range * 0.272), "161.8%": max_price + (price_range * 0.618),
-        "200.0%": max_price + price_range, "261.8%": max_price + (price_range * 1.618)
-    }
-    return fib_retracement_levels, fib_projection_levels
+def parse_ticker_list(texto, limite=MAX_TICKERS_COMPARACAO):
+    """Tickers digitados (vírgula, espaço ou quebra de linha), sem repetição: (aceitos, excedentes)."""
+    tickers = list(dict.fromkeys(t for t in re.split(r"[\s,;]+", (texto or "").upper()) if t))
+    return tickers[:limite], tickers[limite:]
+
+def fetch_comparison_data(ticker_symbol, start_date, end_date):
+    """Info, preços (com folga para o preço base do DY) e índice de dividendos de um ticker."""
+    info = get_stock_info_yf(ticker_symbol)
+    if info is None: return None
+    try:
+        indice = get_dividend_index_yf(ticker_symbol)
+    except Exception: indice = None
+    return {'ticker': ticker_symbol, 'info': info, 'indice': indice,
+            'precos': get_historical_prices_yf(start_date - timedelta(days=400), end_date, ticker_symbol)}
+
+def _close_naive(precos):
+    close = precos['Close']
+    return close.tz_localize(None) if close.index.tz is not None else close
+
+def render_comparison(tickers, start_date, end_date):
+    """Baixa os tickers em paralelo e mostra DY, CAGR e Fibonacci de todos lado a lado."""
+    barra = st.progress(0.0, text=f"Buscando dados de {len(tickers)} ativos...")
+    def on_result(concluidos, total, ticker, resultado, erro):
+        barra.progress(concluidos / total, text=f"Buscando dados... {ticker} ({concluidos}/{total})")
+    dados, falhas = run_concurrent_analysis(
+        tickers, lambda t: fetch_comparison_data(t, start_date, end_date),
+        min(DEFAULT_MAX_WORKERS, len(tickers)), on_result
+    )
+    barra.empty()
+    if falhas: st.warning(f"Sem dados para: {', '.join(falhas)}")
+    if not dados:
+        st.error("Não foi possível obter dados para nenhum dos tickers informados.")
+        return
+
+    dados = sorted(dados, key=lambda d: tickers.index(d['ticker'])) # ordem digitada
+    ordem = [d['ticker'] for d in dados]
+    closes = pd.DataFrame({d['ticker']: _close_naive(d['precos']) for d in dados
+                           if d['precos'] is not None and not d['precos'].empty})
+    comparacao = compare_tickers(
+        DividendHistoryStore.concat(d['indice'] for d in dados), closes, ordem, start_date, end_date,
+        {d['ticker']: d['info'].get('preco_atual') for d in dados}
+    )
+    resumo = comparacao['resumo']
+    resumo.insert(0, 'Nome', [d['info'].get('nome_longo', d['ticker']) for d in dados])
+    resumo.insert(1, 'Setor', [d['info'].get('setor', 'N/A') for d in dados])
+    resumo['P/L'] = pd.to_numeric(pd.Series([d['info'].get('pl_atual') for d in dados], index=resumo.index), errors='coerce')
+    resumo['Payout (%)'] = pd.to_numeric(pd.Series([d['info'].get('payout_ratio') for d in dados], index=resumo.index), errors='coerce')
+
+    st.header(f"📊 Comparação de {len(ordem)} Ativos")
+    st.caption(f"Período: {start_date.strftime('%d/%m/%Y')} a {end_date.strftime('%d/%m/%Y')}")
+    st.dataframe(resumo.style.format(precision=2, na_rep="N/A"), use_container_width=True)
+
+    tab1, tab2, tab3, tab4 = st.tabs(["💰 DY Atual x Histórico", "💹 DY Histórico", "📈 Preços", "📉 Fibonacci"])
+    with tab1:
+        df_dy = resumo[['DY 12M (%)', 'DY Médio Hist. (%)']].reset_index().melt(id_vars='Ticker', var_name='Métrica', value_name='DY (%)')
+        fig_dy = px.bar(df_dy.dropna(), x='Ticker', y='DY (%)', color='Métrica', barmode='group',
+                        title="DY dos Últimos 12M vs DY Médio Histórico")
+        st.plotly_chart(fig_dy, use_container_width=True)
+        fig_cagr = px.bar(resumo['CAGR Div (%)'].dropna().reset_index(), x='Ticker', y='CAGR Div (%)',
+                          title="CAGR dos Dividendos Anuais")
+        st.plotly_chart(fig_cagr, use_container_width=True)
+    with tab2:
+        dy_hist = comparacao['dy_historico'].dropna(axis=1, how='all')
+        if not dy_hist.empty:
+            fig_hm = px.imshow(dy_hist.T, text_auto='.2f', aspect='auto', color_continuous_scale='RdYlGn',
+                               labels=dict(x='Ano', y='Ticker', color='DY (%)'), title="DY Anual Histórico (%)")
+            fig_hm.update_xaxes(type='category')
+            st.plotly_chart(fig_hm, use_container_width=True)
+            with st.expander("Dividendos Anuais (R$)"): st.dataframe(comparacao['dividendos_anuais'])
+        else: st.info("Não foi possível calcular DY histórico para os ativos no período.")
+    with tab3:
+        precos = comparacao['precos'].dropna(axis=1, how='all')
+        if not precos.empty:
+            base_100 = precos / precos.bfill().iloc[0] * 100
+            fig_p = px.line(base_100, labels=dict(value='Preço (base 100)', index='Data', variable='Ticker'),
+                            title="Preço de Fechamento Normalizado (base 100 no início do período)")
+            st.plotly_chart(fig_p, use_container_width=True)
+        else: st.info("Sem dados de preço para o período.")
+    with tab4:
+        fibonacci = comparacao['fibonacci'].dropna(how='all')
+        if not fibonacci.empty:
+            posicao = resumo['Posição na Faixa (%)'].dropna().reset_index()
+            fig_pos = px.bar(posicao, x='Ticker', y='Posição na Faixa (%)', range_y=[0, 100],
+                             title="Preço Atual na Faixa Mín–Máx do Período (0% = mínima, 100% = máxima)")
+            for nivel in (23.6, 38.2, 50.0, 61.8, 78.6):
+                fig_pos.add_hline(y=nivel, line_dash="dash", line_color='rgba(255,165,0,0.7)', annotation_text=f"{nivel}%")
+            st.plotly_chart(fig_pos, use_container_width=True)
+            st.write("**Níveis de Retração e Projeção Fibonacci (R$):**")
+            st.dataframe(fibonacci.style.format(precision=2, na_rep="N/A"), use_container_width=True)
+            st.caption("Fibonacci traçado com base no máx/mín do período selecionado. Interprete com cautela.")
+        else: st.info("Dados insuficientes para Fibonacci no período.")
 
 # --- Interface Principal ---
 st.title("🔎 Análise Aprofundada de Ações para Carteira de Dividendos")
 
 st.sidebar.header("⚙️ Configurações da Análise")
-ticker_input_sb = st.sidebar.text_input("Ticker da Ação (ex: ITSA4.SA)", value=st.session_state.get("last_ticker", "ITSA4.SA"), key="ticker_input_widget").upper()
+modo_analise = st.sidebar.radio("Modo de Análise", ["Ativo Único", MODO_COMPARACAO], horizontal=True, key="modo_analise_widget")
+modo_comparacao = modo_analise == MODO_COMPARACAO
+if modo_comparacao:
+    tickers_input_sb = st.sidebar.text_area(f"Tickers para Comparar (até {MAX_TICKERS_COMPARACAO})", value=st.session_state.get("last_comparacao_texto", "ITSA4.SA, BBAS3.SA, TAEE11.SA, BBSE3.SA, CMIG4.SA"), height=100, key="tickers_input_widget")
+else:
+    ticker_input_sb = st.sidebar.text_input("Ticker da Ação (ex: ITSA4.SA)", value=st.session_state.get("last_ticker", "ITSA4.SA"), key="ticker_input_widget").upper()
 default_end_date = datetime.today().date()
 default_start_date = default_end_date - timedelta(days=5*365 + 2)
 col_date1, col_date2 = st.sidebar.columns(2)
@@ -187,10 +205,14 @@ start_date_input_sb = col_date1.date_input("Data Inicial Histórico", value=st.s
 end_date_input_sb = col_date2.date_input("Data Final Histórico", value=st.session_state.get("last_end_date", default_end_date), min_value=start_date_input_sb + timedelta(days=1) if start_date_input_sb else datetime(1990,1,2).date(), max_value=default_end_date, key="end_date_widget")
 
 with st.sidebar.form(key="analysis_form"):
-    analyze_button_form = st.form_submit_button(label="🚀 Analisar Ação")
+    analyze_button_form = st.form_submit_button(label="📊 Comparar Ativos" if modo_comparacao else "🚀 Analisar Ação")
 
 if analyze_button_form:
-    st.session_state.last_ticker = ticker_input_sb
+    if modo_comparacao:
+        st.session_state.last_comparacao, st.session_state.last_comparacao_excedentes = parse_ticker_list(tickers_input_sb)
+        st.session_state.last_comparacao_texto = tickers_input_sb
+    else:
+        st.session_state.last_ticker = ticker_input_sb
     st.session_state.last_start_date = start_date_input_sb
     st.session_state.last_end_date = end_date_input_sb
 
@@ -198,23 +220,32 @@ active_ticker = st.session_state.get("last_ticker", None)
 active_start_date = st.session_state.get("last_start_date", None)
 active_end_date = st.session_state.get("last_end_date", None)
 
-if active_ticker and active_start_date and active_end_date:
+if modo_comparacao:
+    tickers_comparacao = st.session_state.get("last_comparacao")
+    if not tickers_comparacao:
+        st.info(f"⬅️ Informe até {MAX_TICKERS_COMPARACAO} tickers na barra lateral e clique em 'Comparar Ativos'.")
+    elif active_start_date >= active_end_date:
+        st.error("A data inicial deve ser anterior à data final.")
+    else:
+        excedentes = st.session_state.get("last_comparacao_excedentes", [])
+        if excedentes: st.warning(f"Limite de {MAX_TICKERS_COMPARACAO} tickers: {len(excedentes)} ignorados ({', '.join(excedentes[:10])}{'...' if len(excedentes) > 10 else ''}).")
+        render_comparison(tickers_comparacao, active_start_date, active_end_date)
+elif active_ticker and active_start_date and active_end_date:
     if active_start_date >= active_end_date:
         st.error("A data inicial deve ser anterior à data final.")
     else:
         with st.spinner(f"Buscando e processando dados para {active_ticker}..."):
-            stock_obj = get_stock_object_yf(active_ticker)
-            if stock_obj is None:
+            info_data = get_stock_info_yf(active_ticker)
+            if info_data is None:
                 st.error(f"Não foi possível obter informações para o ticker {active_ticker}. Verifique se o ticker é válido ou tente mais tarde.")
             else:
-                info_data = get_stock_info_yf(stock_obj, active_ticker)
                 dy_l12m = "N/A"
                 if info_data and info_data.get('preco_atual') != "N/A" and isinstance(info_data.get('preco_atual'), (int,float)):
-                    dy_l12m = calculate_dy_last_12_months(stock_obj, info_data['preco_atual'], active_ticker)
+                    dy_l12m = calculate_dy_last_12_months(active_ticker, info_data['preco_atual'])
                 
                 hist_prices_start_for_dy_calc = active_start_date - timedelta(days=400)
-                historical_prices_df = get_historical_prices_yf(stock_obj, hist_prices_start_for_dy_calc, active_end_date, active_ticker)
-                annual_dividends_df = get_dividend_data_yf(stock_obj, active_start_date, active_end_date, active_ticker)
+                historical_prices_df = get_historical_prices_yf(hist_prices_start_for_dy_calc, active_end_date, active_ticker)
+                annual_dividends_df = get_dividend_data_yf(active_start_date, active_end_date, active_ticker)
                 df_historical_dys, avg_dy_hist, cagr_divs = calculate_historical_dy(annual_dividends_df, historical_prices_df)
 
                 if info_data:
@@ -4,9 +4,12 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import numpy as np
-from collections import defaultdict
-import calendar
+from simulacao_carteira import simulate_portfolio_history, create_dividend_calendar
+from metricas_lote import build_ranking
+from historico_dividendos import get_history_store, without_history
+from snapshot_ranking import load_latest_snapshot
+from cache_compartilhado import shared_cache, clear_local_cache
+from registro_compacto import dividends_to_arrays, arrays_to_dividends, expand_record
 
 # --- Configurações da Página Streamlit ---
 st.set_page_config(layout="wide", page_title="🎯 Otimizador de Carteira de Dividendos")
@@ -26,24 +29,11 @@ ACOES_DIVIDENDOS_BR = {
 
 # --- Funções Auxiliares ---
 
-@st.cache_resource(ttl=1800)
-def get_stock_object_yf(ticker_symbol):
-    """Retorna o objeto Ticker do yfinance."""
+@shared_cache(ttl=1800)
+def get_stock_info_yf(ticker_symbol):
+    """Busca informações gerais da ação (dict pequeno e serializável)."""
     try:
-        stock = yf.Ticker(ticker_symbol)
-        if hasattr(stock, 'info') and stock.info:
-            return stock
-        return None
-    except Exception:
-        return None
-
-@st.cache_data(ttl=1800)
-def get_stock_info_yf(_stock_obj, ticker_symbol):
-    """Busca informações gerais da ação."""
-    if _stock_obj is None:
-        return None
-    try:
-        info = _stock_obj.info
+        info = yf.Ticker(ticker_symbol).info
         if not info:
             return None
         
@@ -59,111 +49,90 @@ def get_stock_info_yf(_stock_obj, ticker_symbol):
     except Exception:
         return None
 
-@st.cache_data(ttl=1800)
-def get_dividends_history(_stock_obj, years=5):
-    """Busca histórico de dividendos."""
-    if _stock_obj is None:
-        return pd.DataFrame()
-    
+@shared_cache(ttl=1800)
+def get_dividend_arrays(ticker_symbol, years=5):
+    """Dividendos do período como arrays (datas int64, valores float64)."""
     try:
         end_date = datetime.today()
         start_date = end_date - timedelta(days=years*365 + 100)
-        dividends = _stock_obj.dividends
+        dividends = yf.Ticker(ticker_symbol).dividends
         
         if dividends.empty:
-            return pd.DataFrame()
-        
-        # Filtrar período
-        dividends_index = dividends.index.tz_localize(None) if dividends.index.tz else dividends.index
-        start_dt = pd.to_datetime(start_date)
-        end_dt = pd.to_datetime(end_date)
+            return dividends_to_arrays(None)
         
-        dividends_filtered = dividends[(dividends_index >= start_dt) & (dividends_index <= end_dt)]
-        
-        return dividends_filtered
+        # Filtrar período (índice ordenado por data: busca binária)
+        datas = dividends.index.tz_localize(None) if dividends.index.tz else dividends.index
+        inicio = datas.searchsorted(pd.Timestamp(start_date), side='left')
+        fim = datas.searchsorted(pd.Timestamp(end_date), side='right')
+        return dividends_to_arrays(dividends.iloc[inicio:fim])
     except Exception:
+        return dividends_to_arrays(None)
+
+def get_dividends_history(ticker_symbol, years=5):
+    """Busca histórico de dividendos (Series remontada dos arrays em cache)."""
+    datas, valores = get_dividend_arrays(ticker_symbol, years)
+    if len(datas) == 0:
         return pd.DataFrame()
+    return arrays_to_dividends(datas, valores)
 
-@st.cache_data(ttl=1800)
-def calculate_dividend_metrics(ticker_symbol, years=5):
-    """Calcula métricas de dividendos para uma ação."""
-    stock = get_stock_object_yf(ticker_symbol)
-    if stock is None:
-        return None
-    
-    info = get_stock_info_yf(stock, ticker_symbol)
+@shared_cache(ttl=1800)
+def _fetch_ticker_record(ticker_symbol, years=5):
+    """Registro compacto (dividendos em arrays) de preço, nome, setor e dividendos."""
+    info = get_stock_info_yf(ticker_symbol)
     if info is None or info['preco_atual'] == 0:
         return None
     
-    dividends = get_dividends_history(stock, years)
-    if dividends.empty:
+    datas, valores = get_dividend_arrays(ticker_symbol, years)
+    if len(datas) == 0:
         return None
     
-    # Calcular métricas
-    preco_atual = info['preco_atual']
-    
-    # DY dos últimos 12 meses
-    end_date = datetime.today()
-    start_12m = end_date - timedelta(days=365)
-    dividends_index = dividends.index.tz_localize(None) if dividends.index.tz else dividends.index
-    dividends_12m = dividends[dividends_index >= pd.to_datetime(start_12m)]
-    dy_12m = (dividends_12m.sum() / preco_atual * 100) if not dividends_12m.empty and preco_atual > 0 else 0
-    
-    # Dividendos anuais
-    dividends_by_year = dividends.groupby(dividends.index.year).sum()
-    dy_medio = dividends_by_year.mean() / preco_atual * 100 if preco_atual > 0 else 0
-    
-    # Consistência (% de anos com dividendos)
-    anos_com_dividendos = len(dividends_by_year)
-    consistencia = (anos_com_dividendos / years) * 100
-    
-    # Crescimento (CAGR)
-    if len(dividends_by_year) >= 2:
-        start_val = dividends_by_year.iloc[0]
-        end_val = dividends_by_year.iloc[-1]
-        num_years = len(dividends_by_year) - 1
-        if start_val > 0 and num_years > 0:
-            cagr = ((end_val / start_val) ** (1 / num_years) - 1) * 100
-        else:
-            cagr = 0
-    else:
-        cagr = 0
-    
-    # Score composto (ponderação: DY 40%, Consistência 30%, Crescimento 30%)
-    score = (dy_12m * 0.4) + (consistencia * 0.3) + (max(0, min(cagr, 20)) * 0.3)
-    
     return {
         'ticker': ticker_symbol,
         'nome': info['nome_longo'],
         'setor': info['setor'],
-        'preco': preco_atual,
-        'dy_12m': round(dy_12m, 2),
-        'dy_medio': round(dy_medio, 2),
-        'consistencia': round(consistencia, 1),
-        'cagr_dividendos': round(cagr, 2),
-        'anos_com_div': anos_com_dividendos,
-        'score': round(score, 2),
-        'dividends_history': dividends
+        'preco': info['preco_atual'],
+        'div_datas': datas,
+        'div_valores': valores
     }
 
+def fetch_ticker_data(ticker_symbol, years=5):
+    """Busca preço, nome, setor e dividendos de uma ação (sem calcular métricas)."""
+    return expand_record(_fetch_ticker_record(ticker_symbol, years))
+
+@shared_cache(ttl=1800)
+def calculate_dividend_metrics(ticker_symbol, years=5):
+    """Calcula métricas de dividendos para uma ação (histórico em arrays compactos)."""
+    record = fetch_ticker_data(ticker_symbol, years)
+    if record is None:
+        return None
+    
+    df_metrics = build_ranking([record], years)
+    if df_metrics.empty:
+        return None
+    
+    registro = df_metrics.iloc[0].to_dict()
+    registro['div_datas'], registro['div_valores'] = get_history_store(df_metrics).arrays(ticker_symbol)
+    return registro
+
 def analyze_all_stocks(progress_bar=None):
     """Analisa todas as ações da lista."""
     all_tickers = []
     for setor, tickers in ACOES_DIVIDENDOS_BR.items():
         all_tickers.extend(tickers)
     
-    results = []
+    records = []
     total = len(all_tickers)
     
     for idx, ticker in enumerate(all_tickers):
         if progress_bar:
             progress_bar.progress((idx + 1) / total, f"Analisando {ticker}...")
         
-        metrics = calculate_dividend_metrics(ticker)
-        if metrics:
-            results.append(metrics)
+        record = fetch_ticker_data(ticker)
+        if record:
+            records.append(record)
     
-    return pd.DataFrame(results)
+    # Calcular as métricas de todas as ações de uma vez
+    return build_ranking(records)
 
 def optimize_portfolio(df_stocks, capital_total, min_acoes_por_empresa=100):
     """Otimiza o portfólio para maximizar DY e diversificação."""
@@ -196,97 +165,7 @@ def optimize_portfolio(df_stocks, capital_total, min_acoes_por_empresa=100):
     
     return df_selected[['ticker', 'nome', 'setor', 'preco', 'quantidade', 'valor_investido', 
                         'percentual_carteira', 'dy_12m', 'dividendos_anuais_estimados', 
-                        'dividendos_mensais_estimados', 'score', 'dividends_history']]
-
-def simulate_portfolio_history(portfolio_df, years=5):
-    """Simula o histórico do portfólio nos últimos N anos."""
-    if portfolio_df is None or portfolio_df.empty:
-        return None
-    
-    # Preparar dados históricos
-    end_date = datetime.today()
-    start_date = end_date - timedelta(days=years*365)
-    
-    monthly_dividends = defaultdict(float)
-    annual_dividends = defaultdict(float)
-    
-    for _, row in portfolio_df.iterrows():
-        dividends = row['dividends_history']
-        quantidade = row['quantidade']
-        
-        if dividends.empty:
-            continue
-        
-        for date, div_value in dividends.items():
-            date_naive = date.tz_localize(None) if hasattr(date, 'tz_localize') else date
-            
-            if date_naive >= pd.to_datetime(start_date):
-                year = date_naive.year
-                month_key = f"{date_naive.year}-{date_naive.month:02d}"
-                
-                total_dividend = div_value * quantidade
-                monthly_dividends[month_key] += total_dividend
-                annual_dividends[year] += total_dividend
-    
-    # Criar DataFrames
-    df_monthly = pd.DataFrame([
-        {'mes': k, 'dividendos': v} for k, v in sorted(monthly_dividends.items())
-    ])
-    
-    df_annual = pd.DataFrame([
-        {'ano': k, 'dividendos': v} for k, v in sorted(annual_dividends.items())
-    ])
-    
-    return df_monthly, df_annual
-
-def create_dividend_calendar(portfolio_df):
-    """Cria calendário de pagamento de dividendos."""
-    if portfolio_df is None or portfolio_df.empty:
-        return None
-    
-    # Analisar últimos 24 meses para identificar padrão
-    end_date = datetime.today()
-    start_date = end_date - timedelta(days=730)
-    
-    dividend_calendar = defaultdict(lambda: defaultdict(list))
-    
-    for _, row in portfolio_df.iterrows():
-        ticker = row['ticker']
-        dividends = row['dividends_history']
-        quantidade = row['quantidade']
-        
-        if dividends.empty:
-            continue
-        
-        for date, div_value in dividends.items():
-            date_naive = date.tz_localize(None) if hasattr(date, 'tz_localize') else date
-            
-            if date_naive >= pd.to_datetime(start_date):
-                month = date_naive.month
-                total_dividend = div_value * quantidade
-                dividend_calendar[month][ticker].append(total_dividend)
-    
-    # Calcular média por mês
-    monthly_summary = []
-    for month in range(1, 13):
-        month_name = calendar.month_name[month]
-        total_month = 0
-        tickers_pagantes = []
-        
-        if month in dividend_calendar:
-            for ticker, values in dividend_calendar[month].items():
-                avg_value = np.mean(values)
-                total_month += avg_value
-                tickers_pagantes.append(f"{ticker.replace('.SA', '')}")
-        
-        monthly_summary.append({
-            'mes_num': month,
-            'mes': month_name,
-            'valor_estimado': total_month,
-            'acoes_pagantes': ', '.join(tickers_pagantes) if tickers_pagantes else 'Nenhuma'
-        })
-    
-    return pd.DataFrame(monthly_summary)
+                        'dividendos_mensais_estimados', 'score']]
 
 # --- Interface Principal ---
 st.title("🎯 Otimizador de Carteira de Dividendos")
@@ -305,18 +184,38 @@ with tab1:
     col1, col2 = st.columns([3, 1])
     with col1:
         st.info("Analisando ações com histórico consistente de pagamento de dividendos")
+    atualizar_ranking = False
     with col2:
         if st.button("🔄 Atualizar Ranking", type="primary"):
-            st.cache_data.clear()
-    
-    with st.spinner("Analisando ações... Isso pode levar alguns minutos..."):
-        progress_bar = st.progress(0)
-        df_ranking = analyze_all_stocks(progress_bar)
-        progress_bar.empty()
+            clear_local_cache()
+            atualizar_ranking = True
+    
+    # Usar o snapshot pré-calculado (snapshot_ranking.py); a análise ao vivo só roda sem snapshot ou ao atualizar
+    if 'df_ranking' not in st.session_state and not atualizar_ranking:
+        snapshot = load_latest_snapshot()
+        if snapshot is not None:
+            tickers_curados = [t for tickers in ACOES_DIVIDENDOS_BR.values() for t in tickers]
+            df_snapshot = snapshot['ranking'][snapshot['ranking']['ticker'].isin(tickers_curados)]
+            if not df_snapshot.empty:
+                st.session_state['df_ranking'] = df_snapshot.reset_index(drop=True)
+                st.session_state['ranking_gerado_em'] = snapshot['gerado_em']
+    
+    if atualizar_ranking or 'df_ranking' not in st.session_state:
+        with st.spinner("Analisando ações... Isso pode levar alguns minutos..."):
+            progress_bar = st.progress(0)
+            df_analise = analyze_all_stocks(progress_bar)
+            progress_bar.empty()
+        
+        if not df_analise.empty:
+            # Salvar no session state
+            st.session_state['df_ranking'] = df_analise
+            st.session_state.pop('ranking_gerado_em', None)
+    
+    df_ranking = st.session_state.get('df_ranking', pd.DataFrame())
     
     if not df_ranking.empty:
-        # Salvar no session state
-        st.session_state['df_ranking'] = df_ranking
+        if 'ranking_gerado_em' in st.session_state:
+            st.caption(f"📦 Ranking pré-calculado em {st.session_state['ranking_gerado_em']:%d/%m/%Y %H:%M}.")
         
         # Mostrar estatísticas gerais
         col1, col2, col3, col4 = st.columns(4)
@@ -351,8 +250,8 @@ with tab1:
         st.subheader(f"🏆 Top Ações ({len(df_filtrado)} resultados)")
         
         # Preparar DataFrame para exibição
-        df_display = df_filtrado[['ticker', 'nome', 'setor', 'preco', 'dy_12m', 'dy_medio', 
-                                   'consistencia', 'cagr_dividendos', 'anos_com_div', 'score']].copy()
+        df_display = without_history(df_filtrado[['ticker', 'nome', 'setor', 'preco', 'dy_12m', 'dy_medio', 
+                                   'consistencia', 'cagr_dividendos', 'anos_com_div', 'score']])
         df_display.columns = ['Ticker', 'Nome', 'Setor', 'Preço (R$)', 'DY 12M (%)', 
                               'DY Médio (%)', 'Consistência (%)', 'CAGR Div (%)', 
                               'Anos c/ Div', 'Score']
@@ -487,9 +386,9 @@ with tab2:
             # Tabela de alocação
             st.subheader("🎯 Alocação Detalhada")
             
-            df_port_display = portfolio[['ticker', 'nome', 'setor', 'preco', 'quantidade', 
+            df_port_display = without_history(portfolio[['ticker', 'nome', 'setor', 'preco', 'quantidade', 
                                          'valor_investido', 'percentual_carteira', 'dy_12m',
-                                         'dividendos_anuais_estimados']].copy()
+                                         'dividendos_anuais_estimados']])
             df_port_display.columns = ['Ticker', 'Nome', 'Setor', 'Preço (R$)', 'Quantidade',
                                        'Valor Investido (R$)', '% Carteira', 'DY 12M (%)',
                                        'Dividendos/Ano (R$)']
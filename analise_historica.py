@@ -0,0 +1,225 @@
+"""
+Cálculos históricos da análise aprofundada de um ativo.
+
+Dividendos anuais no período, DY histórico sobre o preço do fim do ano
+anterior, CAGR dos dividendos e níveis de Fibonacci. Não dependem do
+Streamlit, então podem ser usados fora do app (ex.: benchmark.py).
+
+O preço base de cada ano (último fechamento de dezembro do ano anterior)
+sai de uma consulta as-of (busca binária dos fins de ano nas datas dos
+fechamentos) para todos os anos e tickers de uma vez, e o DY é uma coluna
+vetorial: históricos de 30 anos ou vários tickers não repetem um filtro
+sobre a tabela de preços por ano.
+
+Para o modo de comparação, as versões *_table recebem tabelas anos × tickers
+(dividendos) e datas × tickers (fechamentos) e calculam DY histórico, CAGR e
+níveis de Fibonacci de todos os tickers em operações de array.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Janela do preço base: último pregão em [1/dez, 31/dez] do ano anterior
+_JANELA_DEZEMBRO = pd.Timedelta(days=30)
+
+# Níveis de Fibonacci: retrações a partir do máximo e projeções acima dele (fração da faixa)
+FIB_RETRACEMENTS = [("23.6%", 0.236), ("38.2%", 0.382), ("50.0%", 0.5), ("61.8%", 0.618), ("78.6%", 0.786)]
+FIB_PROJECTIONS = [("127.2%", 0.272), ("161.8%", 0.618), ("200.0%", 1.0), ("261.8%", 1.618)]
+
+
+def annual_dividends_frame(dividends, start_date_period, end_date_period):
+    """DataFrame Ano / Dividendos Anuais (R$) com a soma dos eventos no período."""
+    try:
+        if dividends is None or dividends.empty: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+
+        start_dt_naive = pd.to_datetime(start_date_period)
+        end_dt_naive = pd.to_datetime(end_date_period)
+        dividends_in_period = dividends[(dividends.index >= start_dt_naive) & (dividends.index <= end_dt_naive)]
+
+        if dividends_in_period.empty: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+
+        anuais = dividends_in_period.groupby(dividends_in_period.index.year).sum()
+        return pd.DataFrame({'Ano': anuais.index.astype(int), 'Dividendos Anuais (R$)': anuais.to_numpy()})
+    except Exception: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+
+
+def annual_dividends_from_index(indice, ticker, start_date_period, end_date_period):
+    """Mesmo formato de annual_dividends_frame, a partir do índice por data (historico_dividendos)."""
+    try:
+        anuais = indice.annual_sums(ticker, start_date_period, end_date_period)
+        if anuais.empty: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+        return pd.DataFrame({'Ano': anuais.index, 'Dividendos Anuais (R$)': anuais.to_numpy()})
+    except Exception: return pd.DataFrame(columns=['Ano', 'Dividendos Anuais (R$)'])
+
+
+def calculate_cagr(series_values):
+    numeric_series = pd.to_numeric(series_values, errors='coerce').dropna()
+    positive_series = numeric_series[numeric_series > 0]
+    if len(positive_series) < 2: return "N/A"
+    start_value, end_value = positive_series.iloc[0], positive_series.iloc[-1]
+    num_years = positive_series.index.max() - positive_series.index.min()
+    if isinstance(series_values.index, pd.RangeIndex) or num_years == 0 :
+         num_years = len(positive_series) -1
+    if num_years <= 0 : return "N/A (período insuficiente)"
+    if start_value <= 0: return "N/A (valor inicial <=0)"
+    cagr = ((end_value / start_value) ** (1 / num_years)) - 1
+    return round(cagr * 100, 2)
+
+
+def year_end_prices(closes, anos):
+    """Preço base de cada ano: último fechamento de dezembro do ano anterior.
+
+    closes: Series de fechamentos indexada por data ou DataFrame datas × tickers.
+    Retorna Series (ou DataFrame anos × tickers) indexada pelos anos, com NaN
+    onde não houve pregão em dezembro do ano anterior.
+    """
+    serie = isinstance(closes, pd.Series)
+    largo = closes.to_frame('Close') if serie else closes
+    if largo.index.tz is not None:
+        largo = largo.tz_localize(None)
+    if not largo.index.is_monotonic_increasing:
+        largo = largo.sort_index()
+    anos = np.asarray(anos, dtype=int)
+
+    datas = largo.index.to_numpy(dtype='datetime64[ns]')
+    valores = largo.to_numpy(dtype=float)
+    # Linha do último fechamento válido até cada data, por ticker (-1 antes do primeiro)
+    linhas = np.where(np.isnan(valores), -1, np.arange(len(datas))[:, None])
+    ultima_valida = np.maximum.accumulate(linhas, axis=0) if len(datas) else linhas
+
+    # As-of: última data <= 31/dez do ano anterior, aceita só se cair em dezembro
+    fins_de_ano = (anos - 1970).astype('datetime64[Y]').astype('datetime64[ns]') - np.timedelta64(1, 'D')
+    posicao = np.searchsorted(datas, fins_de_ano, side='right') - 1
+    origem = np.where(posicao[:, None] >= 0, ultima_valida[np.maximum(posicao, 0)], -1)
+    no_prazo = (origem >= 0) & (datas[np.maximum(origem, 0)] >= (fins_de_ano - _JANELA_DEZEMBRO.to_timedelta64())[:, None])
+    precos = np.where(no_prazo, valores[np.maximum(origem, 0), np.arange(valores.shape[1])], np.nan)
+
+    tabela = pd.DataFrame(precos, index=pd.Index(anos, name='Ano'), columns=largo.columns)
+    return tabela['Close'] if serie else tabela
+
+
+def calculate_historical_dy(annual_dividends_df, historical_prices_df):
+    if annual_dividends_df.empty or historical_prices_df is None or historical_prices_df.empty:
+        return pd.DataFrame(columns=['Ano', 'Preço Base (R$)', 'DY Anual (%)']), "N/A", "N/A"
+
+    anos = annual_dividends_df['Ano'].astype(int).to_numpy()
+    dividendos = pd.to_numeric(annual_dividends_df['Dividendos Anuais (R$)'], errors='coerce').to_numpy(dtype=float)
+    precos = year_end_prices(historical_prices_df['Close'], anos).to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dy = np.round(dividendos / precos * 100, 2)
+    preco_base = pd.Series(np.round(precos, 2), dtype=object)
+    dy_anual = pd.Series(dy, dtype=object)
+
+    # Marcadores de linha inválida, como na tabela exibida no app
+    sem_preco = ~(precos > 0)
+    preco_base[sem_preco] = 'N/D (Preço)'
+    dy_anual[sem_preco] = 'N/D (Preço)'
+    div_invalido = ~(dividendos > 0)
+    preco_base[div_invalido] = 'N/A'
+    dy_anual[div_invalido] = 'N/A (Div Inválido)'
+
+    df_historical_dys_final = pd.DataFrame({'Ano': anos, 'Preço Base (R$)': preco_base, 'DY Anual (%)': dy_anual})
+    valid_dys = dy[~sem_preco & ~div_invalido]
+    avg_dy_value = round(valid_dys.mean(), 2) if len(valid_dys) else "N/A"
+
+    divs_for_cagr = annual_dividends_df.set_index('Ano')['Dividendos Anuais (R$)']
+    cagr_dividends_value = calculate_cagr(divs_for_cagr)
+    return df_historical_dys_final, avg_dy_value, cagr_dividends_value
+
+
+def calculate_fibonacci_levels(price_series_period):
+    if price_series_period is None or len(price_series_period) < 2: return None, None
+    max_price, min_price = price_series_period.max(), price_series_period.min()
+    price_range = max_price - min_price
+    if price_range == 0: return None, None
+
+    fib_retracement_levels = {"0.0% (Mín)": min_price}
+    fib_retracement_levels.update({nome: max_price - (price_range * fracao) for nome, fracao in FIB_RETRACEMENTS})
+    fib_retracement_levels["100.0% (Máx)"] = max_price
+    fib_projection_levels = {nome: max_price + (price_range * fracao) for nome, fracao in FIB_PROJECTIONS}
+    return fib_retracement_levels, fib_projection_levels
+
+
+# --- Comparação de vários tickers (tabelas anos × tickers / datas × tickers) ---
+
+def historical_dy_table(annual_table, closes):
+    """DY anual (%) anos × tickers sobre o preço base do ano; NaN sem dividendo ou sem preço."""
+    precos = year_end_prices(closes.reindex(columns=annual_table.columns), annual_table.index).to_numpy(dtype=float)
+    dividendos = annual_table.to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dy = np.round(dividendos / precos * 100, 2)
+    dy[~(dividendos > 0) | ~(precos > 0)] = np.nan
+    return pd.DataFrame(dy, index=annual_table.index, columns=annual_table.columns)
+
+
+def cagr_table(annual_table):
+    """CAGR (%) dos dividendos anuais de cada ticker, entre o primeiro e o último ano com dividendo > 0."""
+    valores = annual_table.to_numpy(dtype=float)
+    anos = annual_table.index.to_numpy()
+    positivos = valores > 0
+    if len(anos) == 0:
+        return pd.Series(np.nan, index=annual_table.columns)
+    primeiro = positivos.argmax(axis=0)
+    ultimo = len(anos) - 1 - positivos[::-1].argmax(axis=0)
+    colunas = np.arange(valores.shape[1])
+    decorridos = (anos[ultimo] - anos[primeiro]).astype(float)
+    validos = (positivos.sum(axis=0) >= 2) & (decorridos > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = (valores[ultimo, colunas] / valores[primeiro, colunas]) ** (1 / decorridos) - 1
+    return pd.Series(np.where(validos, np.round(cagr * 100, 2), np.nan), index=annual_table.columns)
+
+
+def fibonacci_table(closes):
+    """Níveis de Fibonacci tickers × níveis sobre o máx/mín de cada coluna de fechamentos.
+
+    Tickers com menos de dois preços ou faixa nula ficam com NaN, como em calculate_fibonacci_levels.
+    """
+    maximo, minimo = closes.max(), closes.min()
+    faixa = maximo - minimo
+    niveis = {"0.0% (Mín)": minimo}
+    niveis.update({nome: maximo - faixa * fracao for nome, fracao in FIB_RETRACEMENTS})
+    niveis["100.0% (Máx)"] = maximo
+    niveis.update({nome: maximo + faixa * fracao for nome, fracao in FIB_PROJECTIONS})
+    tabela = pd.DataFrame(niveis)
+    tabela.loc[(closes.count() < 2) | (faixa == 0)] = np.nan
+    return tabela
+
+
+def compare_tickers(store, closes, tickers, start_date_period, end_date_period, current_prices, as_of=None):
+    """Tabelas da comparação de vários tickers, calculadas de uma vez para todos.
+
+    store: DividendHistoryStore com os tickers; closes: fechamentos datas × tickers, com folga
+    antes do início para o preço base do DY; current_prices: Series ticker -> preço atual.
+    Retorna dict com 'resumo' (uma linha por ticker), 'dividendos_anuais', 'dy_historico',
+    'precos' (fechamentos no período) e 'fibonacci'.
+    """
+    tickers = list(tickers)
+    closes = closes.reindex(columns=tickers)
+    if closes.index.tz is not None:
+        closes = closes.tz_localize(None)
+    closes = closes.sort_index()
+    inicio, fim = pd.Timestamp(start_date_period), pd.Timestamp(end_date_period)
+
+    anuais = store.annual_table(tickers, inicio, fim)
+    dy_historico = historical_dy_table(anuais, closes)
+    precos = closes[(closes.index >= inicio) & (closes.index <= fim)]
+    fibonacci = fibonacci_table(precos)
+
+    preco_atual = pd.to_numeric(pd.Series(current_prices).reindex(tickers), errors='coerce')
+    preco_atual = preco_atual.where(preco_atual > 0)
+    dividendos_12m = pd.Series(store.trailing_sums(tickers, as_of), index=tickers)
+    faixa = fibonacci["100.0% (Máx)"] - fibonacci["0.0% (Mín)"]
+
+    resumo = pd.DataFrame({
+        'Preço (R$)': preco_atual,
+        'DY 12M (%)': (dividendos_12m / preco_atual * 100).round(2),
+        'DY Médio Hist. (%)': dy_historico.mean().round(2),
+        'CAGR Div (%)': cagr_table(anuais),
+        'Anos c/ Div': (anuais > 0).sum().astype(int),
+        'Mín. Período (R$)': fibonacci["0.0% (Mín)"],
+        'Máx. Período (R$)': fibonacci["100.0% (Máx)"],
+        'Posição na Faixa (%)': ((preco_atual - fibonacci["0.0% (Mín)"]) / faixa * 100).round(1)
+    }, index=pd.Index(tickers, name='Ticker'))
+    return {'resumo': resumo, 'dividendos_anuais': anuais, 'dy_historico': dy_historico,
+            'precos': precos, 'fibonacci': fibonacci}
@@ -0,0 +1,390 @@
+"""
+Armazém local (SQLite) de dividendos e preços por ticker.
+
+Os caches do Streamlit somem quando o processo reinicia ou o TTL expira, e
+aí todo o histórico de dividendos é baixado de novo. Este módulo guarda o
+histórico em disco e registra, por ticker, o período já coberto; as funções
+de busca leem do disco primeiro e só pedem ao Yahoo o trecho que falta
+(desde a última data armazenada).
+
+Os fechamentos vêm ajustados (auto_adjust): um provento ou desdobramento
+novo muda o fator de todo o histórico anterior. Quando os pregões
+sobrepostos do delta não batem com o que está em disco
+(adjustment_changed), o trecho inteiro é baixado de novo e substitui o
+armazenado, para a série nunca misturar bases de ajuste.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+DATA_DIR = os.environ.get(
+    "DIVIDENDOS_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados")
+)
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "mercado.sqlite")
+
+# Depois desse intervalo o trecho mais recente é buscado novamente
+REFRESH_AFTER = timedelta(hours=12)
+# Sobreposição ao buscar o delta, para capturar correções recentes do Yahoo
+DELTA_OVERLAP = timedelta(days=7)
+# Diferença relativa nos fechamentos sobrepostos acima disso indica novo fator de ajuste
+AJUSTE_TOLERANCIA = 1e-4
+
+_DATE_FMT = "%Y-%m-%d"
+
+
+def _to_naive_index(index):
+    """Converte o índice para DatetimeIndex sem fuso horário e normalizado."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.normalize()
+
+
+class MarketDataStore:
+    """Histórico de dividendos/preços em SQLite, com controle de cobertura por ticker."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS dividendos (
+                    ticker TEXT NOT NULL, data TEXT NOT NULL, valor REAL NOT NULL,
+                    PRIMARY KEY (ticker, data));
+                CREATE TABLE IF NOT EXISTS precos (
+                    ticker TEXT NOT NULL, data TEXT NOT NULL, close REAL, volume REAL,
+                    PRIMARY KEY (ticker, data));
+                CREATE TABLE IF NOT EXISTS cobertura (
+                    ticker TEXT NOT NULL, tipo TEXT NOT NULL,
+                    inicio TEXT, fim TEXT NOT NULL, atualizado_em TEXT NOT NULL,
+                    PRIMARY KEY (ticker, tipo));
+            """)
+            # Agregados são derivados: a tabela do formato antigo (sem validade) é refeita
+            colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(agregados)")}
+            if colunas and "valido_ate" not in colunas:
+                conn.execute("DROP TABLE agregados")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS agregados (
+                    ticker TEXT NOT NULL, anos INTEGER NOT NULL, data_base TEXT NOT NULL,
+                    ultimo_div TEXT NOT NULL, eventos INTEGER NOT NULL, valido_ate TEXT NOT NULL,
+                    soma_12m REAL, media_anual REAL, anos_com_div INTEGER, cagr REAL,
+                    PRIMARY KEY (ticker, anos))
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # --- Cobertura ---
+
+    def get_coverage(self, ticker, tipo):
+        """Retorna (inicio, fim, atualizado_em) já armazenados ou None.
+
+        inicio None significa que o histórico completo foi baixado.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT inicio, fim, atualizado_em FROM cobertura WHERE ticker = ? AND tipo = ?",
+                (ticker, tipo)
+            ).fetchone()
+        if row is None:
+            return None
+        inicio = pd.Timestamp(row[0]) if row[0] else None
+        return inicio, pd.Timestamp(row[1]), datetime.fromisoformat(row[2])
+
+    def set_coverage(self, ticker, tipo, inicio, fim):
+        """Registra o período coberto e o momento da atualização."""
+        inicio_str = pd.Timestamp(inicio).strftime(_DATE_FMT) if inicio is not None else None
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cobertura VALUES (?, ?, ?, ?, ?)",
+                (ticker, tipo, inicio_str, pd.Timestamp(fim).strftime(_DATE_FMT),
+                 datetime.now().isoformat(timespec="seconds"))
+            )
+
+    # --- Dividendos ---
+
+    def read_dividends(self, ticker, start=None):
+        """Série de dividendos armazenada (índice sem fuso)."""
+        query = "SELECT data, valor FROM dividendos WHERE ticker = ?"
+        params = [ticker]
+        if start is not None:
+            query += " AND data >= ?"
+            params.append(pd.Timestamp(start).strftime(_DATE_FMT))
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY data", params).fetchall()
+        if not rows:
+            return pd.Series(dtype=float, name="Dividends")
+        datas, valores = zip(*rows)
+        return pd.Series(valores, index=pd.DatetimeIndex(datas), name="Dividends", dtype=float)
+
+    def append_dividends(self, ticker, dividends):
+        """Insere/atualiza eventos de dividendos do ticker."""
+        if dividends is None or len(dividends) == 0:
+            return
+        datas = _to_naive_index(dividends.index).strftime(_DATE_FMT)
+        rows = [(ticker, d, float(v)) for d, v in zip(datas, dividends.values) if pd.notna(v) and v > 0]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO dividendos VALUES (?, ?, ?)", rows)
+
+    # --- Preços ---
+
+    def read_prices(self, ticker, start=None, end=None):
+        """DataFrame com Close/Volume armazenados no intervalo pedido."""
+        query = "SELECT data, close, volume FROM precos WHERE ticker = ?"
+        params = [ticker]
+        if start is not None:
+            query += " AND data >= ?"
+            params.append(pd.Timestamp(start).strftime(_DATE_FMT))
+        if end is not None:
+            query += " AND data <= ?"
+            params.append(pd.Timestamp(end).strftime(_DATE_FMT))
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY data", params).fetchall()
+        if not rows:
+            return pd.DataFrame(columns=["Close", "Volume"], dtype=float)
+        datas, closes, volumes = zip(*rows)
+        return pd.DataFrame({"Close": closes, "Volume": volumes},
+                            index=pd.DatetimeIndex(datas), dtype=float)
+
+    @staticmethod
+    def _price_rows(ticker, prices):
+        datas = _to_naive_index(prices.index).strftime(_DATE_FMT)
+        closes = prices["Close"].values
+        volumes = prices["Volume"].values if "Volume" in prices.columns else [None] * len(prices)
+        return [
+            (ticker, d, float(c), float(v) if v is not None and pd.notna(v) else None)
+            for d, c, v in zip(datas, closes, volumes) if pd.notna(c)
+        ]
+
+    def append_prices(self, ticker, prices):
+        """Insere/atualiza fechamentos (e volume, se houver) do ticker."""
+        if prices is None or prices.empty:
+            return
+        rows = self._price_rows(ticker, prices)
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO precos VALUES (?, ?, ?, ?)", rows)
+
+    def replace_prices(self, ticker, prices):
+        """Troca todos os fechamentos do ticker pelos dados (histórico reajustado)."""
+        rows = self._price_rows(ticker, prices) if prices is not None and not prices.empty else []
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM precos WHERE ticker = ?", (ticker,))
+            conn.executemany("INSERT OR REPLACE INTO precos VALUES (?, ?, ?, ?)", rows)
+
+    # --- Agregados de dividendos (metricas_lote.compute_dividend_aggregates) ---
+
+    def save_aggregates(self, aggregates, years, data_base, validity):
+        """Grava os agregados calculados em data_base com a chave/validade de metricas_lote.aggregate_validity.
+
+        Cada ticker guarda só a versão mais recente; as vencidas são removidas.
+        """
+        if aggregates is None or aggregates.empty:
+            return
+        data_str = pd.Timestamp(data_base).strftime(_DATE_FMT)
+        validity = validity.reindex(aggregates.index)
+        rows = [
+            (str(ticker), int(years), data_str, pd.Timestamp(v.ultimo_div).strftime(_DATE_FMT),
+             int(v.eventos), pd.Timestamp(v.valido_ate).strftime(_DATE_FMT),
+             float(r.soma_12m), float(r.media_anual), int(r.anos_com_div), float(r.cagr))
+            for ticker, r, v in zip(aggregates.index, aggregates.itertuples(index=False),
+                                    validity.itertuples(index=False))
+            if pd.notna(v.valido_ate)
+        ]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO agregados VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("DELETE FROM agregados WHERE valido_ate <= ?", (data_str,))
+
+    def read_aggregates(self, years, data_base, validity):
+        """Agregados gravados que continuam valendo em data_base.
+
+        Vale a linha cujo último evento e número de eventos batem com
+        `validity` (aggregate_validity do histórico atual) e cujo prazo não venceu.
+        """
+        data_str = pd.Timestamp(data_base).strftime(_DATE_FMT)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT ticker, ultimo_div, eventos, soma_12m, media_anual, anos_com_div, cagr FROM agregados "
+                "WHERE anos = ? AND data_base <= ? AND valido_ate > ?",
+                (int(years), data_str, data_str)
+            ).fetchall()
+        aggregates = pd.DataFrame(rows, columns=["ticker", "ultimo_div", "eventos", "soma_12m", "media_anual",
+                                                 "anos_com_div", "cagr"]).set_index("ticker")
+        chave = validity.reindex(aggregates.index)
+        atual = ((chave["ultimo_div"].dt.strftime(_DATE_FMT) == aggregates["ultimo_div"])
+                 & (chave["eventos"] == aggregates["eventos"]))
+        return aggregates.loc[atual.to_numpy(), ["soma_12m", "media_anual", "anos_com_div", "cagr"]]
+
+    # --- Leitura em bloco (todo o universo armazenado) ---
+
+    def read_all_dividends(self):
+        """Todos os eventos armazenados em formato longo ticker/date/amount."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT ticker, data, valor FROM dividendos ORDER BY ticker, data").fetchall()
+        dividends = pd.DataFrame(rows, columns=["ticker", "date", "amount"])
+        dividends["date"] = pd.to_datetime(dividends["date"], format=_DATE_FMT)
+        return dividends.astype({"ticker": object, "amount": float})
+
+    def read_month_end_closes(self):
+        """Último fechamento de cada mês por ticker, em formato longo ticker/date/close."""
+        query = """
+            SELECT p.ticker, p.data, p.close FROM precos p
+            JOIN (SELECT ticker, MAX(data) AS data FROM precos
+                  WHERE close IS NOT NULL GROUP BY ticker, substr(data, 1, 7)) u
+              ON p.ticker = u.ticker AND p.data = u.data
+            ORDER BY p.ticker, p.data
+        """
+        with self._connect() as conn:
+            rows = conn.execute(query).fetchall()
+        closes = pd.DataFrame(rows, columns=["ticker", "date", "close"])
+        closes["date"] = pd.to_datetime(closes["date"], format=_DATE_FMT)
+        return closes.astype({"ticker": object, "close": float})
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_market_store():
+    """Instância compartilhada do armazém no caminho padrão."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MarketDataStore()
+        return _default_store
+
+
+def _is_fresh(atualizado_em, refresh_after=REFRESH_AFTER):
+    return datetime.now() - atualizado_em < refresh_after
+
+
+def covers_recent(coverage, start, refresh_after=REFRESH_AFTER):
+    """Indica se a cobertura começa até `start` e foi atualizada recentemente."""
+    if coverage is None:
+        return False
+    inicio, _, atualizado_em = coverage
+    return (inicio is None or inicio <= pd.Timestamp(start)) and _is_fresh(atualizado_em, refresh_after)
+
+
+def delta_start(coverage, start):
+    """Data a partir da qual é preciso buscar para completar a cobertura até hoje."""
+    start = pd.Timestamp(start)
+    if coverage is None:
+        return start
+    inicio, fim, _ = coverage
+    if inicio is not None and inicio > start:
+        return start
+    return max(start, fim - DELTA_OVERLAP)
+
+
+def adjustment_changed(stored, delta, tolerancia=AJUSTE_TOLERANCIA):
+    """Indica se os fechamentos ajustados do delta estão em outra base que os armazenados.
+
+    Compara os pregões em comum (a sobreposição DELTA_OVERLAP); um provento ou
+    desdobramento novo reajusta todos eles.
+    """
+    if stored is None or delta is None or stored.empty or delta.empty:
+        return False
+    antes = stored["Close"].groupby(level=0).last()
+    depois = delta["Close"].copy()
+    depois.index = _to_naive_index(depois.index)
+    depois = depois.groupby(level=0).last()
+    comuns = antes.index.intersection(depois.index)
+    if comuns.empty:
+        return False
+    antes, depois = antes.loc[comuns], depois.loc[comuns]
+    return bool(((depois - antes).abs() > tolerancia * antes.abs()).any())
+
+
+def get_dividends_incremental(store, ticker, fetch_full, fetch_since, start=None,
+                              refresh_after=REFRESH_AFTER):
+    """Dividendos do ticker lidos do disco, completando apenas o delta.
+
+    fetch_full() devolve o histórico completo; fetch_since(data) devolve os
+    eventos a partir de `data`. Se a busca falhar, o que houver em disco é
+    retornado.
+    """
+    coverage = store.get_coverage(ticker, "dividendos")
+    today = pd.Timestamp(datetime.today()).normalize()
+
+    try:
+        if coverage is None or (coverage[0] is not None and start is not None
+                                and coverage[0] > pd.Timestamp(start)):
+            # Nada armazenado (ou cobertura curta demais): baixar tudo
+            novos = fetch_full()
+            if novos is not None:
+                store.append_dividends(ticker, novos)
+                store.set_coverage(ticker, "dividendos", None, today)
+        elif not _is_fresh(coverage[2], refresh_after):
+            novos = fetch_since(coverage[1] - DELTA_OVERLAP)
+            if novos is not None:
+                store.append_dividends(ticker, novos)
+                store.set_coverage(ticker, "dividendos", coverage[0], today)
+    except Exception:
+        pass
+
+    return store.read_dividends(ticker, start)
+
+
+def get_prices_incremental(store, ticker, start, end, fetch_range, refresh_after=REFRESH_AFTER):
+    """Fechamentos do ticker entre start e end, buscando só os trechos faltantes.
+
+    fetch_range(inicio, fim) devolve um DataFrame com Close (e Volume), vazio
+    se a fonte confirmou que não há pregões no trecho, ou None se a busca
+    falhou; trechos que falharam não entram na cobertura e são tentados de
+    novo na próxima chamada. Se um trecho novo estiver em outra base de
+    ajuste que o armazenado, o período coberto inteiro é baixado de novo e
+    substitui o que há em disco.
+    """
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    coverage = store.get_coverage(ticker, "precos")
+
+    try:
+        if coverage is None:
+            precos = fetch_range(start, end)
+            if precos is not None:
+                store.append_prices(ticker, precos)
+                store.set_coverage(ticker, "precos", start, end)
+        else:
+            inicio, fim, atualizado_em = coverage
+            novo_inicio, novo_fim = inicio, fim
+            trechos = []
+
+            if inicio is not None and start < inicio:
+                trecho = fetch_range(start, inicio)
+                if trecho is not None:
+                    trechos.append(trecho)
+                    novo_inicio = start
+
+            if end > fim or (end == fim and not _is_fresh(atualizado_em, refresh_after)):
+                trecho = fetch_range(fim - DELTA_OVERLAP, end)
+                if trecho is not None:
+                    trechos.append(trecho)
+                    novo_fim = end
+
+            if trechos:
+                armazenados = store.read_prices(ticker)
+                if any(adjustment_changed(armazenados, trecho) for trecho in trechos):
+                    # Provento/desdobramento novo: o histórico inteiro muda de base
+                    novo_inicio = novo_inicio if novo_inicio is not None else start
+                    completo = fetch_range(novo_inicio, novo_fim)
+                    if completo is not None and not completo.empty:
+                        store.replace_prices(ticker, completo)
+                        store.set_coverage(ticker, "precos", novo_inicio, novo_fim)
+                else:
+                    for trecho in trechos:
+                        store.append_prices(ticker, trecho)
+                    store.set_coverage(ticker, "precos", novo_inicio, novo_fim)
+    except Exception:
+        pass
+
+    return store.read_prices(ticker, start, end)
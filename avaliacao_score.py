@@ -0,0 +1,315 @@
+"""
+Avaliação walk-forward dos pesos do score composto.
+
+Os pesos do score (DY 40%, consistência 30%, CAGR limitado 30%) nunca
+foram validados. Aqui, para cada fim de mês do histórico, o ranking é
+recalculado só com o que se sabia naquela data (dividendos com ex-date até
+o fim do mês e o último fechamento do mês), o portfólio é montado com
+optimize_portfolio (modo proporcional, o único que usa o score) e mede-se
+a renda de dividendos efetivamente paga nos 12 meses seguintes, para cada
+combinação de pesos de uma grade.
+
+Os dados vêm do armazém local (ou do mercado sintético) e são carregados
+uma vez num WalkForwardPanel: fechamentos de fim de mês e a renda futura
+de 12 meses por ação em matrizes (meses × tickers), mais os dividendos em
+formato longo. Os meses são distribuídos num pool de processos; cada
+processo recebe o painel uma única vez (initializer) e, por mês, calcula os
+agregados de dividendos uma vez e apenas o score por combinação de pesos.
+
+Os fechamentos do Yahoo vêm ajustados por dividendos; com
+precos_ajustados=True eles são trazidos de volta para preços de mercado
+aproximados (mesma conversão do backtest, na granularidade mensal), senão o
+DY histórico ficaria inflado.
+
+Uso:
+    python avaliacao_score.py [--anos 5] [--passo 0.1] [--anos-avaliacao 10] [--processos N]
+    python avaliacao_score.py --sintetico 500 --anos-avaliacao 5
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from armazem_dados import DATA_DIR, get_market_store
+from backtest_carteira import unadjust_prices
+from metricas_lote import SCORE_WEIGHTS, composite_score, compute_dividend_aggregates, metrics_from_aggregates
+from otimizador_carteira import optimize_portfolio
+from universo_b3 import categorize_ticker
+
+AVALIACAO_DIR = os.path.join(DATA_DIR, "avaliacao")
+DEFAULT_STEP = 0.1
+DEFAULT_CAPITAL = 100000.0
+DEFAULT_LOTE = 100
+# Meses de histórico antes do primeiro fim de mês avaliado
+MIN_HISTORY_MONTHS = 12
+FORWARD_MONTHS = 12
+
+
+def weight_grid(passo=DEFAULT_STEP):
+    """Combinações de pesos (dy, consistencia, cagr) >= 0 que somam 1, incluindo SCORE_WEIGHTS."""
+    n = int(round(1 / passo))
+    grade = [{'dy': round(i / n, 4), 'consistencia': round(j / n, 4), 'cagr': round((n - i - j) / n, 4)}
+             for i in range(n + 1) for j in range(n + 1 - i)]
+    atual = {k: round(v, 4) for k, v in SCORE_WEIGHTS.items()}
+    if atual not in grade:
+        grade.append(atual)
+    return grade
+
+
+class WalkForwardPanel:
+    """Fechamentos mensais, renda futura e dividendos do universo (imutável, enviado aos processos)."""
+
+    def __init__(self, closes_long, dividends_long, info=None, precos_ajustados=False, fim=None):
+        closes_long = closes_long.dropna(subset=['close'])
+        closes_long = closes_long[closes_long['close'] > 0]
+        self.dividendos = dividends_long[dividends_long['amount'] > 0].reset_index(drop=True)
+
+        meses_close = closes_long['date'].dt.to_period('M')
+        self.meses = pd.period_range(meses_close.min(), meses_close.max(), freq='M')
+        self.tickers = pd.Index(closes_long['ticker'].unique())
+        self.datas = self.meses.to_timestamp(how='end').normalize()
+
+        linhas = self.meses.get_indexer(meses_close)
+        colunas = self.tickers.get_indexer(closes_long['ticker'])
+        precos = np.full((len(self.meses), len(self.tickers)), np.nan)
+        precos[linhas, colunas] = closes_long['close'].to_numpy(dtype=float)
+
+        # Dividendos por ação somados por mês (ex-date), só dos tickers com preço
+        dividendos = self.dividendos
+        d_linhas = self.meses.get_indexer(dividendos['date'].dt.to_period('M'))
+        d_colunas = self.tickers.get_indexer(dividendos['ticker'])
+        dentro = (d_linhas >= 0) & (d_colunas >= 0)
+        mensal = np.zeros_like(precos)
+        np.add.at(mensal, (d_linhas[dentro], d_colunas[dentro]), dividendos['amount'].to_numpy()[dentro])
+
+        self.precos = unadjust_prices(precos, mensal) if precos_ajustados else precos
+
+        # Renda por ação nos 12 meses seguintes a cada fim de mês (m+1 .. m+12)
+        acumulado = np.vstack([np.zeros((1, len(self.tickers))), np.cumsum(mensal, axis=0)])
+        self.renda_futura = np.full_like(precos, np.nan)
+        n_futuros = len(self.meses) - FORWARD_MONTHS
+        if n_futuros > 0:
+            self.renda_futura[:n_futuros] = (acumulado[FORWARD_MONTHS + 1:] - acumulado[1:n_futuros + 1])
+
+        # Último mês completo: o mês da data final só conta se ela for o fim do mês
+        fim = pd.Timestamp(fim if fim is not None else closes_long['date'].max()).normalize()
+        self.ultimo_completo = len(self.meses) - 1 if fim >= self.datas[-1] else len(self.meses) - 2
+
+        # Nome e setor do snapshot/metadados, quando houver; categoria pelo código, como no download
+        info = info.reindex(self.tickers) if info is not None else pd.DataFrame(index=self.tickers)
+        vazio = pd.Series(np.nan, index=self.tickers, dtype=object)
+        self.info = pd.DataFrame({
+            'ticker': self.tickers,
+            'nome': info.get('nome', vazio).fillna(pd.Series(self.tickers, index=self.tickers)),
+            'categoria': [categorize_ticker(t) for t in self.tickers],
+            'setor': info.get('setor', vazio).fillna('N/A')
+        }, index=self.tickers)
+
+    @classmethod
+    def from_store(cls, store=None, info=None):
+        """Painel com tudo o que está no armazém local (fechamentos ajustados do Yahoo)."""
+        store = store or get_market_store()
+        return cls(store.read_month_end_closes(), store.read_all_dividends(), info, precos_ajustados=True)
+
+    @classmethod
+    def from_market(cls, market):
+        """Painel a partir de dados_sinteticos.SyntheticMarket (preços já de mercado)."""
+        closes, dividendos = [], []
+        for ticker in market.tickers:
+            frame = market.frame(ticker)
+            mensal = frame['Close'].groupby(frame.index.to_period('M')).tail(1)
+            closes.append(pd.DataFrame({'ticker': ticker, 'date': mensal.index, 'close': mensal.to_numpy()}))
+            eventos = market.dividends(ticker)
+            dividendos.append(pd.DataFrame({'ticker': ticker, 'date': eventos.index, 'amount': eventos.to_numpy()}))
+        info = pd.DataFrame([{'ticker': t, **market.metadata(t)} for t in market.tickers]).set_index('ticker')
+        info = info.rename(columns={'nome_longo': 'nome'})
+        return cls(pd.concat(closes, ignore_index=True), pd.concat(dividendos, ignore_index=True), info,
+                   fim=market.end)
+
+    def evaluation_positions(self, meses_avaliacao=None):
+        """Posições dos fins de mês com histórico mínimo e 12 meses completos à frente."""
+        ultimo = self.ultimo_completo - FORWARD_MONTHS
+        posicoes = np.arange(MIN_HISTORY_MONTHS, ultimo + 1)
+        if meses_avaliacao is not None:
+            posicoes = posicoes[-meses_avaliacao:]
+        return posicoes
+
+
+def evaluate_month(painel, posicao, grade, years=5, capital=DEFAULT_CAPITAL, lote_minimo=DEFAULT_LOTE,
+                   dy_minimo=0.0):
+    """Resultado de cada combinação de pesos para o portfólio montado no fim do mês `posicao`."""
+    as_of = painel.datas[posicao]
+    precos = pd.Series(painel.precos[posicao], index=painel.tickers).dropna()
+    agregados = compute_dividend_aggregates(painel.dividendos, years, as_of)
+    metricas = metrics_from_aggregates(agregados, precos, years)
+    metricas = metricas[metricas['dy_12m'] >= dy_minimo]
+    if metricas.empty:
+        return []
+
+    ranking = pd.concat([painel.info.loc[metricas.index], metricas], axis=1).reset_index(drop=True)
+    ranking['preco'] = precos.loc[metricas.index].to_numpy()
+    renda_futura = pd.Series(painel.renda_futura[posicao], index=painel.tickers)
+
+    # Componentes do score sem arredondamento, como em metrics_from_aggregates
+    elegiveis = agregados.loc[metricas.index]
+    dy_12m = elegiveis['soma_12m'].to_numpy(dtype=float) / ranking['preco'].to_numpy() * 100
+    consistencia = elegiveis['anos_com_div'].to_numpy(dtype=float) / years * 100
+    cagr = elegiveis['cagr'].to_numpy(dtype=float)
+
+    resultados = []
+    for pesos in grade:
+        ranking['score'] = np.round(composite_score(dy_12m, consistencia, cagr, pesos), 2)
+        portfolio = optimize_portfolio(ranking, capital, lote_minimo, 'proporcional')
+        if portfolio is None:
+            continue
+        valor_investido = portfolio['valor_investido'].sum()
+        renda = (portfolio['quantidade'] * renda_futura.loc[portfolio['ticker']].to_numpy()).sum()
+        resultados.append({
+            'data': as_of,
+            'peso_dy': pesos['dy'],
+            'peso_consistencia': pesos['consistencia'],
+            'peso_cagr': pesos['cagr'],
+            'n_ativos': len(portfolio),
+            'valor_investido': valor_investido,
+            'dy_esperado': (portfolio['valor_investido'] * portfolio['dy_12m']).sum() / valor_investido,
+            'renda_12m': renda,
+            'yield_realizado': renda / valor_investido * 100
+        })
+    return resultados
+
+
+# --- Pool de processos: o painel vai uma vez para cada processo ---
+
+_painel_worker = None
+
+
+def _init_worker(painel):
+    global _painel_worker
+    _painel_worker = painel
+
+
+def _evaluate_in_worker(args):
+    return evaluate_month(_painel_worker, *args)
+
+
+def run_walk_forward(painel, grade=None, years=5, meses_avaliacao=None, capital=DEFAULT_CAPITAL,
+                     lote_minimo=DEFAULT_LOTE, dy_minimo=0.0, processos=None, on_progress=None):
+    """Avalia a grade de pesos em todos os fins de mês. Retorna DataFrame (mês × combinação).
+
+    processos=None usa os.cpu_count(); 1 roda no próprio processo.
+    on_progress(concluidos, total) é chamado a cada mês avaliado.
+    """
+    grade = grade or weight_grid()
+    posicoes = painel.evaluation_positions(meses_avaliacao)
+    tarefas = [(int(p), grade, years, capital, lote_minimo, dy_minimo) for p in posicoes]
+    processos = processos or os.cpu_count() or 1
+
+    linhas = []
+    if processos > 1 and len(tarefas) > 1:
+        with ProcessPoolExecutor(max_workers=min(processos, len(tarefas)),
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(painel,)) as executor:
+            for concluidos, resultado in enumerate(executor.map(_evaluate_in_worker, tarefas), 1):
+                linhas.extend(resultado)
+                if on_progress:
+                    on_progress(concluidos, len(tarefas))
+    else:
+        for concluidos, tarefa in enumerate(tarefas, 1):
+            linhas.extend(evaluate_month(painel, *tarefa))
+            if on_progress:
+                on_progress(concluidos, len(tarefas))
+
+    return pd.DataFrame(linhas)
+
+
+def summarize_walk_forward(resultados):
+    """Resumo por combinação de pesos, ordenado pelo yield realizado médio.
+
+    vitorias_vs_atual é a fração dos meses em que a combinação rendeu mais que SCORE_WEIGHTS.
+    """
+    if resultados is None or resultados.empty:
+        return pd.DataFrame()
+    pesos = ['peso_dy', 'peso_consistencia', 'peso_cagr']
+    resumo = resultados.groupby(pesos)['yield_realizado'].agg(
+        meses='count', yield_medio='mean', yield_mediano='median', yield_desvio='std', yield_minimo='min'
+    )
+    resumo['dy_esperado_medio'] = resultados.groupby(pesos)['dy_esperado'].mean()
+
+    atual = tuple(round(SCORE_WEIGHTS[k], 4) for k in ('dy', 'consistencia', 'cagr'))
+    por_mes = resultados.pivot_table(index='data', columns=pesos, values='yield_realizado')
+    if atual in por_mes.columns:
+        resumo['vitorias_vs_atual'] = por_mes.gt(por_mes[atual], axis=0).mean().reindex(resumo.index)
+    resumo['atual'] = [pesos_linha == atual for pesos_linha in resumo.index]
+    return resumo.sort_values('yield_medio', ascending=False).reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Avaliação walk-forward dos pesos do score de dividendos.")
+    parser.add_argument("--anos", type=int, default=5, help="Anos de histórico de dividendos do score")
+    parser.add_argument("--passo", type=float, default=DEFAULT_STEP, help="Passo da grade de pesos")
+    parser.add_argument("--anos-avaliacao", type=int, default=10, help="Anos de fins de mês avaliados")
+    parser.add_argument("--capital", type=float, default=DEFAULT_CAPITAL)
+    parser.add_argument("--lote", type=int, default=DEFAULT_LOTE, help="Lote mínimo de ações")
+    parser.add_argument("--dy-minimo", type=float, default=0.0, help="DY mínimo para seleção (%%)")
+    parser.add_argument("--processos", type=int, default=None, help="Processos (padrão: CPUs)")
+    parser.add_argument("--sintetico", type=int, default=None, metavar="N",
+                        help="Usar N tickers do mercado sintético em vez do armazém local")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    inicio = time.time()
+    if args.sintetico:
+        from dados_sinteticos import SyntheticMarket
+        painel = WalkForwardPanel.from_market(
+            SyntheticMarket(args.sintetico, args.anos_avaliacao + 2, args.seed))
+    else:
+        # Nome, categoria e setor do snapshot mais recente, se houver
+        from snapshot_ranking import load_latest_snapshot
+        snapshot = load_latest_snapshot()
+        info = snapshot['ranking'].set_index('ticker')[['nome', 'categoria', 'setor']] if snapshot else None
+        painel = WalkForwardPanel.from_store(info=info)
+
+    if len(painel.tickers) == 0:
+        print("Nenhum preço no armazém local; rode snapshot_ranking.py primeiro.", file=sys.stderr)
+        return 1
+
+    grade = weight_grid(args.passo)
+    n_meses = len(painel.evaluation_positions(args.anos_avaliacao * 12))
+    print(f"{len(painel.tickers)} tickers, {n_meses} fins de mês, {len(grade)} combinações de pesos", flush=True)
+
+    def on_progress(concluidos, total):
+        if concluidos % 12 == 0 or concluidos == total:
+            print(f"[{concluidos}/{total}] meses avaliados", flush=True)
+
+    resultados = run_walk_forward(painel, grade, args.anos, args.anos_avaliacao * 12, args.capital, args.lote,
+                                  args.dy_minimo, args.processos, on_progress)
+    resumo = summarize_walk_forward(resultados)
+    if resumo.empty:
+        print("Nenhum mês avaliado (histórico insuficiente).", file=sys.stderr)
+        return 1
+
+    os.makedirs(AVALIACAO_DIR, exist_ok=True)
+    carimbo = datetime.now().strftime("%Y%m%d_%H%M%S")
+    resultados.to_csv(os.path.join(AVALIACAO_DIR, f"walk_forward_{carimbo}.csv"), index=False)
+    path = os.path.join(AVALIACAO_DIR, f"walk_forward_{carimbo}_resumo.csv")
+    resumo.to_csv(path, index=False)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(resumo.head(10).round(3).to_string(index=False))
+        atual = resumo[resumo['atual']]
+        if not atual.empty:
+            print(f"\nPesos atuais: posição {atual.index[0] + 1} de {len(resumo)}, "
+                  f"yield médio {atual['yield_medio'].iloc[0]:.2f}%")
+    print(f"\nResumo gravado em {path} ({time.time() - inicio:.0f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Backtest de retorno total do portfólio sobre o histórico diário de preços.
+
+simulate_portfolio_history soma os dividendos passados vezes as quantidades
+de hoje e ignora a variação de preço. Aqui o portfólio é comprado no
+primeiro pregão da janela com os pesos de optimize_portfolio e carregado
+dia a dia sobre matrizes (datas × ativos) de fechamentos e de dividendos
+por ação no ex-date, com:
+
+- reinvestimento (DRIP) no fechamento do ex-date, no próprio ativo, ou
+  dividendos acumulados em caixa;
+- rebalanceamento opcional aos pesos-alvo no primeiro pregão de cada mês,
+  trimestre ou ano.
+
+As quantidades só mudam em dias de evento (compra, rebalanceamento,
+dividendo com DRIP); o laço percorre apenas esses dias, com operações
+vetoriais sobre todos os ativos, e a curva diária sai de uma vez do
+produto quantidades × preços.
+
+Os fechamentos do Yahoo (auto_adjust) já embutem os dividendos; com
+precos_ajustados=True eles são convertidos de volta para preços de
+mercado antes do DRIP, para não contar os proventos duas vezes.
+"""
+
+import numpy as np
+import pandas as pd
+
+REBALANCE_FREQUENCIES = {'Mensal': 'M', 'Trimestral': 'Q', 'Anual': 'Y'}
+TRADING_DAYS = 252
+
+
+def matrices_from_frames(frames, tickers=None, start=None):
+    """Matrizes (preços, dividendos) datas × tickers a partir de frames Close/Dividends (download_batch)."""
+    tickers = [t for t in (tickers if tickers is not None else frames) if t in frames]
+    if not tickers:
+        return pd.DataFrame(), pd.DataFrame()
+    precos = pd.DataFrame({t: frames[t]['Close'] for t in tickers}).sort_index()
+    dividendos = pd.DataFrame({t: frames[t]['Dividends'] for t in tickers}).reindex(precos.index).fillna(0.0)
+    if start is not None:
+        manter = precos.index >= pd.Timestamp(start)
+        precos, dividendos = precos[manter], dividendos[manter]
+    return precos, dividendos
+
+
+def unadjust_prices(precos, dividendos):
+    """Preços de mercado a partir de fechamentos ajustados por dividendos (arrays datas × ativos).
+
+    O Yahoo multiplica os preços anteriores a cada ex-date e por (1 - d_e / P_{e-1});
+    o inverso do fator acumulado é 1 + soma, para os ex-dates seguintes, de d_e / P_ajustado_{e-1}.
+    """
+    razao = np.zeros_like(precos)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        razao[1:] = dividendos[1:] / precos[:-1]
+    razao = np.nan_to_num(razao, nan=0.0, posinf=0.0, neginf=0.0)
+    posteriores = np.zeros_like(precos)
+    posteriores[:-1] = np.cumsum(razao[::-1], axis=0)[::-1][1:]
+    return precos * (1 + posteriores)
+
+
+def portfolio_weights(portfolio_df):
+    """Pesos-alvo por ticker (valor investido de optimize_portfolio, normalizado)."""
+    valores = portfolio_df.groupby('ticker', sort=False)['valor_investido'].sum()
+    return valores / valores.sum()
+
+
+def _rebalance_days(datas, frequencia):
+    if not frequencia:
+        return np.array([], dtype=np.int64)
+    periodos = datas.to_period(REBALANCE_FREQUENCIES.get(frequencia, frequencia))
+    return np.flatnonzero(np.r_[False, periodos[1:] != periodos[:-1]])
+
+
+def _target_quantities(total, pesos, precos_dia):
+    """Quantidades que distribuem `total` pelos pesos entre os ativos com preço no dia."""
+    negociaveis = np.isfinite(precos_dia) & (precos_dia > 0)
+    alvo = np.where(negociaveis, pesos, 0.0)
+    if alvo.sum() <= 0:
+        return None
+    alvo = alvo / alvo.sum()
+    return np.divide(total * alvo, precos_dia, out=np.zeros_like(alvo), where=negociaveis)
+
+
+def backtest_portfolio(precos, dividendos, pesos, capital_inicial=100000.0, reinvestir=True,
+                       rebalanceamento=None, precos_ajustados=False):
+    """Simula o portfólio dia a dia e retorna a curva de patrimônio.
+
+    precos/dividendos: DataFrames datas × tickers (dividendos por ação no ex-date, 0 nos demais dias).
+    pesos: Series ticker -> peso alvo. rebalanceamento: None, 'Mensal', 'Trimestral' ou 'Anual'.
+    Frações de cotas são permitidas. Retorna DataFrame indexado por data com valor, caixa,
+    dividendos (recebidos no dia), dividendos_acumulados e retorno_acumulado (%).
+    """
+    pesos = pd.Series(pesos, dtype=float)
+    tickers = [t for t in pesos.index if t in precos.columns]
+    if not tickers or precos.empty:
+        return pd.DataFrame()
+
+    datas = pd.DatetimeIndex(precos.index)
+    P = precos[tickers].ffill().to_numpy(dtype=float)
+    D = dividendos.reindex(index=datas, columns=tickers).fillna(0.0).to_numpy(dtype=float)
+    if precos_ajustados:
+        P = unadjust_prices(P, D)
+    w = pesos[tickers].to_numpy(dtype=float)
+    n_dias, n_ativos = P.shape
+
+    # Dias de evento: compra inicial, rebalanceamentos e (com DRIP) ex-dates
+    eventos = {0} | set(_rebalance_days(datas, rebalanceamento).tolist())
+    if reinvestir:
+        eventos |= set(np.flatnonzero((D > 0).any(axis=1)).tolist())
+    eventos = np.array(sorted(eventos))
+    rebalancear = np.zeros(n_dias, dtype=bool)
+    rebalancear[_rebalance_days(datas, rebalanceamento)] = True
+
+    Q = np.zeros((len(eventos), n_ativos))
+    C = np.zeros(len(eventos))
+    q = np.zeros(n_ativos)
+    caixa = float(capital_inicial)
+    anterior = None
+
+    for j, t in enumerate(eventos):
+        if anterior is not None:
+            # Dividendos dos ex-dates em (anterior, t] pertencem às cotas mantidas desde o último evento
+            recebidos = np.nan_to_num(D[anterior + 1:t + 1] * q)
+            if reinvestir:
+                negociaveis = np.isfinite(P[t]) & (P[t] > 0)
+                q = q + np.divide(recebidos[-1], P[t], out=np.zeros(n_ativos), where=negociaveis)
+                caixa += recebidos[-1][~negociaveis].sum() + recebidos[:-1].sum()
+            else:
+                caixa += recebidos.sum()
+
+        if anterior is None or rebalancear[t]:
+            total = caixa + np.nansum(q * P[t])
+            novas = _target_quantities(total, w, P[t])
+            if novas is not None:
+                q, caixa = novas, 0.0
+
+        Q[j], C[j] = q, caixa
+        anterior = t
+
+    # Curva diária: quantidades/caixa do último evento até cada dia
+    segmento = np.searchsorted(eventos, np.arange(n_dias), side='right') - 1
+    Qd = Q[segmento]
+    recebidos = np.zeros(n_dias)
+    recebidos[1:] = np.nansum(Qd[:-1] * D[1:], axis=1)
+    caixa_dia = C[segmento]
+    if not reinvestir:
+        acumulado = np.cumsum(recebidos)
+        caixa_dia = caixa_dia + acumulado - acumulado[eventos[segmento]]
+
+    valor = np.nansum(Qd * P, axis=1) + caixa_dia
+    curva = pd.DataFrame({
+        'valor': valor,
+        'caixa': caixa_dia,
+        'dividendos': recebidos,
+        'dividendos_acumulados': np.cumsum(recebidos),
+        'retorno_acumulado': (valor / capital_inicial - 1) * 100
+    }, index=datas)
+    curva.index.name = 'data'
+    return curva
+
+
+def backtest_summary(curva):
+    """Retorno total, CAGR, volatilidade anualizada, máximo drawdown (%) e dividendos recebidos."""
+    if curva is None or curva.empty:
+        return None
+    valor = curva['valor']
+    anos = max((curva.index[-1] - curva.index[0]).days / 365.25, 1 / 365.25)
+    retornos = valor.pct_change().dropna()
+    drawdown = valor / valor.cummax() - 1
+    return {
+        'retorno_total': (valor.iloc[-1] / valor.iloc[0] - 1) * 100,
+        'cagr': ((valor.iloc[-1] / valor.iloc[0]) ** (1 / anos) - 1) * 100,
+        'volatilidade': retornos.std() * np.sqrt(TRADING_DAYS) * 100,
+        'max_drawdown': drawdown.min() * 100,
+        'dividendos_totais': curva['dividendos'].sum()
+    }
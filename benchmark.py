@@ -0,0 +1,198 @@
+"""
+Benchmark dos caminhos críticos com dados sintéticos (sem rede).
+
+Mede, em várias escalas de universo, o tempo de cada etapa usada pelos apps:
+análise/ranking (o pipeline de analyze_selected_stocks), optimize_portfolio,
+simulate_portfolio_history, create_dividend_calendar, a projeção de renda
+por Monte Carlo, o backtest de retorno total e os cálculos da análise aprofundada (dividendos anuais e
+calculate_historical_dy).
+
+Os dados vêm de dados_sinteticos.SyntheticMarket, com semente fixa. Cada
+execução acrescenta uma linha por etapa/escala em
+dados/benchmarks/resultados.jsonl; etapas mais lentas que `--limite` vezes
+a execução anterior na mesma máquina são reportadas como regressão e o
+processo termina com código 1.
+
+Uso:
+    python benchmark.py [--escalas 10 450 5000] [--anos 5] [--repeticoes 3] [--limite 1.5]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analise_historica import annual_dividends_frame, calculate_historical_dy
+from armazem_dados import DATA_DIR
+from backtest_carteira import matrices_from_frames, backtest_portfolio
+from dados_sinteticos import SyntheticMarket
+from motor_analise import DEFAULT_MAX_WORKERS
+from otimizador_carteira import optimize_portfolio
+from projecao_renda import project_income, DEFAULT_PATHS, MAX_HORIZON_YEARS
+from simulacao_carteira import simulate_portfolio_history, create_dividend_calendar
+from snapshot_ranking import run_ranking_analysis
+
+DEFAULT_ESCALAS = [10, 450, 5000]
+BENCHMARK_DIR = os.path.join(DATA_DIR, "benchmarks")
+RESULTADOS_FILE = "resultados.jsonl"
+CAPITAL_BENCHMARK = 100000.0
+POSICOES_PROJECAO = 500
+ATIVOS_BACKTEST = 50
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _time_stage(fn, repeticoes):
+    """Melhor tempo (s) entre as repetições e o resultado da última chamada."""
+    melhor = float('inf')
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = fn()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def run_benchmark(n_tickers, years=5, repeticoes=3, seed=42, max_workers=DEFAULT_MAX_WORKERS):
+    """Executa todas as etapas para um universo de n_tickers. Retorna dict etapa -> segundos."""
+    tempos = {}
+
+    tempos['gerar_dados'], market = _time_stage(lambda: SyntheticMarket(n_tickers, years, seed), 1)
+
+    tempos['analyze_selected_stocks'], (df_ranking, _) = _time_stage(
+        lambda: run_ranking_analysis(market.tickers, years, max_workers,
+                                     download_fn=market.download, metadata_fn=market.metadata),
+        repeticoes
+    )
+
+    for modo in ('proporcional', 'renda'):
+        tempos[f'optimize_portfolio[{modo}]'], _ = _time_stage(
+            lambda: optimize_portfolio(df_ranking, CAPITAL_BENCHMARK, modo=modo), repeticoes
+        )
+
+    # Simulação e calendário sobre o universo inteiro, para a escala refletir N
+    carteira = df_ranking.assign(quantidade=100)
+    tempos['simulate_portfolio_history'], _ = _time_stage(
+        lambda: simulate_portfolio_history(carteira, years), repeticoes
+    )
+    tempos['create_dividend_calendar'], _ = _time_stage(
+        lambda: create_dividend_calendar(carteira), repeticoes
+    )
+    tempos['project_income'], _ = _time_stage(
+        lambda: project_income(carteira.head(POSICOES_PROJECAO), MAX_HORIZON_YEARS, DEFAULT_PATHS, seed=seed,
+                               usar_processos=False),
+        repeticoes
+    )
+
+    # Backtest diário com DRIP e rebalanceamento trimestral
+    ativos = market.tickers[:ATIVOS_BACKTEST]
+    precos_bt, dividendos_bt = matrices_from_frames({t: market.frame(t) for t in ativos})
+    pesos_bt = pd.Series(1.0 / len(ativos), index=ativos)
+    tempos['backtest_portfolio'], _ = _time_stage(
+        lambda: backtest_portfolio(precos_bt, dividendos_bt, pesos_bt, CAPITAL_BENCHMARK,
+                                   reinvestir=True, rebalanceamento='Trimestral'),
+        repeticoes
+    )
+
+    # Análise aprofundada (app backup), ticker a ticker como no app
+    fim = market.end
+    inicio = fim - timedelta(days=years*365)
+    dividendos = {t: market.dividends(t) for t in market.tickers}
+    precos = {t: market.prices(t, inicio - timedelta(days=400), fim) for t in market.tickers}
+
+    tempos['annual_dividends_frame'], anuais = _time_stage(
+        lambda: {t: annual_dividends_frame(dividendos[t], inicio, fim) for t in market.tickers}, repeticoes
+    )
+    tempos['calculate_historical_dy'], _ = _time_stage(
+        lambda: [calculate_historical_dy(anuais[t], precos[t]) for t in market.tickers], repeticoes
+    )
+
+    return tempos
+
+
+def load_results(path):
+    """Linhas já registradas no arquivo de resultados."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def find_regressions(anteriores, atuais, limite):
+    """Compara cada etapa com a última medição da mesma etapa/escala/anos/máquina."""
+    ultimo = {}
+    for r in anteriores:
+        ultimo[(r['etapa'], r['n_tickers'], r['anos'], r['maquina'])] = r['segundos']
+
+    regressoes = []
+    for r in atuais:
+        if r['etapa'] == 'gerar_dados':
+            continue
+        base = ultimo.get((r['etapa'], r['n_tickers'], r['anos'], r['maquina']))
+        # Abaixo de 5 ms a variação é ruído
+        if base is not None and r['segundos'] > max(base * limite, 0.005):
+            regressoes.append((r, base))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos críticos com dados sintéticos.")
+    parser.add_argument("--escalas", type=int, nargs="+", default=DEFAULT_ESCALAS, help="Tamanhos do universo")
+    parser.add_argument("--anos", type=int, default=5, help="Anos de histórico")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições por etapa (vale o melhor tempo)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--limite", type=float, default=1.5, help="Fator de lentidão considerado regressão")
+    parser.add_argument("--saida", default=BENCHMARK_DIR, help="Diretório dos resultados")
+    parser.add_argument("--nao-gravar", action="store_true", help="Apenas mede e compara, sem registrar")
+    args = parser.parse_args(argv)
+
+    caminho = os.path.join(args.saida, RESULTADOS_FILE)
+    anteriores = load_results(caminho)
+    contexto = {
+        'executado_em': datetime.now().isoformat(timespec="seconds"),
+        'commit': _git_commit(),
+        'maquina': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'anos': args.anos,
+        'seed': args.seed,
+    }
+
+    atuais = []
+    for n in args.escalas:
+        tempos = run_benchmark(n, args.anos, args.repeticoes, args.seed, args.workers)
+        for etapa, segundos in tempos.items():
+            print(f"{n:>6} tickers  {etapa:<34} {segundos * 1000:>10.1f} ms", flush=True)
+            atuais.append({**contexto, 'etapa': etapa, 'n_tickers': n, 'segundos': round(segundos, 6)})
+
+    if not args.nao_gravar:
+        os.makedirs(args.saida, exist_ok=True)
+        with open(caminho, "a", encoding="utf-8") as f:
+            for r in atuais:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        print(f"Resultados gravados em {caminho}")
+
+    regressoes = find_regressions(anteriores, atuais, args.limite)
+    for r, base in regressoes:
+        print(f"REGRESSÃO: {r['etapa']} ({r['n_tickers']} tickers) {base * 1000:.1f} ms -> "
+              f"{r['segundos'] * 1000:.1f} ms", file=sys.stderr)
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
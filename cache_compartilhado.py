@@ -0,0 +1,503 @@
+"""
+Cache compartilhado entre sessões, réplicas e reinícios do app.
+
+st.cache_data vive dentro de um processo: com várias réplicas do Streamlit
+atrás de um balanceador, cada uma baixa de novo os mesmos tickers. Este
+módulo oferece o decorator `shared_cache`, com duas camadas:
+
+- memória: LRU limitado pelo tamanho (bytes serializados) dos valores;
+- compartilhada: SQLite em disco (padrão) ou um servidor Redis, escolhido
+  pela variável DIVIDENDOS_CACHE_URL (ex.: redis://cache:6379/0).
+
+Como no st.cache_data, parâmetros iniciados com "_" não entram na chave e
+cada leitura devolve uma cópia do valor. Os contadores de acertos/faltas
+ficam em `cache_stats()`.
+
+Os valores são pickles; quem escreve na camada compartilhada poderia
+executar código em todas as réplicas. Por isso cada entrada compartilhada é
+assinada (HMAC-SHA256 da chave e do valor) e só é desserializada se a
+assinatura bater. A chave do HMAC vem de DIVIDENDOS_CACHE_CHAVE (obrigatória
+com Redis); sem ela, o SQLite local usa uma chave aleatória gravada em
+dados/cache.chave, visível só para o dono do arquivo.
+
+O botão "Limpar Cache" dos apps só descarta a memória do processo
+(clear_local_cache): a camada compartilhada serve todas as réplicas e só é
+apagada por clear_shared_cache, chamado pela linha de comando:
+
+    python cache_compartilhado.py --limpar
+
+Tickers sem resultado ficam à parte, no cache negativo (NegativeCache).
+Cada um é gravado com um motivo ("sem dividendos", "sem preço", "erro de
+busca") e um TTL próprio por motivo, bem mais longo que o dos dados. A
+tabela é separada, então clear_shared_cache não a apaga, e a limpeza do
+cache negativo pode escolher os motivos. Quem não paga dividendos é pulado
+antes do download nas análises seguintes.
+"""
+
+import argparse
+import functools
+import hashlib
+import hmac
+import inspect
+import os
+import pickle
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from armazem_dados import DATA_DIR
+
+DEFAULT_CACHE_PATH = os.path.join(DATA_DIR, "cache.sqlite")
+DEFAULT_MEMORY_BYTES = int(os.environ.get("DIVIDENDOS_CACHE_MEMORIA_MB", "64")) * 1024 * 1024
+DEFAULT_KEY_PATH = os.path.join(DATA_DIR, "cache.chave")
+SIGNATURE_BYTES = hashlib.sha256().digest_size
+
+
+class LRUCache:
+    """Cache em memória com despejo do item menos usado quando passa de max_bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Retorna os bytes armazenados ou None (ausente/expirado)."""
+        with self._lock:
+            item = self._itens.get(key)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em is not None and expira_em <= time.time():
+                self._remove(key)
+                return None
+            self._itens.move_to_end(key)
+            return valor
+
+    def set(self, key, valor, ttl=None):
+        if len(valor) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._itens:
+                self._remove(key)
+            self._itens[key] = (valor, time.time() + ttl if ttl else None)
+            self.bytes += len(valor)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._itens)))
+
+    def _remove(self, key):
+        valor, _ = self._itens.pop(key)
+        self.bytes -= len(valor)
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+
+class SQLiteCacheBackend:
+    """Camada compartilhada em arquivo SQLite (várias réplicas na mesma máquina/volume)."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    chave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira_em REAL)
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, key):
+        """Retorna (bytes, expira_em) ou None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT valor, expira_em FROM cache WHERE chave = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return bytes(row[0]), row[1]
+
+    def set(self, key, valor, ttl=None):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                         (key, sqlite3.Binary(valor), time.time() + ttl if ttl else None))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def purge_expired(self):
+        """Remove do arquivo as entradas vencidas."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE expira_em IS NOT NULL AND expira_em <= ?", (time.time(),))
+
+
+class RedisCacheBackend:
+    """Camada compartilhada em um servidor com protocolo Redis (requer o pacote redis)."""
+
+    def __init__(self, url, prefix="dividendos:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        """Retorna (bytes, expira_em) ou None."""
+        valor, restante = self.client.pipeline().get(self.prefix + key).ttl(self.prefix + key).execute()
+        if valor is None:
+            return None
+        return valor, time.time() + restante if restante and restante > 0 else None
+
+    def set(self, key, valor, ttl=None):
+        self.client.set(self.prefix + key, valor, ex=int(ttl) if ttl else None)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+class SignedBackend:
+    """Assina (HMAC-SHA256) os valores gravados na camada compartilhada e rejeita os adulterados."""
+
+    def __init__(self, backend, chave):
+        self.backend = backend
+        self.chave = chave
+
+    def _signature(self, key, valor):
+        return hmac.new(self.chave, key.encode('utf-8') + b'\0' + valor, hashlib.sha256).digest()
+
+    def get(self, key):
+        """Retorna (bytes, expira_em) ou None; assinatura inválida levanta ValueError."""
+        item = self.backend.get(key)
+        if item is None:
+            return None
+        assinado, expira_em = item
+        assinatura, valor = assinado[:SIGNATURE_BYTES], assinado[SIGNATURE_BYTES:]
+        if not hmac.compare_digest(assinatura, self._signature(key, valor)):
+            raise ValueError(f"assinatura inválida no cache compartilhado: {key}")
+        return valor, expira_em
+
+    def set(self, key, valor, ttl=None):
+        self.backend.set(key, self._signature(key, valor) + valor, ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+
+class TieredCache:
+    """Memória (LRU) na frente de uma camada compartilhada opcional."""
+
+    def __init__(self, memory=None, shared=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._contadores = {'hits_memoria': 0, 'hits_compartilhado': 0, 'misses': 0, 'erros_compartilhado': 0}
+
+    def _count(self, nome):
+        with self._lock:
+            self._contadores[nome] += 1
+
+    def get(self, key):
+        """Retorna os bytes da chave ou None, promovendo para a memória o que vier da camada compartilhada."""
+        valor = self.memory.get(key)
+        if valor is not None:
+            self._count('hits_memoria')
+            return valor
+
+        if self.shared is not None:
+            try:
+                item = self.shared.get(key)
+            except Exception:
+                self._count('erros_compartilhado')
+                item = None
+            if item is not None:
+                valor, expira_em = item
+                self._count('hits_compartilhado')
+                self.memory.set(key, valor, expira_em - time.time() if expira_em else None)
+                return valor
+
+        self._count('misses')
+        return None
+
+    def set(self, key, valor, ttl=None):
+        self.memory.set(key, valor, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, valor, ttl)
+            except Exception:
+                self._count('erros_compartilhado')
+
+    def clear(self, compartilhada=True):
+        """Esvazia a memória e, com `compartilhada`, a camada compartilhada de todas as réplicas."""
+        self.memory.clear()
+        if compartilhada and self.shared is not None:
+            try:
+                self.shared.clear()
+            except Exception:
+                self._count('erros_compartilhado')
+
+    def stats(self):
+        """Contadores de acertos/faltas e ocupação da memória."""
+        with self._lock:
+            stats = dict(self._contadores)
+        consultas = stats['hits_memoria'] + stats['hits_compartilhado'] + stats['misses']
+        stats['taxa_acerto'] = (stats['hits_memoria'] + stats['hits_compartilhado']) / consultas if consultas else 0.0
+        stats['itens_memoria'] = len(self.memory)
+        stats['bytes_memoria'] = self.memory.bytes
+        stats['camada_compartilhada'] = (type(getattr(self.shared, 'backend', self.shared)).__name__
+                                         if self.shared is not None else None)
+        return stats
+
+
+def _local_signing_key(path=DEFAULT_KEY_PATH, tentativas=50):
+    """Chave aleatória do HMAC em arquivo (modo 600), criada na primeira vez e lida pelas outras réplicas.
+
+    A chave é gravada num arquivo temporário e ligada (os.link) no caminho
+    final, então quem lê nunca vê o arquivo vazio ou pela metade. Um
+    arquivo curto demais é relido por alguns segundos antes de desistir.
+    """
+    for _ in range(tentativas):
+        try:
+            with open(path, "rb") as f:
+                chave = f.read()
+            if len(chave) >= SIGNATURE_BYTES:
+                return chave
+            # Arquivo ainda sendo gravado por uma versão anterior: espera
+            time.sleep(0.1)
+            continue
+        except FileNotFoundError:
+            pass
+
+        fd, temporario = tempfile.mkstemp(prefix=".cache.chave.", dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_bytes(32))
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(temporario, path)
+            except FileExistsError:
+                # Outra réplica criou ao mesmo tempo; a dela vale
+                pass
+        finally:
+            os.unlink(temporario)
+    raise RuntimeError(f"não foi possível ler a chave do cache em {path}")
+
+
+def _default_shared_backend():
+    """Camada compartilhada assinada conforme DIVIDENDOS_CACHE_URL (redis://...) ou o SQLite local.
+
+    Redis só é usado com DIVIDENDOS_CACHE_CHAVE definida (a mesma em todas as réplicas).
+    """
+    url = os.environ.get("DIVIDENDOS_CACHE_URL", "")
+    chave = os.environ.get("DIVIDENDOS_CACHE_CHAVE", "").encode("utf-8")
+    if url.startswith(("redis://", "rediss://")) and chave:
+        try:
+            return SignedBackend(RedisCacheBackend(url), chave)
+        except ImportError:
+            pass
+    try:
+        backend = SQLiteCacheBackend()
+        return SignedBackend(backend, chave or _local_signing_key())
+    except Exception:
+        return None
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Instância do cache em camadas usada pelo decorator."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TieredCache(LRUCache(), _default_shared_backend())
+        return _default_cache
+
+
+def cache_stats():
+    return get_shared_cache().stats()
+
+
+def clear_local_cache():
+    """Esvazia só a memória deste processo; as outras réplicas não são afetadas."""
+    get_shared_cache().clear(compartilhada=False)
+
+
+def clear_shared_cache():
+    """Esvazia a memória e a camada compartilhada (todas as réplicas). Uso administrativo."""
+    get_shared_cache().clear()
+
+
+# --- Cache negativo ---
+
+MOTIVO_SEM_DIVIDENDOS = "sem dividendos"
+MOTIVO_SEM_PRECO = "sem preço"
+MOTIVO_ERRO = "erro de busca"
+
+# Quem não paga dividendos raramente passa a pagar de uma semana para outra; erros costumam ser passageiros
+NEGATIVE_TTLS = {MOTIVO_SEM_DIVIDENDOS: 7 * 86400, MOTIVO_SEM_PRECO: 86400, MOTIVO_ERRO: 3600}
+_SQL_MAX_PARAMS = 900
+# counts() alimenta a sidebar a cada rerun; a contagem é reaproveitada por esse prazo (segundos)
+NEGATIVE_COUNTS_TTL = 60
+
+
+class NegativeCache:
+    """Tickers sem resultado e o motivo, por janela de anos, com TTL por motivo (SQLite)."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None):
+        self.path = path
+        self.ttls = dict(NEGATIVE_TTLS, **(ttls or {}))
+        self._contagem = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS negativos (
+                    ticker TEXT NOT NULL, anos INTEGER NOT NULL, motivo TEXT NOT NULL,
+                    expira_em REAL NOT NULL, PRIMARY KEY (ticker, anos))
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def lookup(self, tickers, anos=5):
+        """dict ticker -> motivo dos tickers com resultado negativo ainda válido."""
+        tickers = list(dict.fromkeys(tickers))
+        agora = time.time()
+        motivos = {}
+        with self._connect() as conn:
+            for i in range(0, len(tickers), _SQL_MAX_PARAMS):
+                grupo = tickers[i:i + _SQL_MAX_PARAMS]
+                motivos.update(conn.execute(
+                    f"SELECT ticker, motivo FROM negativos WHERE anos = ? AND expira_em > ? "
+                    f"AND ticker IN ({', '.join('?' * len(grupo))})",
+                    [int(anos), agora] + grupo
+                ).fetchall())
+        return motivos
+
+    def record(self, motivos, anos=5):
+        """Grava dict ticker -> motivo; cada entrada expira conforme o TTL do seu motivo."""
+        agora = time.time()
+        self._contagem = None
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO negativos VALUES (?, ?, ?, ?)",
+                [(ticker, int(anos), motivo, agora + self.ttls.get(motivo, self.ttls[MOTIVO_ERRO]))
+                 for ticker, motivo in motivos.items()]
+            )
+
+    def clear(self, motivos=None):
+        """Remove todas as entradas (ou só as dos motivos dados) e as vencidas; retorna quantas saíram."""
+        self._contagem = None
+        with self._connect() as conn:
+            if motivos is None:
+                return conn.execute("DELETE FROM negativos").rowcount
+            motivos = list(motivos)
+            return conn.execute(
+                f"DELETE FROM negativos WHERE expira_em <= ? OR motivo IN ({', '.join('?' * len(motivos))})",
+                [time.time()] + motivos
+            ).rowcount
+
+    def counts(self, validade=NEGATIVE_COUNTS_TTL):
+        """Entradas válidas por motivo; a contagem é reaproveitada por `validade` segundos.
+
+        Escritas deste processo (record/clear) descartam a contagem; as de
+        outras réplicas aparecem quando ela vence.
+        """
+        agora = time.time()
+        contagem = self._contagem
+        if contagem is not None and agora - contagem[0] < validade:
+            return dict(contagem[1])
+        with self._connect() as conn:
+            contagem = (agora, dict(conn.execute(
+                "SELECT motivo, COUNT(*) FROM negativos WHERE expira_em > ? GROUP BY motivo", (agora,)
+            ).fetchall()))
+        self._contagem = contagem
+        return dict(contagem[1])
+
+
+_default_negative = None
+_default_negative_lock = threading.Lock()
+
+
+def get_negative_cache():
+    """Cache negativo compartilhado, no mesmo arquivo do cache SQLite."""
+    global _default_negative
+    with _default_negative_lock:
+        if _default_negative is None:
+            _default_negative = NegativeCache()
+        return _default_negative
+
+
+def _namespace(func):
+    """Identifica a função pelo arquivo + nome, para apps diferentes não colidirem."""
+    arquivo = os.path.splitext(os.path.basename(func.__code__.co_filename))[0]
+    return f"{arquivo}.{func.__qualname__}"
+
+
+def shared_cache(ttl=1800, cache=None):
+    """Decorator de cache em camadas, com a mesma convenção de argumentos do st.cache_data."""
+    def decorator(func):
+        assinatura = inspect.signature(func)
+        namespace = _namespace(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            alvo = cache or get_shared_cache()
+            bound = assinatura.bind(*args, **kwargs)
+            bound.apply_defaults()
+            chave_args = repr([(nome, valor) for nome, valor in bound.arguments.items()
+                               if not nome.startswith('_')])
+            key = namespace + ':' + hashlib.sha1(chave_args.encode('utf-8')).hexdigest()
+
+            valor = alvo.get(key)
+            if valor is not None:
+                try:
+                    return pickle.loads(valor)
+                except Exception:
+                    pass
+
+            resultado = func(*args, **kwargs)
+            try:
+                alvo.set(key, pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL), ttl)
+            except Exception:
+                pass
+            return resultado
+
+        wrapper.namespace = namespace
+        return wrapper
+    return decorator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Administração do cache compartilhado.")
+    parser.add_argument("--limpar", action="store_true",
+                        help="Apaga a camada compartilhada (vale para todas as réplicas)")
+    args = parser.parse_args(argv)
+
+    if not args.limpar:
+        parser.print_help()
+        return 1
+    clear_shared_cache()
+    print("Camada compartilhada do cache apagada.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,257 @@
+"""
+Cadastro de ativos da B3: categoria, setor, lote padrão e situação de listagem.
+
+A categoria de cada ticker era deduzida por regras de texto a cada análise e
+o setor só vinha do .info do Yahoo, uma chamada de rede por ticker. O
+cadastro junta as listas estáticas (tickers_fundamentus, acoes_b3_completa e
+os BDRs/ETFs extras de universo_b3) numa tabela gravada em
+dados/cadastro.sqlite. Cada processo a carrega uma vez (get_cadastro) num
+DataFrame indexado por ticker, com as posições de cada categoria, setor e
+situação já agrupadas. Filtrar por categoria/setor vira consulta em memória.
+
+Nome e setor ficam vazios até o primeiro .info do ticker. A partir daí são
+gravados (record_metadata) e lidos do cadastro, sem rede, até expirarem
+(METADATA_VALIDADE). Cada gravação copia a tabela inteira, então os
+registros se acumulam em memória e vão em lote (flush, a cada grupo
+analisado ou a cada GRAVACAO_LOTE registros).
+"""
+
+import importlib.util
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from armazem_dados import DATA_DIR
+from universo_b3 import BDRS_EXTRAS, ETFS_EXTRAS, category_from_symbol
+
+DEFAULT_CADASTRO_PATH = os.path.join(DATA_DIR, "cadastro.sqlite")
+
+# Lista do Fundamentus (negociados recentemente); sem ela, a lista ampla de acoes_b3_completa
+USE_FUNDAMENTUS = importlib.util.find_spec("tickers_fundamentus") is not None
+
+# Negociado nos últimos 2 meses (lista do Fundamentus) ou nas listas extras
+SITUACAO_ATIVO = "Ativo"
+# Só na lista ampla (acoes_b3_completa), sem negociação recente no Fundamentus
+SITUACAO_SEM_NEGOCIACAO = "Sem negociação recente"
+# Fora das listas estáticas (consultado avulso ou removido das listas)
+SITUACAO_NAO_LISTADO = "Não listado"
+
+# Lote padrão da B3: ações negociam em lotes de 100; FIIs, BDRs e ETFs, de 1
+LOTE_PADRAO = {"Ação": 100}
+
+# Nome e setor lidos do .info são consultados de novo depois desse prazo
+METADATA_VALIDADE = timedelta(days=30)
+# Registros de nome/setor acumulados antes de uma gravação automática
+GRAVACAO_LOTE = 100
+
+COLUNAS = ["nome", "categoria", "setor", "lote", "situacao", "atualizado_em"]
+_AGRUPADAS = ("categoria", "setor", "situacao")
+
+
+def _static_instruments():
+    """(ticker, categoria, lote, situacao) das listas estáticas; vale a primeira situação de cada ticker."""
+    if USE_FUNDAMENTUS:
+        from tickers_fundamentus import get_tickers_fundamentus
+        ativos = get_tickers_fundamentus()
+        try:
+            from acoes_b3_completa import get_acoes_b3_completas, get_fiis_completos
+            sem_negociacao = get_acoes_b3_completas() + get_fiis_completos()
+        except ImportError:
+            sem_negociacao = []
+    else:
+        from acoes_b3_completa import get_acoes_b3_completas, get_fiis_completos
+        ativos, sem_negociacao = get_acoes_b3_completas() + get_fiis_completos(), []
+
+    situacoes = dict.fromkeys(ativos + BDRS_EXTRAS + ETFS_EXTRAS, SITUACAO_ATIVO)
+    for ticker in sem_negociacao:
+        situacoes.setdefault(ticker, SITUACAO_SEM_NEGOCIACAO)
+
+    linhas = []
+    for ticker, situacao in situacoes.items():
+        categoria = category_from_symbol(ticker)
+        linhas.append((ticker, categoria, LOTE_PADRAO.get(categoria, 1), situacao))
+    return linhas
+
+
+class InstrumentMaster:
+    """Cadastro em memória (DataFrame indexado por ticker) com escrita no SQLite."""
+
+    def __init__(self, tabela, path=None):
+        self.tabela = tabela.sort_index()
+        self.path = path
+        self._lock = threading.Lock()
+        self._indice = None
+        self._pendentes = {}
+        self._categorias = dict(zip(self.tabela.index, self.tabela["categoria"]))
+
+    # --- Carga ---
+
+    @classmethod
+    def load(cls, path=DEFAULT_CADASTRO_PATH):
+        """Sincroniza a tabela com as listas estáticas e carrega o cadastro inteiro."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with cls._connect(path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cadastro (
+                    ticker TEXT PRIMARY KEY, nome TEXT, categoria TEXT NOT NULL, setor TEXT,
+                    lote INTEGER NOT NULL, situacao TEXT NOT NULL, atualizado_em TEXT)
+            """)
+            # Quem saiu das listas deixa de ser "Ativo"; nome/setor já aprendidos são preservados
+            conn.execute("UPDATE cadastro SET situacao = ?", (SITUACAO_NAO_LISTADO,))
+            conn.executemany(
+                "INSERT INTO cadastro (ticker, categoria, lote, situacao) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(ticker) DO UPDATE SET categoria = excluded.categoria, "
+                "lote = excluded.lote, situacao = excluded.situacao",
+                _static_instruments()
+            )
+            rows = conn.execute(f"SELECT ticker, {', '.join(COLUNAS)} FROM cadastro").fetchall()
+        tabela = pd.DataFrame(rows, columns=["ticker"] + COLUNAS).set_index("ticker")
+        tabela["atualizado_em"] = pd.to_datetime(tabela["atualizado_em"])
+        return cls(tabela.astype({"lote": int}), path)
+
+    @staticmethod
+    def _connect(path):
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # --- Consulta ---
+
+    def __len__(self):
+        return len(self.tabela)
+
+    def __contains__(self, ticker):
+        return ticker in self._categorias
+
+    def _index(self):
+        """(tabela, posições de cada valor das colunas agrupadas), refeito só depois de escritas."""
+        indice = self._indice
+        if indice is None or indice[0] is not self.tabela:
+            tabela = self.tabela
+            grupos = {coluna: {valor: np.asarray(posicoes)
+                               for valor, posicoes in tabela.groupby(coluna, sort=True).indices.items()}
+                      for coluna in _AGRUPADAS}
+            indice = self._indice = (tabela, grupos)
+        return indice
+
+    def tickers(self, categorias=None, setores=None, situacoes=(SITUACAO_ATIVO,)):
+        """Tickers (ordem alfabética) nas categorias, setores e situações pedidos; None não filtra."""
+        tabela, grupos = self._index()
+        mascara = np.ones(len(tabela), dtype=bool)
+        for coluna, valores in (("categoria", categorias), ("setor", setores), ("situacao", situacoes)):
+            if valores is None:
+                continue
+            selecionados = np.zeros(len(tabela), dtype=bool)
+            for valor in valores:
+                if valor in grupos[coluna]:
+                    selecionados[grupos[coluna][valor]] = True
+            mascara &= selecionados
+        return tabela.index[mascara].tolist()
+
+    def values(self, coluna, situacoes=(SITUACAO_ATIVO,)):
+        """Valores distintos (ordenados) da coluna entre os tickers das situações pedidas."""
+        tickers = self.tickers(situacoes=situacoes)
+        return sorted(self.tabela.loc[tickers, coluna].dropna().unique().tolist())
+
+    def category(self, ticker):
+        """Categoria cadastrada do ticker ou None."""
+        return self._categorias.get(ticker)
+
+    def lot_size(self, ticker):
+        """Lote padrão de negociação (cadastro ou, fora dele, pela categoria do código)."""
+        if ticker in self._categorias:
+            return int(self.tabela.at[ticker, "lote"])
+        return LOTE_PADRAO.get(category_from_symbol(ticker), 1)
+
+    def get(self, ticker):
+        """Linha do cadastro como dict (com 'ticker') ou None."""
+        if ticker not in self._categorias:
+            return None
+        return {"ticker": ticker, **self.tabela.loc[ticker].to_dict()}
+
+    def metadata(self, ticker, validade=METADATA_VALIDADE):
+        """{'nome_longo', 'setor'} gravados e ainda válidos, no formato de fetch_stock_metadata, ou None."""
+        pendente = self._pendentes.get(ticker)
+        if pendente is not None:
+            return {"nome_longo": pendente[0] or ticker, "setor": pendente[1] or "N/A"}
+        if ticker not in self._categorias:
+            return None
+        linha = self.tabela.loc[ticker]
+        if pd.isna(linha["atualizado_em"]) or datetime.now() - linha["atualizado_em"] > validade:
+            return None
+        return {"nome_longo": linha["nome"] or ticker, "setor": linha["setor"] or "N/A"}
+
+    # --- Escrita ---
+
+    def record_metadata(self, ticker, nome, setor):
+        """Anota nome e setor lidos do .info; são gravados no próximo flush (ou ao juntar GRAVACAO_LOTE)."""
+        with self._lock:
+            self._pendentes[ticker] = (nome, setor, datetime.now().replace(microsecond=0))
+            if len(self._pendentes) >= GRAVACAO_LOTE:
+                self._write_pending()
+
+    def record_many(self, registros):
+        """Grava dict ticker -> (nome, setor) de uma vez, junto com os registros pendentes."""
+        agora = datetime.now().replace(microsecond=0)
+        with self._lock:
+            self._pendentes.update({t: (nome, setor, agora) for t, (nome, setor) in registros.items()})
+            self._write_pending()
+
+    def flush(self):
+        """Grava os registros anotados por record_metadata."""
+        with self._lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        """Grava os pendentes numa conexão e numa cópia da tabela (chamar com o lock)."""
+        if not self._pendentes:
+            return
+        linhas = []
+        for ticker, (nome, setor, agora) in self._pendentes.items():
+            categoria = self._categorias.get(ticker) or category_from_symbol(ticker)
+            linhas.append((ticker, nome, categoria, setor, LOTE_PADRAO.get(categoria, 1),
+                           SITUACAO_NAO_LISTADO, agora))
+        if self.path is not None:
+            # Tickers fora das listas entram como não listados
+            with self._connect(self.path) as conn:
+                conn.executemany(
+                    "INSERT INTO cadastro VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(ticker) DO UPDATE SET nome = excluded.nome, setor = excluded.setor, "
+                    "atualizado_em = excluded.atualizado_em",
+                    [linha[:6] + (linha[6].isoformat(),) for linha in linhas]
+                )
+
+        # Cópia na escrita: leitores em outras threads seguem com a tabela anterior inteira
+        existentes = [linha for linha in linhas if linha[0] in self._categorias]
+        novos = [linha for linha in linhas if linha[0] not in self._categorias]
+        tabela = self.tabela.copy()
+        if existentes:
+            tabela.loc[[linha[0] for linha in existentes], ["nome", "setor", "atualizado_em"]] = \
+                [[linha[1], linha[3], linha[6]] for linha in existentes]
+        if novos:
+            novo = pd.DataFrame([linha[1:] for linha in novos], columns=COLUNAS,
+                                index=pd.Index([linha[0] for linha in novos], name="ticker"))
+            tabela = pd.concat([tabela, novo]).sort_index()
+        self.tabela = tabela
+        for linha in linhas:
+            self._categorias[linha[0]] = linha[2]
+        self._pendentes = {}
+
+
+_default_cadastro = None
+_default_cadastro_lock = threading.Lock()
+
+
+def get_cadastro():
+    """Cadastro compartilhado do processo, carregado do caminho padrão na primeira chamada."""
+    global _default_cadastro
+    with _default_cadastro_lock:
+        if _default_cadastro is None:
+            _default_cadastro = InstrumentMaster.load()
+        return _default_cadastro
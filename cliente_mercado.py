@@ -0,0 +1,269 @@
+"""
+Cliente assíncrono de dados de mercado (endpoint chart do Yahoo).
+
+Os laços de retry com time.sleep(1) não controlam a taxa global de
+requisições: numa análise da B3 inteira ou tudo anda devagar ou o Yahoo
+bloqueia de uma vez. Este cliente coordena os downloads com asyncio:
+
+- pool de conexões HTTP compartilhado (requests.Session + HTTPAdapter,
+  executado em threads pelo loop);
+- token bucket global (vale entre threads/sessões do processo);
+- backoff exponencial com jitter em 429, 5xx e erros de conexão,
+  respeitando Retry-After;
+- fila de trabalho: milhares de tickers podem ficar pendentes sem criar
+  milhares de tarefas simultâneas.
+
+`download` tem a assinatura do yf.download, então o cliente entra no lugar
+do Yahoo em download_batch (ranking, snapshot). Tickers que falham depois
+de todas as tentativas (conexão, timeout, 429/5xx) vão para
+`frame.attrs['falhas']`, para download_batch tratá-los como erro de busca e
+não como ticker sem cotação. A URL base é configurável
+(DIVIDENDOS_YAHOO_URL) para apontar para o servidor local servidor_stub.py.
+"""
+
+import asyncio
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = os.environ.get("DIVIDENDOS_YAHOO_URL", "https://query2.finance.yahoo.com")
+DEFAULT_RATE = float(os.environ.get("DIVIDENDOS_REQ_POR_SEG", "8"))
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 20
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Limitador de taxa: `rate` requisições/s com rajadas de até `capacity`.
+
+    Cada acquire reserva uma ficha (o saldo pode ficar negativo) e espera o
+    tempo necessário para ela existir; o estado é protegido por um lock de
+    thread, então o mesmo bucket vale para vários loops/threads.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Reserva uma ficha e retorna quantos segundos esperar por ela."""
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (agora - self._atualizado) * self.rate)
+            self._atualizado = agora
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self):
+        espera = self.reserve()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, rng=random):
+    """Backoff exponencial com jitter completo: uniforme em [0, min(cap, base * 2^attempt)]."""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_chart(payload):
+    """Converte a resposta do endpoint chart em DataFrame Close/Dividends (índice sem fuso).
+
+    Retorna None se a resposta não tiver cotações.
+    """
+    chart = (payload or {}).get("chart") or {}
+    resultados = chart.get("result") or []
+    if not resultados:
+        return None
+    result = resultados[0]
+    timestamps = result.get("timestamp") or []
+    if not timestamps:
+        return None
+
+    fuso = (result.get("meta") or {}).get("exchangeTimezoneName") or "America/Sao_Paulo"
+    index = pd.to_datetime(timestamps, unit="s", utc=True).tz_convert(fuso).tz_localize(None).normalize()
+
+    indicadores = result.get("indicators") or {}
+    adjclose = (indicadores.get("adjclose") or [{}])[0].get("adjclose")
+    close = adjclose if adjclose is not None else (indicadores.get("quote") or [{}])[0].get("close")
+    if close is None:
+        return None
+
+    frame = pd.DataFrame({"Close": pd.to_numeric(pd.Series(close), errors="coerce").to_numpy(dtype=float)},
+                         index=index)
+    frame = frame[~frame.index.duplicated(keep="last")].dropna(subset=["Close"])
+    frame["Dividends"] = 0.0
+
+    eventos = ((result.get("events") or {}).get("dividends") or {}).values()
+    if eventos and not frame.empty:
+        datas = pd.to_datetime([e["date"] for e in eventos], unit="s", utc=True)
+        datas = datas.tz_convert(fuso).tz_localize(None).normalize()
+        # Proventos em datas sem pregão ficam no pregão seguinte
+        posicoes = frame.index.searchsorted(datas)
+        coluna = frame.columns.get_loc("Dividends")
+        for posicao, evento in zip(posicoes, eventos):
+            if posicao < len(frame):
+                frame.iloc[posicao, coluna] += float(evento["amount"])
+
+    return frame if not frame.empty else None
+
+
+class ChartResults(dict):
+    """dict ticker -> DataFrame de fetch_many; `falhas` guarda os tickers cuja busca falhou."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.falhas = set()
+
+
+class MarketDataClient:
+    """Cliente do endpoint chart com pool de conexões, limite de taxa e backoff."""
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, rate=DEFAULT_RATE, burst=None,
+                 max_concurrency=DEFAULT_CONCURRENCY, max_retries=4, timeout=DEFAULT_TIMEOUT,
+                 session=None):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate, burst)
+        self.session = session or self._build_session()
+        self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="cliente_mercado")
+        self._lock = threading.Lock()
+        self.stats = {"requisicoes": 0, "retentativas": 0, "falhas": 0}
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_concurrency)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        return session
+
+    def _count(self, nome):
+        with self._lock:
+            self.stats[nome] += 1
+
+    def chart_url(self, ticker):
+        return f"{self.base_url}/v8/finance/chart/{ticker}"
+
+    async def fetch_chart(self, ticker, start, end=None):
+        """JSON do endpoint chart (preços diários + dividendos) ou None se o ticker não existe."""
+        inicio = int(pd.Timestamp(start).timestamp())
+        fim = int(pd.Timestamp(end if end is not None else datetime.today()).timestamp()) + 86400
+        params = {"period1": inicio, "period2": fim, "interval": "1d", "events": "div"}
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            self._count("requisicoes")
+            espera = None
+            try:
+                response = await loop.run_in_executor(
+                    self._executor,
+                    functools.partial(self.session.get, self.chart_url(ticker), params=params,
+                                      timeout=self.timeout)
+                )
+                if response.status_code == 404:
+                    return None
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                espera = _retry_after(response)
+                erro = requests.HTTPError(f"HTTP {response.status_code} para {ticker}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                erro = e
+
+            if attempt == self.max_retries:
+                self._count("falhas")
+                raise erro
+            self._count("retentativas")
+            await asyncio.sleep(espera if espera is not None else backoff_delay(attempt))
+
+    async def fetch_frame(self, ticker, start, end=None):
+        """DataFrame Close/Dividends do ticker (None se não houver dados)."""
+        return parse_chart(await self.fetch_chart(ticker, start, end))
+
+    async def fetch_many(self, tickers, start, end=None, on_result=None):
+        """Baixa todos os tickers por uma fila com max_concurrency consumidores.
+
+        on_result(ticker, frame, erro) é chamado a cada ticker concluído.
+        Retorna ChartResults (dict ticker -> DataFrame só com os que têm
+        dados); os que falharam em todas as tentativas ficam em `falhas`.
+        """
+        fila = asyncio.Queue()
+        for ticker in dict.fromkeys(tickers):
+            fila.put_nowait(ticker)
+        resultados = ChartResults()
+
+        async def consumidor():
+            while True:
+                try:
+                    ticker = fila.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                frame, erro = None, None
+                try:
+                    frame = await self.fetch_frame(ticker, start, end)
+                except Exception as e:
+                    erro = e
+                    resultados.falhas.add(ticker)
+                if frame is not None:
+                    resultados[ticker] = frame
+                if on_result:
+                    on_result(ticker, frame, erro)
+
+        await asyncio.gather(*(consumidor() for _ in range(min(self.max_concurrency, fila.qsize()))))
+        return resultados
+
+    def download_frames(self, tickers, start, end=None, on_result=None):
+        """Versão síncrona de fetch_many (cria o próprio loop de eventos)."""
+        return asyncio.run(self.fetch_many(tickers, start, end, on_result))
+
+    def download(self, tickers, start=None, end=None, **kwargs):
+        """Substituto do yf.download(group_by='ticker', actions=True): colunas (ticker, campo).
+
+        Os tickers que falharam ficam na lista attrs['falhas'] do resultado.
+        """
+        if isinstance(tickers, str):
+            tickers = tickers.split()
+        frames = self.download_frames(tickers, start, end)
+        data = pd.concat(frames, axis=1) if frames else pd.DataFrame()
+        data.attrs['falhas'] = sorted(frames.falhas)
+        return data
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_market_client():
+    """Instância compartilhada (um pool e um limite de taxa por processo)."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = MarketDataClient()
+        return _default_client
@@ -0,0 +1,163 @@
+"""
+Gerador determinístico de histórico de mercado sintético (sem rede).
+
+Produz preços diários e dividendos plausíveis para N tickers ao longo de Y
+anos, com perfis que imitam o que aparece na B3:
+
+- fii: rendimento mensal, proporcional ao preço da cota;
+- acao: dividendos semestrais ou anuais, com anos sem pagamento;
+- banco_jcp: JCP mensal pequeno mais eventos extras em datas irregulares;
+- deslistado: ação cujo histórico termina antes da data final.
+
+A mesma semente (e data final) gera sempre os mesmos dados. `download`
+imita o formato do yf.download(group_by='ticker', actions=True), então o
+mercado sintético pode substituir o Yahoo em download_batch e no benchmark.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+PERFIS = ('fii', 'acao', 'banco_jcp', 'deslistado')
+DEFAULT_MIX = {'fii': 0.35, 'acao': 0.45, 'banco_jcp': 0.10, 'deslistado': 0.10}
+SUFIXOS = {'fii': '11', 'acao': '3', 'banco_jcp': '4', 'deslistado': '3'}
+SETORES = {
+    'fii': ['Real Estate'],
+    'acao': ['Utilities', 'Energy', 'Basic Materials', 'Consumer Defensive', 'Industrials',
+             'Communication Services', 'Consumer Cyclical', 'Healthcare'],
+    'banco_jcp': ['Financial Services'],
+    'deslistado': ['Industrials', 'Consumer Cyclical', 'Technology'],
+}
+
+
+def _ticker_name(i, perfil):
+    """Código de 4 letras derivado do índice + sufixo do perfil (ex.: AABC11.SA)."""
+    letras = []
+    for _ in range(4):
+        i, resto = divmod(i, 26)
+        letras.append(chr(ord('A') + resto))
+    return ''.join(reversed(letras)) + SUFIXOS[perfil] + '.SA'
+
+
+class SyntheticMarket:
+    """Universo sintético de tickers com preços (Close/Volume) e dividendos."""
+
+    def __init__(self, n_tickers, years=5, seed=42, end=None, mix=None):
+        self.years = years
+        self.seed = seed
+        self.end = pd.Timestamp(end if end is not None else datetime.today()).normalize()
+        # Um pouco além de `years`, para cobrir a janela que download_batch pede
+        self.start = self.end - timedelta(days=years*365 + 130)
+        self.dates = pd.bdate_range(self.start, self.end)
+
+        mix = mix or DEFAULT_MIX
+        rng = np.random.default_rng(seed)
+        perfis = rng.choice(list(mix), size=n_tickers, p=np.array(list(mix.values())) / sum(mix.values()))
+
+        self.tickers = []
+        self.perfis = {}
+        self.setores = {}
+        self._frames = {}
+        for i, perfil in enumerate(perfis.tolist()):
+            ticker = _ticker_name(i, perfil)
+            ticker_rng = np.random.default_rng([seed, i])
+            self.tickers.append(ticker)
+            self.perfis[ticker] = perfil
+            self.setores[ticker] = SETORES[perfil][ticker_rng.integers(len(SETORES[perfil]))]
+            self._frames[ticker] = self._generate_frame(perfil, ticker_rng)
+
+    # --- Geração ---
+
+    def _generate_frame(self, perfil, rng):
+        n = len(self.dates)
+        preco_inicial = rng.uniform(80, 120) if perfil == 'fii' else rng.uniform(5, 80)
+        vol_anual = rng.uniform(0.10, 0.18) if perfil == 'fii' else rng.uniform(0.20, 0.45)
+        retornos = rng.normal(0.04 / 252, vol_anual / np.sqrt(252), n)
+        close = preco_inicial * np.exp(np.cumsum(retornos))
+        volume = rng.lognormal(11, 1, n).round()
+
+        dividendos = np.zeros(n)
+        if perfil == 'fii':
+            self._monthly_income(dividendos, close, rng, rng.uniform(0.006, 0.010), pular=0.03)
+        elif perfil == 'banco_jcp':
+            self._monthly_income(dividendos, close, rng, rng.uniform(0.0015, 0.003), pular=0.0)
+            self._irregular_events(dividendos, close, rng, rng.uniform(0.02, 0.05))
+        else:
+            self._periodic_dividends(dividendos, close, rng, rng.uniform(0.03, 0.09))
+
+        frame = pd.DataFrame({'Close': close, 'Volume': volume, 'Dividends': dividendos}, index=self.dates)
+
+        if perfil == 'deslistado':
+            # Último pregão entre 1 e 3 anos antes da data final
+            corte = self.end - timedelta(days=int(rng.integers(365, 3 * 365)))
+            frame = frame[frame.index <= corte]
+        return frame
+
+    def _month_positions(self):
+        """Posição do primeiro pregão de cada mês no calendário."""
+        meses = self.dates.to_period('M')
+        return np.flatnonzero(np.r_[True, meses[1:] != meses[:-1]])
+
+    def _monthly_income(self, dividendos, close, rng, yield_mensal, pular):
+        inicios = self._month_positions()
+        # Pagamento por volta do 10º pregão do mês
+        posicoes = np.minimum(inicios + rng.integers(5, 12, len(inicios)), len(dividendos) - 1)
+        pagos = rng.random(len(posicoes)) >= pular
+        valores = close[posicoes] * yield_mensal * rng.normal(1, 0.08, len(posicoes)).clip(0.7, 1.3)
+        dividendos[posicoes[pagos]] += valores[pagos].round(4)
+
+    def _irregular_events(self, dividendos, close, rng, yield_anual):
+        n_eventos = int(rng.integers(3, 7) * (self.years + 1))
+        posicoes = np.sort(rng.choice(len(dividendos), size=min(n_eventos, len(dividendos)), replace=False))
+        pesos = rng.dirichlet(np.ones(len(posicoes))) * len(posicoes) / max(n_eventos / (self.years + 1), 1)
+        dividendos[posicoes] += (close[posicoes] * yield_anual * pesos).round(4)
+
+    def _periodic_dividends(self, dividendos, close, rng, yield_anual):
+        pagamentos_ano = int(rng.choice([1, 2, 4]))
+        anos = self.dates.year
+        for ano in np.unique(anos):
+            if rng.random() < 0.15:
+                continue  # ano sem dividendos
+            posicoes_ano = np.flatnonzero(anos == ano)
+            escolhidas = np.sort(rng.choice(posicoes_ano, size=min(pagamentos_ano, len(posicoes_ano)), replace=False))
+            valores = close[escolhidas] * yield_anual / pagamentos_ano * rng.lognormal(0, 0.25, len(escolhidas))
+            dividendos[escolhidas] += valores.round(4)
+
+    # --- Acesso aos dados ---
+
+    def frame(self, ticker):
+        """DataFrame Close/Volume/Dividends do ticker (None se desconhecido)."""
+        return self._frames.get(ticker)
+
+    def _slice(self, ticker, start=None, end=None):
+        frame = self._frames[ticker]
+        if start is not None:
+            frame = frame[frame.index >= pd.Timestamp(start)]
+        if end is not None:
+            frame = frame[frame.index <= pd.Timestamp(end)]
+        return frame
+
+    def prices(self, ticker, start=None, end=None):
+        """Close/Volume no formato de MarketDataStore.read_prices."""
+        return self._slice(ticker, start, end)[['Close', 'Volume']]
+
+    def dividends(self, ticker):
+        """Série de eventos de dividendos (só valores > 0)."""
+        dividendos = self._frames[ticker]['Dividends']
+        return dividendos[dividendos > 0]
+
+    def metadata(self, ticker):
+        """Mesmo formato de download_lote.fetch_stock_metadata."""
+        return {'nome_longo': f"{ticker.replace('.SA', '')} {self.perfis[ticker].upper()} Sintético",
+                'setor': self.setores[ticker]}
+
+    def download(self, tickers, start=None, end=None, **kwargs):
+        """Substituto do yf.download: colunas MultiIndex (ticker, campo) como group_by='ticker'."""
+        if isinstance(tickers, str):
+            tickers = tickers.split()
+        frames = {t: self._slice(t, start, end) for t in tickers if t in self._frames}
+        frames = {t: f for t, f in frames.items() if not f.empty}
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1)
@@ -0,0 +1,353 @@
+"""
+Camada de download em lote de preços e proventos.
+
+Em vez de criar um yf.Ticker por ativo (validação com history(5d), .info e
+.dividends em chamadas separadas), baixa preços e eventos corporativos de
+grupos de tickers com yf.download e separa o resultado em um DataFrame por
+ticker, com as colunas Close e Dividends.
+
+O yfinance é importado no primeiro download, não no import do módulo: o app
+e o snapshot importam este módulo na partida e muitas vezes nem chegam a
+baixar nada (snapshot carregado do disco, download_fn injetado).
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from armazem_dados import adjustment_changed, covers_recent, delta_start
+from cache_compartilhado import MOTIVO_ERRO, MOTIVO_SEM_DIVIDENDOS, MOTIVO_SEM_PRECO
+from cadastro_ativos import get_cadastro
+from universo_b3 import categorize_ticker
+
+BATCH_SIZE = 50
+PRICE_COLUMNS = ['Close', 'Dividends']
+
+
+def _chunks(items, size):
+    """Divide a lista em grupos de até `size` elementos."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _yahoo_download(*args, **kwargs):
+    """yf.download com import tardio do yfinance."""
+    import yfinance as yf
+    return yf.download(*args, **kwargs)
+
+
+def _normalize_frame(frame):
+    """Mantém apenas Close/Dividends, com índice sem fuso e sem linhas vazias."""
+    frame = frame.copy()
+    if 'Dividends' not in frame.columns:
+        frame['Dividends'] = 0.0
+    frame = frame[[c for c in PRICE_COLUMNS if c in frame.columns]]
+    frame = frame.dropna(subset=['Close'])
+    frame['Dividends'] = frame['Dividends'].fillna(0.0)
+    if frame.index.tz is not None:
+        frame.index = frame.index.tz_localize(None)
+    return frame
+
+
+def split_batch_frame(data, tickers):
+    """Separa o DataFrame multi-ticker do yf.download em um frame por ticker."""
+    frames = {}
+    if data is None or data.empty:
+        return frames
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        # Download de um único ticker sem MultiIndex
+        if len(tickers) == 1 and 'Close' in data.columns:
+            frame = _normalize_frame(data)
+            if not frame.empty:
+                frames[tickers[0]] = frame
+        return frames
+
+    # group_by='ticker' coloca o ticker no nível 0; versões antigas no nível 1
+    nivel = 0 if set(tickers) & set(data.columns.get_level_values(0)) else 1
+    disponiveis = set(data.columns.get_level_values(nivel))
+
+    for ticker in tickers:
+        if ticker not in disponiveis:
+            continue
+        frame = data.xs(ticker, axis=1, level=nivel)
+        if 'Close' not in frame.columns:
+            continue
+        frame = _normalize_frame(frame)
+        if not frame.empty:
+            frames[ticker] = frame
+
+    return frames
+
+
+def _frame_from_store(store, ticker, start):
+    """Monta o frame Close/Dividends do ticker a partir do armazém local."""
+    prices = store.read_prices(ticker, start)
+    if prices.empty:
+        return None
+    dividends = store.read_dividends(ticker, start)
+    frame = prices[['Close']].copy()
+    frame['Dividends'] = dividends.groupby(level=0).sum().reindex(frame.index).fillna(0.0)
+    # Proventos em datas sem pregão ficam no pregão seguinte
+    fora = dividends[~dividends.index.isin(frame.index)]
+    for data, valor in fora.items():
+        posicao = frame.index.searchsorted(data)
+        if posicao < len(frame):
+            frame.iloc[posicao, frame.columns.get_loc('Dividends')] += valor
+    return frame
+
+
+def _save_to_store(store, frames, start_por_ticker, substituir=False):
+    """Grava os frames baixados no armazém e atualiza a cobertura.
+
+    Com `substituir`, os frames trazem o histórico inteiro reajustado e trocam
+    os preços armazenados (a cobertura de preços passa a começar no início pedido).
+    """
+    today = pd.Timestamp(datetime.today()).normalize()
+    for ticker, frame in frames.items():
+        if substituir:
+            store.replace_prices(ticker, frame[['Close']])
+        else:
+            store.append_prices(ticker, frame[['Close']])
+        dividends = frame['Dividends']
+        store.append_dividends(ticker, dividends[dividends > 0])
+
+        for tipo in ('precos', 'dividendos'):
+            coverage = store.get_coverage(ticker, tipo)
+            inicio = start_por_ticker[ticker]
+            if (coverage is not None and (coverage[0] is None or coverage[0] <= inicio)
+                    and not (substituir and tipo == 'precos')):
+                inicio = coverage[0]
+            store.set_coverage(ticker, tipo, inicio, today)
+
+
+def _download_group(download_fn, grupo, inicio, max_retries):
+    """(frames do grupo baixados a partir de `inicio`, tickers cuja busca falhou).
+
+    Se todas as tentativas falharem, o grupo inteiro falhou; senão, falham os
+    tickers que o download_fn listar em attrs['falhas'] (cliente_mercado).
+    """
+    frames, falhas = {}, set()
+    for attempt in range(max_retries):
+        try:
+            data = download_fn(grupo, start=inicio.strftime('%Y-%m-%d'), actions=True,
+                               group_by='ticker', auto_adjust=True, threads=True, progress=False)
+            frames = split_batch_frame(data, grupo)
+            falhas = set(getattr(data, 'attrs', {}).get('falhas', ())) & set(grupo)
+        except Exception:
+            frames = {}
+        if frames or attempt == max_retries - 1:
+            break
+        time.sleep(1)
+    if not frames:
+        return frames, set(grupo)
+    return frames, falhas - set(frames)
+
+
+def _reload_history(store, frames, inicio_baixado, start, download_fn, max_retries):
+    """Troca o histórico armazenado dos tickers cuja base de ajuste mudou pelo histórico reajustado.
+
+    `frames` são os downloads (a partir de `inicio_baixado`) que mostraram a
+    mudança. Os que já cobrem todo o período armazenado são gravados direto;
+    os demais baixam de novo desde o início da cobertura. Quem não vier no
+    download fica com a série antiga (numa base só) e a cobertura anterior,
+    para tentar de novo na próxima análise.
+    """
+    inicios = {}
+    for ticker in frames:
+        coverage = store.get_coverage(ticker, 'precos')
+        inicio = start
+        if coverage is not None and coverage[0] is not None:
+            inicio = min(inicio, coverage[0])
+        inicios[ticker] = inicio
+
+    completos = {t: f for t, f in frames.items() if inicio_baixado <= inicios[t]}
+    _save_to_store(store, completos, {t: inicio_baixado for t in completos}, substituir=True)
+
+    faltantes = [t for t in frames if t not in completos]
+    if faltantes:
+        inicio = min(inicios[t] for t in faltantes)
+        novos, _ = _download_group(download_fn, faltantes, inicio, max_retries)
+        _save_to_store(store, novos, {t: inicio for t in novos}, substituir=True)
+
+
+class DownloadBatch(dict):
+    """dict ticker -> DataFrame(Close, Dividends) de download_batch.
+
+    `falhas` guarda os tickers de grupos cujo download falhou em todas as
+    tentativas (exceção ou nenhum frame): a ausência deles no lote não diz
+    nada sobre o ticker, só sobre a fonte (queda, limite de taxa).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.falhas = set()
+
+
+def download_batch(tickers, years=5, batch_size=BATCH_SIZE, max_retries=3,
+                   download_fn=None, on_chunk=None, store=None):
+    """Baixa preços e dividendos de todos os tickers em grupos.
+
+    Retorna DownloadBatch (dict ticker -> DataFrame(Close, Dividends)). Tickers
+    sem dados ficam de fora; os de grupos cujo download falhou (e os que o
+    download_fn apontar em attrs['falhas']) vão para `falhas`.
+    on_chunk(concluidos, total) é chamado a cada grupo.
+
+    Com `store` (MarketDataStore), tickers já cobertos e atualizados são
+    lidos do disco e os demais baixam apenas o trecho desde a última data
+    armazenada. Se o delta mostrar outra base de ajuste (provento ou
+    desdobramento novo), o histórico do ticker é baixado de novo por inteiro.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    download_fn = download_fn or _yahoo_download
+    start_dt = pd.Timestamp(datetime.today() - timedelta(days=years*365 + 100)).normalize()
+
+    batch = DownloadBatch()
+    start_por_ticker = {}
+    pendentes = tickers
+
+    if store is not None:
+        pendentes = []
+        for ticker in tickers:
+            coverage = store.get_coverage(ticker, 'precos')
+            if covers_recent(coverage, start_dt):
+                frame = _frame_from_store(store, ticker, start_dt)
+                if frame is not None:
+                    batch[ticker] = frame
+                    continue
+            start_por_ticker[ticker] = delta_start(coverage, start_dt)
+            pendentes.append(ticker)
+
+    # Tickers com o mesmo início de busca vão juntos, para não baixar histórico à toa
+    pendentes = sorted(pendentes, key=lambda t: start_por_ticker.get(t, start_dt))
+    grupos = list(_chunks(pendentes, batch_size))
+
+    for idx, grupo in enumerate(grupos):
+        inicio_grupo = min(start_por_ticker.get(t, start_dt) for t in grupo)
+        frames, falhas = _download_group(download_fn, grupo, inicio_grupo, max_retries)
+        batch.falhas.update(falhas)
+        if store is None:
+            batch.update(frames)
+        else:
+            # Provento/desdobramento novo reajusta o histórico inteiro: o delta não basta
+            reajustar = {t: f for t, f in frames.items()
+                         if adjustment_changed(store.read_prices(t, inicio_grupo), f)}
+            _save_to_store(store, {t: f for t, f in frames.items() if t not in reajustar},
+                           {t: inicio_grupo for t in frames})
+            if reajustar:
+                _reload_history(store, reajustar, inicio_grupo, start_dt, download_fn, max_retries)
+
+            # Ler do disco o histórico completo (armazenado + delta recém-baixado)
+            for ticker in grupo:
+                frame = _frame_from_store(store, ticker, start_dt)
+                if frame is not None:
+                    batch[ticker] = frame
+
+        if on_chunk:
+            on_chunk(idx + 1, len(grupos))
+
+    return batch
+
+
+def fetch_latest_prices(tickers, download_fn=None, batch_size=BATCH_SIZE, dias=7):
+    """Último fechamento de cada ticker, baixando só os pregões dos últimos `dias` dias.
+
+    Retorna Series ticker -> preço (tickers sem cotação ficam de fora).
+    """
+    tickers = list(dict.fromkeys(tickers))
+    download_fn = download_fn or _yahoo_download
+    inicio = (datetime.today() - timedelta(days=dias)).strftime('%Y-%m-%d')
+
+    precos = {}
+    for grupo in _chunks(tickers, batch_size):
+        try:
+            data = download_fn(grupo, start=inicio, actions=True, group_by='ticker',
+                               auto_adjust=True, threads=True, progress=False)
+        except Exception:
+            continue
+        for ticker, frame in split_batch_frame(data, grupo).items():
+            precos[ticker] = float(frame['Close'].iloc[-1])
+    return pd.Series(precos, dtype=float)
+
+
+def get_batch_price(batch, ticker):
+    """Último fechamento do ticker no lote (0 se indisponível)."""
+    frame = batch.get(ticker)
+    if frame is None or frame.empty:
+        return 0
+    return float(frame['Close'].iloc[-1])
+
+
+def get_batch_dividends(batch, ticker, years=5):
+    """Série de dividendos do ticker no lote, limitada aos últimos `years` anos."""
+    frame = batch.get(ticker)
+    if frame is None or frame.empty:
+        return pd.Series(dtype=float)
+
+    dividends = frame['Dividends']
+    dividends = dividends[dividends > 0]
+
+    start_dt = pd.to_datetime(datetime.today() - timedelta(days=years*365 + 100))
+    return dividends[dividends.index >= start_dt]
+
+
+def batch_miss_reason(batch, ticker, years=5):
+    """Motivo de o ticker não ter registro no lote (cache negativo) ou None se há preço e dividendos.
+
+    "Sem preço" só vale quando o grupo do ticker baixou; se o download do
+    grupo falhou (batch.falhas), o motivo é erro de busca.
+    """
+    if ticker in getattr(batch, 'falhas', ()):
+        return MOTIVO_ERRO
+    if get_batch_price(batch, ticker) == 0:
+        return MOTIVO_SEM_PRECO
+    if get_batch_dividends(batch, ticker, years).empty:
+        return MOTIVO_SEM_DIVIDENDOS
+    return None
+
+
+def fetch_stock_metadata(ticker_symbol):
+    """Busca nome e setor da ação: do cadastro de ativos ou, se ausentes/expirados, via .info.
+
+    O que vem do .info é gravado no cadastro, então cada ticker custa uma
+    chamada de rede por validade (cadastro_ativos.METADATA_VALIDADE).
+    """
+    cadastro = get_cadastro()
+    metadata = cadastro.metadata(ticker_symbol)
+    if metadata is not None:
+        return metadata
+
+    import yfinance as yf
+    try:
+        info = yf.Ticker(ticker_symbol).info or {}
+    except Exception:
+        info = {}
+    metadata = {
+        "nome_longo": info.get('longName', info.get('shortName', ticker_symbol)),
+        "setor": info.get('sector', 'N/A')
+    }
+    if info:
+        cadastro.record_metadata(ticker_symbol, metadata['nome_longo'], metadata['setor'])
+    return metadata
+
+
+def fetch_batch_record(ticker_symbol, batch, years=5, metadata_fn=fetch_stock_metadata):
+    """Monta o registro (preço, nome, setor, dividendos) do ticker a partir do lote."""
+    preco_atual = get_batch_price(batch, ticker_symbol)
+    if preco_atual == 0:
+        return None
+
+    dividends = get_batch_dividends(batch, ticker_symbol, years)
+    if dividends.empty:
+        return None
+
+    info = metadata_fn(ticker_symbol)
+    return {
+        'ticker': ticker_symbol,
+        'nome': info['nome_longo'],
+        'categoria': categorize_ticker(ticker_symbol),
+        'setor': info['setor'],
+        'preco': preco_atual,
+        'dividends': dividends
+    }
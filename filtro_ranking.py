@@ -0,0 +1,113 @@
+"""
+Filtros e paginação do ranking sem recriar o DataFrame a cada interação.
+
+A cada movimento de slider a aba de ranking refazia df_filtrado com várias
+máscaras booleanas e .copy() e mandava a tabela inteira pelo Styler, que
+passa a dominar o tempo de resposta com alguns milhares de ativos.
+
+RankingIndex é montado uma vez por ranking: códigos de categoria/setor
+agrupados por valor (posições + offsets), dy_12m e consistencia ordenados
+(valores + posições via argsort) e a ordem por score. Um filtro vira
+searchsorted nos arrays ordenados e a marcação das posições num vetor
+booleano; o resultado são as posições das linhas, já na ordem do score.
+Só a página visível é materializada (iloc) e estilizada.
+"""
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_DIMENSIONS = ('categoria', 'setor')
+NUMERIC_DIMENSIONS = ('dy_12m', 'consistencia')
+DEFAULT_PAGE_SIZE = 50
+
+
+class RankingIndex:
+    """Índices ordenados das dimensões de filtro de um ranking (imutável)."""
+
+    def __init__(self, df_ranking, sort_by='score'):
+        self.df = df_ranking
+        self.n = len(df_ranking)
+
+        # Categóricas: posições agrupadas pelo código do valor
+        self._categorias = {}
+        for coluna in CATEGORICAL_DIMENSIONS:
+            codigos, valores = pd.factorize(df_ranking[coluna], sort=True)
+            ordem = np.argsort(codigos, kind='stable')
+            offsets = np.searchsorted(codigos[ordem], np.arange(len(valores) + 1))
+            self._categorias[coluna] = (pd.Index(valores), codigos, ordem, offsets)
+
+        # Numéricas: valores ordenados e a posição de cada um
+        self._numericas = {}
+        for coluna in NUMERIC_DIMENSIONS:
+            valores = df_ranking[coluna].to_numpy(dtype=float)
+            ordem = np.argsort(valores, kind='stable')
+            # NaN fica no fim da ordenação e fora de qualquer intervalo
+            self._numericas[coluna] = (valores[ordem], ordem, int(np.count_nonzero(~np.isnan(valores))))
+
+        self._ordem = np.argsort(-df_ranking[sort_by].to_numpy(dtype=float), kind='stable')
+
+    def matches(self, df_ranking):
+        """True se o índice foi montado para este mesmo DataFrame."""
+        return self.df is df_ranking
+
+    def values(self, coluna):
+        """Valores distintos (ordenados) de uma dimensão categórica."""
+        return self._categorias[coluna][0].tolist()
+
+    def _equal(self, coluna, valor):
+        valores, _, ordem, offsets = self._categorias[coluna]
+        codigo = valores.get_indexer([valor])[0]
+        if codigo < 0:
+            return ordem[:0]
+        return ordem[offsets[codigo]:offsets[codigo + 1]]
+
+    def _between(self, coluna, minimo=None, maximo=None):
+        ordenados, ordem, validos = self._numericas[coluna]
+        ordenados = ordenados[:validos]
+        inicio = 0 if minimo is None else np.searchsorted(ordenados, minimo, side='left')
+        fim = validos if maximo is None else np.searchsorted(ordenados, maximo, side='right')
+        return ordem[inicio:fim]
+
+    def filter(self, categoria=None, setor=None, dy_min=None, dy_max=None, consistencia_min=None):
+        """Posições das linhas que passam nos filtros, ordenadas por score (maior primeiro).
+
+        None (ou 'Todos' nas categóricas) desativa o filtro daquela dimensão.
+        """
+        selecoes = []
+        for coluna, valor in (('categoria', categoria), ('setor', setor)):
+            if valor is not None and valor != 'Todos':
+                selecoes.append(self._equal(coluna, valor))
+        if dy_min is not None or dy_max is not None:
+            selecoes.append(self._between('dy_12m', dy_min, dy_max))
+        if consistencia_min is not None:
+            selecoes.append(self._between('consistencia', consistencia_min))
+
+        if not selecoes:
+            return self._ordem
+
+        # Começa pela seleção menor; cada uma marca suas posições e a interseção é o AND
+        selecoes.sort(key=len)
+        mask = np.zeros(self.n, dtype=bool)
+        mask[selecoes[0]] = True
+        for selecao in selecoes[1:]:
+            marcadas = np.zeros(self.n, dtype=bool)
+            marcadas[selecao] = True
+            mask &= marcadas
+        return self._ordem[mask[self._ordem]]
+
+    def count_by(self, coluna, posicoes):
+        """Quantidade de linhas de `posicoes` por valor de uma dimensão categórica."""
+        valores, codigos, _, _ = self._categorias[coluna]
+        codigos = codigos[posicoes]
+        contagem = np.bincount(codigos[codigos >= 0], minlength=len(valores))
+        return pd.Series(contagem, index=valores)[lambda s: s > 0]
+
+
+def page_count(total, page_size=DEFAULT_PAGE_SIZE):
+    return max(1, -(-total // page_size))
+
+
+def page_positions(posicoes, pagina, page_size=DEFAULT_PAGE_SIZE):
+    """Posições da página (1-based) dentro do resultado filtrado."""
+    inicio = (max(1, pagina) - 1) * page_size
+    return posicoes[inicio:inicio + page_size]
@@ -0,0 +1,303 @@
+"""
+Históricos de dividendos em formato colunar, compartilhados entre DataFrames.
+
+Em vez de uma pd.Series por linha na coluna dividends_history (objetos que
+são copiados a cada df.copy(), filtro e carteira, e mantidos por sessão em
+st.session_state), os históricos de todos os tickers ficam num único
+DividendHistoryStore imutável: códigos dos tickers, offsets e dois arrays
+contíguos com as datas (int64, ns) e os valores (float64) de todos os
+eventos. O histórico do ticker i ocupa datas[offsets[i]:offsets[i+1]].
+
+Os eventos de cada ticker ficam em ordem de data e o store guarda as somas
+de prefixo dos valores e uma chave (posição do ticker, dia) crescente em
+todo o array. Somas em janelas (12 meses, DY numa data, totais por ano) e
+os eventos de um intervalo saem de busca binária nessas chaves e de uma
+diferença de prefixos, em O(log n), sem filtrar nem copiar Series.
+
+O ranking referencia o store por df.attrs[HISTORY_ATTR] e cada linha é
+localizada pelo código do ticker. O pandas propaga attrs em cópias, filtros,
+seleções de colunas e ordenações, e o store devolve a si mesmo em
+copy/deepcopy, então todas essas operações compartilham os mesmos arrays.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from registro_compacto import dividends_to_arrays, arrays_to_dividends
+
+HISTORY_ATTR = 'historico_dividendos'
+DAY_NS = 86_400_000_000_000
+# Chave de busca: posição do ticker nos bits altos, dia (deslocado para >= 0) nos 32 bits baixos
+_DAY_BITS = 32
+_DAY_SHIFT = 2 ** 31
+
+
+
+def _readonly(array, dtype):
+    array = np.ascontiguousarray(array, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+class DividendHistoryStore:
+    """Históricos de dividendos de vários tickers em arrays contíguos (imutável)."""
+
+    __slots__ = ('tickers', 'offsets', 'datas', 'valores', '_posicoes', '_acumulado', '_chaves')
+
+    def __init__(self, tickers, offsets, datas, valores):
+        self.tickers = _readonly(tickers, object)
+        self.offsets = _readonly(offsets, np.int64)
+        self.datas = _readonly(datas, np.int64)
+        self.valores = _readonly(valores, np.float64)
+        self._posicoes = pd.Index(self.tickers)
+        if len(self.offsets) != len(self.tickers) + 1 or self.offsets[-1] != len(self.datas):
+            raise ValueError("offsets incompatíveis com tickers/eventos")
+
+        # Índice por data: somas de prefixo e chaves (posição, dia) crescentes
+        self._acumulado = _readonly(np.concatenate([[0.0], np.cumsum(self.valores)]), np.float64)
+        segmento = np.repeat(np.arange(len(self.tickers), dtype=np.int64), np.diff(self.offsets))
+        self._chaves = _readonly((segmento << _DAY_BITS) + (self.datas // DAY_NS + _DAY_SHIFT), np.int64)
+
+    def __reduce__(self):
+        # Os índices derivados são refeitos na leitura (snapshots, caches)
+        return (DividendHistoryStore, (self.tickers, self.offsets, self.datas, self.valores))
+
+    # --- Construção ---
+
+    @classmethod
+    def empty(cls):
+        return cls([], [0], [], [])
+
+    @classmethod
+    def from_arrays(cls, por_ticker):
+        """A partir de pares ticker -> (datas int64, valores float64); o primeiro de cada ticker vale.
+
+        Os eventos de cada ticker são ordenados por data, se ainda não estiverem.
+        """
+        unicos = {}
+        for ticker, arrays in por_ticker:
+            unicos.setdefault(ticker, arrays)
+        if not unicos:
+            return cls.empty()
+        datas, valores = [], []
+        for d, v in unicos.values():
+            d, v = np.asarray(d, dtype=np.int64), np.asarray(v, dtype=np.float64)
+            if len(d) > 1 and (np.diff(d) < 0).any():
+                ordem = np.argsort(d, kind='stable')
+                d, v = d[ordem], v[ordem]
+            datas.append(d)
+            valores.append(v)
+        offsets = np.concatenate([[0], np.cumsum([len(d) for d in datas])])
+        return cls(list(unicos), offsets, np.concatenate(datas), np.concatenate(valores))
+
+    @classmethod
+    def from_series(cls, ticker, dividends):
+        """Store de um único ticker a partir da série de dividendos."""
+        return cls.from_arrays([(ticker, dividends_to_arrays(dividends))])
+
+    @classmethod
+    def from_records(cls, records, key='dividends'):
+        """A partir de registros {'ticker', key: Series de dividendos, ...}."""
+        return cls.from_arrays((r['ticker'], dividends_to_arrays(r.get(key))) for r in records if r)
+
+    @classmethod
+    def concat(cls, stores):
+        """Junta vários stores (se um ticker se repete, vale o primeiro)."""
+        stores = [s for s in stores if s is not None and len(s)]
+        if len(stores) == 1:
+            return stores[0]
+        return cls.from_arrays((t, s.arrays(t)) for s in stores for t in s.tickers)
+
+    def subset(self, tickers):
+        """Store só com os tickers pedidos, na ordem dada (os ausentes ficam de fora)."""
+        posicoes = self.positions(tickers)
+        posicoes = posicoes[posicoes >= 0]
+        if len(posicoes) == len(self.tickers) and np.array_equal(posicoes, np.arange(len(self.tickers))):
+            return self
+        indices, lengths = self._gather(posicoes)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        return DividendHistoryStore(self.tickers[posicoes], offsets, self.datas[indices], self.valores[indices])
+
+    # --- Consulta ---
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self._posicoes
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.datas.nbytes + self.valores.nbytes + self.tickers.nbytes
+
+    def positions(self, tickers):
+        """Posição de cada ticker no store (-1 se ausente)."""
+        return self._posicoes.get_indexer(pd.Index(np.asarray(tickers, dtype=object)))
+
+    def arrays(self, ticker):
+        """(datas int64, valores float64) do ticker, como views somente leitura."""
+        posicao = self._posicoes.get_indexer([ticker])[0]
+        if posicao < 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        inicio, fim = self.offsets[posicao], self.offsets[posicao + 1]
+        return self.datas[inicio:fim], self.valores[inicio:fim]
+
+    def series(self, ticker):
+        """Histórico do ticker como pd.Series (vazia se ausente)."""
+        return arrays_to_dividends(*self.arrays(ticker))
+
+    def _gather(self, posicoes):
+        """Índices dos eventos das posições dadas, concatenados, e o tamanho de cada trecho."""
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        validas = posicoes >= 0
+        inicios = np.where(validas, self.offsets[np.where(validas, posicoes, 0)], 0)
+        fins = np.where(validas, self.offsets[np.where(validas, posicoes, 0) + 1], 0)
+        return self._gather_ranges(inicios, fins)
+
+    @staticmethod
+    def _gather_ranges(inicios, fins):
+        """Índices dos trechos [inicio, fim) concatenados e o tamanho de cada trecho."""
+        lengths = fins - inicios
+        deslocamento = np.repeat(inicios - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return np.arange(lengths.sum()) + deslocamento, lengths
+
+    # --- Consultas por data (busca binária + somas de prefixo) ---
+
+    def _bounds(self, posicoes, inicio=None, fim=None):
+        """Trecho [esquerda, direita) dos eventos com inicio <= data <= fim, por posição.
+
+        inicio/fim: datas (ou arrays de datas, uma por posição); None deixa o lado aberto.
+        Posições ausentes (-1) recebem um trecho vazio.
+        """
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        validas = posicoes >= 0
+        base = np.where(validas, posicoes, 0) << _DAY_BITS
+        if inicio is None:
+            esquerda = self.offsets[np.where(validas, posicoes, 0)]
+        else:
+            esquerda = np.searchsorted(self._chaves, base + _day_key(inicio, acima=True), side='left')
+        if fim is None:
+            direita = self.offsets[np.where(validas, posicoes, 0) + 1]
+        else:
+            direita = np.searchsorted(self._chaves, base + _day_key(fim), side='right')
+        direita = np.where(validas, np.maximum(direita, esquerda), esquerda)
+        return esquerda, direita
+
+    def window_arrays(self, ticker, inicio=None, fim=None):
+        """(datas, valores) do ticker com inicio <= data <= fim, como views somente leitura."""
+        esquerda, direita = self._bounds(self.positions([ticker]), inicio, fim)
+        return self.datas[esquerda[0]:direita[0]], self.valores[esquerda[0]:direita[0]]
+
+    def window_sums(self, tickers, inicio=None, fim=None):
+        """Soma dos dividendos de cada ticker com inicio <= data <= fim (0 se ausente)."""
+        esquerda, direita = self._bounds(self.positions(tickers), inicio, fim)
+        return self._acumulado[direita] - self._acumulado[esquerda]
+
+    def trailing_sums(self, tickers, as_of=None, dias=365):
+        """Soma dos dividendos nos `dias` até `as_of` (inclusive), por ticker."""
+        as_of = pd.Timestamp(as_of if as_of is not None else datetime.today()).normalize()
+        return self.window_sums(tickers, as_of - timedelta(days=dias), as_of)
+
+    def annual_table(self, tickers, inicio, fim):
+        """DataFrame anos × tickers com a soma dos dividendos de cada ano no período (NaN em anos sem eventos)."""
+        inicio, fim = pd.Timestamp(inicio).normalize(), pd.Timestamp(fim).normalize()
+        anos = np.arange(inicio.year, fim.year + 1)
+        tickers = list(tickers)
+        primeiros = (anos - 1970).astype('datetime64[Y]').astype('datetime64[ns]')
+        ultimos = (anos - 1969).astype('datetime64[Y]').astype('datetime64[ns]') - np.timedelta64(1, 'D')
+        inicios = np.maximum(primeiros, np.datetime64(inicio, 'ns'))
+        fins = np.minimum(ultimos, np.datetime64(fim, 'ns'))
+        # Grade ticker × ano numa única busca binária
+        posicoes = np.repeat(self.positions(tickers), len(anos))
+        esquerda, direita = self._bounds(posicoes, np.tile(inicios, len(tickers)), np.tile(fins, len(tickers)))
+        somas = np.where(direita > esquerda, self._acumulado[direita] - self._acumulado[esquerda], np.nan)
+        return pd.DataFrame(somas.reshape(len(tickers), len(anos)).T,
+                            index=pd.Index(anos, name='Ano'), columns=tickers)
+
+    def annual_sums(self, ticker, inicio, fim):
+        """Series ano -> soma dos dividendos no período (só anos com eventos)."""
+        anuais = self.annual_table([ticker], inicio, fim).iloc[:, 0].dropna()
+        return pd.Series(anuais.to_numpy(), index=anuais.index.to_numpy())
+
+    def events(self, tickers, inicio=None, fim=None):
+        """Eventos dos tickers em formato longo: (linha em `tickers`, datas int64, valores).
+
+        Com inicio/fim, só os eventos do intervalo (localizados por busca binária).
+        """
+        if inicio is None and fim is None:
+            indices, lengths = self._gather(self.positions(tickers))
+        else:
+            indices, lengths = self._gather_ranges(*self._bounds(self.positions(tickers), inicio, fim))
+        linhas = np.repeat(np.arange(len(lengths)), lengths)
+        return linhas, self.datas[indices], self.valores[indices]
+
+    def to_long(self, tickers=None):
+        """DataFrame longo ticker/date/amount (formato de metricas_lote.records_to_long)."""
+        tickers = self.tickers if tickers is None else np.asarray(tickers, dtype=object)
+        linhas, datas, valores = self.events(tickers)
+        return pd.DataFrame({
+            'ticker': tickers[linhas],
+            'date': datas.astype('datetime64[ns]'),
+            'amount': valores
+        })
+
+
+def _day_key(datas, acima=False):
+    """Dia (deslocado) das datas, no formato dos 32 bits baixos das chaves do store.
+
+    Os eventos ficam à meia-noite; com acima=True um horário conta como o dia seguinte,
+    então `data >= inicio` e `data <= fim` valem como na comparação de timestamps.
+    """
+    if isinstance(datas, np.ndarray):
+        ns = datas.astype('datetime64[ns]').astype(np.int64)
+    else:
+        ns = pd.Timestamp(datas).value
+    dias = -(-ns // DAY_NS) if acima else ns // DAY_NS
+    return dias + _DAY_SHIFT
+
+
+_EMPTY_STORE = DividendHistoryStore.empty()
+
+
+def get_history_store(df):
+    """Store de históricos referenciado pelo DataFrame (vazio se não houver)."""
+    store = df.attrs.get(HISTORY_ATTR) if df is not None else None
+    return store if store is not None else _EMPTY_STORE
+
+
+def attach_history(df, store):
+    """Associa o store ao DataFrame (sem copiar os arrays) e devolve o próprio df."""
+    df.attrs[HISTORY_ATTR] = store
+    return df
+
+
+def without_history(df):
+    """Cópia rasa do df sem o store em attrs, para exibir no st.dataframe.
+
+    O Arrow só serializa attrs em JSON; com o store ele avisa e descarta os attrs.
+    """
+    tabela = df.copy(deep=False)
+    tabela.attrs.pop(HISTORY_ATTR, None)
+    return tabela
+
+
+def dividend_history(df, ticker):
+    """Histórico de dividendos do ticker como pd.Series, a partir do store do DataFrame."""
+    return get_history_store(df).series(ticker)
+
+
+def concat_rankings(frames):
+    """pd.concat de rankings que juntou também os stores de históricos."""
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    ranking = pd.concat(frames, ignore_index=True)
+    return attach_history(ranking, DividendHistoryStore.concat(get_history_store(f) for f in frames))
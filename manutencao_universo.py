@@ -0,0 +1,198 @@
+"""
+Manutenção do universo: deduplicação e quarentena de tickers sem cotação.
+
+Tickers deslistados (BRML3, BTOW3, CIEL3...) continuam nas listas estáticas e,
+a cada análise completa, consomem download, retries e esperas sem nunca
+trazer cotação nova. Este estágio registra, entre execuções, quantas análises
+seguidas cada ticker ficou sem cotação recente. Os registros ficam na tabela
+saude_tickers de dados/cadastro.sqlite.
+
+Com FALHAS_PARA_QUARENTENA falhas seguidas o ticker entra em quarentena e só
+volta a ser consultado na data de reavaliação. O intervalo dobra a cada nova
+falha (1, 2, 4... dias, até REAVALIACAO_MAXIMA). Uma cotação recente zera o
+contador e tira o ticker da quarentena.
+
+effective_universe(tickers) devolve os tickers a analisar e um relatório com
+duplicatas removidas, tickers em quarentena e reavaliações do dia.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cadastro_ativos import DEFAULT_CADASTRO_PATH
+
+FALHAS_PARA_QUARENTENA = 2
+REAVALIACAO_INICIAL = timedelta(days=1)
+REAVALIACAO_MAXIMA = timedelta(days=64)
+# Último pregão mais antigo que isso conta como falha (ticker deslistado ou suspenso)
+COTACAO_RECENTE = timedelta(days=15)
+
+
+def recheck_interval(falhas):
+    """Intervalo até a próxima consulta de um ticker com `falhas` falhas seguidas (None fora da quarentena)."""
+    if falhas < FALHAS_PARA_QUARENTENA:
+        return None
+    return min(REAVALIACAO_INICIAL * 2 ** (falhas - FALHAS_PARA_QUARENTENA), REAVALIACAO_MAXIMA)
+
+
+def has_recent_price(frame, agora=None, recente=COTACAO_RECENTE):
+    """Indica se o DataFrame de preços (índice por data) tem cotação nos últimos `recente` dias."""
+    if frame is None or frame.empty or 'Close' not in frame:
+        return False
+    closes = frame['Close'].dropna()
+    if closes.empty:
+        return False
+    ultima = pd.Timestamp(closes.index.max())
+    if ultima.tz is not None:
+        ultima = ultima.tz_localize(None)
+    return ultima >= pd.Timestamp(agora if agora is not None else datetime.now()).normalize() - recente
+
+
+class UniverseHealth:
+    """Falhas seguidas e agenda de reavaliação por ticker, em SQLite."""
+
+    def __init__(self, path=DEFAULT_CADASTRO_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS saude_tickers (
+                    ticker TEXT PRIMARY KEY, falhas INTEGER NOT NULL,
+                    ultima_falha TEXT, ultimo_sucesso TEXT, proxima_verificacao TEXT)
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # --- Consulta ---
+
+    def status(self, tickers=None):
+        """DataFrame por ticker com falhas seguidas, última falha/sucesso e próxima verificação."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM saude_tickers").fetchall()
+        status = pd.DataFrame(rows, columns=["ticker", "falhas", "ultima_falha", "ultimo_sucesso",
+                                             "proxima_verificacao"]).set_index("ticker")
+        for coluna in ("ultima_falha", "ultimo_sucesso", "proxima_verificacao"):
+            status[coluna] = pd.to_datetime(status[coluna])
+        if tickers is not None:
+            status = status[status.index.isin(list(tickers))]
+        return status
+
+    def quarantined(self, agora=None):
+        """Tickers em quarentena: dict ticker -> data da próxima verificação (ainda no futuro)."""
+        agora = agora or datetime.now()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT ticker, proxima_verificacao FROM saude_tickers "
+                "WHERE proxima_verificacao IS NOT NULL AND proxima_verificacao > ?",
+                (agora.isoformat(timespec="seconds"),)
+            ).fetchall()
+        return {ticker: datetime.fromisoformat(proxima) for ticker, proxima in rows}
+
+    def effective_universe(self, tickers, incluir_quarentena=False, agora=None):
+        """Tickers a analisar (sem duplicatas nem quarentenados) e o relatório da seleção.
+
+        O relatório (dict) traz 'total' (recebidos), 'duplicados', 'quarentena'
+        (tickers pulados -> próxima verificação), 'reavaliacao' (quarentenados
+        cuja verificação venceu e voltam nesta execução) e 'efetivos'.
+        """
+        agora = agora or datetime.now()
+        tickers = list(tickers)
+        unicos = list(dict.fromkeys(str(t).strip().upper() for t in tickers if str(t).strip()))
+
+        em_quarentena = {} if incluir_quarentena else self.quarantined(agora)
+        status = self.status(unicos)
+        vencidos = status[(status["falhas"] >= FALHAS_PARA_QUARENTENA) & (status["proxima_verificacao"] <= agora)]
+
+        efetivos = [t for t in unicos if t not in em_quarentena]
+        relatorio = {
+            'total': len(tickers),
+            'duplicados': len(tickers) - len(unicos),
+            'quarentena': {t: em_quarentena[t] for t in unicos if t in em_quarentena},
+            'reavaliacao': [t for t in efetivos if t in vencidos.index],
+            'efetivos': len(efetivos)
+        }
+        return efetivos, relatorio
+
+    # --- Escrita ---
+
+    def record_results(self, sucessos, falhas, agora=None):
+        """Zera o contador dos tickers com cotação e soma uma falha (reagendando) nos demais."""
+        agora = (agora or datetime.now()).replace(microsecond=0)
+        agora_str = agora.isoformat()
+        sucessos, falhas = list(dict.fromkeys(sucessos)), list(dict.fromkeys(falhas))
+        with self._lock, self._connect() as conn:
+            anteriores = dict(conn.execute(
+                f"SELECT ticker, falhas FROM saude_tickers WHERE ticker IN ({', '.join('?' * len(falhas))})",
+                falhas
+            ).fetchall()) if falhas else {}
+
+            linhas = []
+            for ticker in falhas:
+                n = anteriores.get(ticker, 0) + 1
+                intervalo = recheck_interval(n)
+                linhas.append((ticker, n, agora_str, (agora + intervalo).isoformat() if intervalo else None))
+            conn.executemany(
+                "INSERT INTO saude_tickers (ticker, falhas, ultima_falha, proxima_verificacao) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(ticker) DO UPDATE SET falhas = excluded.falhas, ultima_falha = excluded.ultima_falha, "
+                "proxima_verificacao = excluded.proxima_verificacao",
+                linhas
+            )
+            conn.executemany(
+                "INSERT INTO saude_tickers (ticker, falhas, ultimo_sucesso) VALUES (?, 0, ?) "
+                "ON CONFLICT(ticker) DO UPDATE SET falhas = 0, ultimo_sucesso = excluded.ultimo_sucesso, "
+                "proxima_verificacao = NULL",
+                [(ticker, agora_str) for ticker in sucessos]
+            )
+
+    def record_batch(self, batch, tickers, agora=None):
+        """Registra o resultado de um download_batch: sem cotação recente conta como falha.
+
+        Tickers de grupos cujo download falhou inteiro (batch.falhas: queda do
+        Yahoo, limite de taxa) não contam nem como sucesso nem como falha.
+        Retorna a lista de tickers sem cotação recente.
+        """
+        grupos_falhos = getattr(batch, 'falhas', ())
+        sucessos, falhas = [], []
+        for ticker in tickers:
+            if ticker in grupos_falhos:
+                continue
+            (sucessos if has_recent_price(batch.get(ticker), agora) else falhas).append(ticker)
+        self.record_results(sucessos, falhas, agora)
+        return falhas
+
+
+def describe_universe_report(relatorio):
+    """Resumo em uma linha do relatório de effective_universe."""
+    partes = [f"{relatorio['efetivos']} de {relatorio['total']} tickers a analisar"]
+    if relatorio['duplicados']:
+        partes.append(f"{relatorio['duplicados']} duplicados removidos")
+    if relatorio['quarentena']:
+        proxima = min(relatorio['quarentena'].values())
+        partes.append(f"{len(relatorio['quarentena'])} em quarentena sem cotação "
+                      f"(próxima reavaliação em {proxima:%d/%m/%Y %H:%M})")
+    if relatorio['reavaliacao']:
+        partes.append(f"{len(relatorio['reavaliacao'])} saindo da quarentena para reavaliação")
+    return "; ".join(partes)
+
+
+_default_health = None
+_default_health_lock = threading.Lock()
+
+
+def get_universe_health():
+    """Instância compartilhada no caminho padrão do cadastro."""
+    global _default_health
+    with _default_health_lock:
+        if _default_health is None:
+            _default_health = UniverseHealth()
+        return _default_health
@@ -0,0 +1,278 @@
+"""
+Cálculo em lote das métricas de dividendos.
+
+Recebe os dividendos de todo o universo em formato longo (ticker, data,
+valor) e um vetor de preços, e calcula DY 12M, DY médio, consistência,
+CAGR e score composto para todos os tickers com operações agrupadas, em
+vez de um cálculo escalar por ticker seguido de append em lista.
+
+O cálculo é separado em agregados de dividendos (independentes do preço) e
+na derivação de DY/score a partir deles: quando só os preços mudam,
+reprice_ranking reaproveita os agregados persistidos e refaz apenas as
+divisões, para o ranking inteiro de uma vez. Os agregados só mudam quando
+um evento entra ou sai das janelas; aggregate_validity diz até quando os
+calculados numa data continuam valendo.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from historico_dividendos import DividendHistoryStore, attach_history, get_history_store
+
+# Ponderação do score composto: DY 40%, Consistência 30%, Crescimento 30%
+SCORE_WEIGHTS = {'dy': 0.4, 'consistencia': 0.3, 'cagr': 0.3}
+CAGR_CAP = 20
+
+METRIC_COLUMNS = ['dy_12m', 'dy_medio', 'consistencia', 'cagr_dividendos', 'anos_com_div', 'score']
+AGGREGATE_COLUMNS = ['soma_12m', 'media_anual', 'anos_com_div', 'cagr']
+VALIDITY_COLUMNS = ['ultimo_div', 'eventos', 'valido_ate']
+
+
+def records_to_long(records):
+    """Converte registros {'ticker', 'dividends', ...} em DataFrame longo ticker/date/amount."""
+    tickers, datas, valores = [], [], []
+    for record in records:
+        dividends = record.get('dividends')
+        if dividends is None or len(dividends) == 0:
+            continue
+        index = pd.DatetimeIndex(dividends.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        tickers.append(np.full(len(dividends), record['ticker'], dtype=object))
+        datas.append(index.values)
+        valores.append(np.asarray(dividends.values, dtype=float))
+
+    if not tickers:
+        return pd.DataFrame({'ticker': pd.Series(dtype=object),
+                             'date': pd.Series(dtype='datetime64[ns]'),
+                             'amount': pd.Series(dtype=float)})
+
+    return pd.DataFrame({
+        'ticker': np.concatenate(tickers),
+        'date': np.concatenate(datas),
+        'amount': np.concatenate(valores)
+    })
+
+
+def _window(years, as_of):
+    """(data final, início do histórico, início dos últimos 12 meses)."""
+    end_date = pd.to_datetime(as_of if as_of is not None else datetime.today())
+    return end_date, end_date - timedelta(days=years*365 + 100), end_date - timedelta(days=365)
+
+
+def compute_dividend_aggregates(dividends_long, years=5, as_of=None):
+    """Agregados de dividendos por ticker que não dependem do preço.
+
+    Retorna DataFrame indexado por ticker com soma_12m, media_anual,
+    anos_com_div e cagr (apenas tickers com dividendos no período). Junto
+    com um vetor de preços, basta para derivar DY e score
+    (metrics_from_aggregates), então pode ser persistido e reaproveitado
+    quando só os preços mudam.
+    """
+    end_date, start_date, start_12m = _window(years, as_of)
+
+    df = dividends_long
+    df = df[(df['date'] >= start_date) & (df['date'] <= end_date) & (df['amount'] > 0)]
+
+    if df.empty:
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS, index=pd.Index([], name='ticker'))
+
+    # Dividendos anuais por ticker (apenas anos com pagamento)
+    por_ano = df.groupby(['ticker', df['date'].dt.year])['amount'].sum()
+    anual = por_ano.groupby(level=0).agg(['mean', 'count', 'first', 'last'])
+
+    soma_12m = df[df['date'] >= start_12m].groupby('ticker')['amount'].sum()
+    anos_com_div = anual['count'].astype(int)
+
+    # Crescimento (CAGR) entre o primeiro e o último ano com dividendos
+    num_years = anos_com_div - 1
+    valido = (anos_com_div >= 2) & (anual['first'] > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = ((anual['last'] / anual['first']) ** (1 / num_years.where(valido, 1)) - 1) * 100
+    cagr = cagr.where(valido, 0.0)
+
+    aggregates = pd.DataFrame({
+        'soma_12m': soma_12m.reindex(anual.index).fillna(0.0),
+        'media_anual': anual['mean'],
+        'anos_com_div': anos_com_div,
+        'cagr': cagr
+    })
+    aggregates.index.name = 'ticker'
+    return aggregates
+
+
+def aggregate_validity(dividends_long, years=5, as_of=None):
+    """Chave e validade dos agregados calculados em as_of, por ticker (os mesmos de compute_dividend_aggregates).
+
+    Os agregados dependem só de quais eventos caem no histórico e nos últimos
+    12 meses. Retorna DataFrame com 'ultimo_div' (último evento) e 'eventos'
+    (eventos desde o início do histórico), que mudam quando chega um evento
+    novo, e 'valido_ate': a primeira data em que um evento sai de uma janela
+    ou um evento futuro entra.
+    """
+    end_date, start_date, start_12m = _window(years, as_of)
+
+    df = dividends_long
+    df = df[(df['date'] >= start_date) & (df['amount'] > 0)]
+    na_janela = df.loc[df['date'] <= end_date, 'ticker'].unique()
+    df = df[df['ticker'].isin(na_janela)]
+
+    datas = df['date']
+    mudanca = datas.where(datas > end_date)
+    mudanca = mudanca.fillna((datas + timedelta(days=365)).where(datas >= start_12m))
+    mudanca = mudanca.fillna(datas + (end_date - start_date))
+
+    por_ticker = pd.DataFrame({'ticker': df['ticker'], 'date': datas, 'mudanca': mudanca}).groupby('ticker')
+    validity = pd.DataFrame({
+        'ultimo_div': por_ticker['date'].max(),
+        'eventos': por_ticker['date'].size().astype(int),
+        'valido_ate': por_ticker['mudanca'].min()
+    }, columns=VALIDITY_COLUMNS)
+    validity.index.name = 'ticker'
+    return validity
+
+
+def composite_score(dy_12m, consistencia, cagr, weights=None, cagr_cap=CAGR_CAP):
+    """Score composto (Series ou arrays NumPy): DY, consistência e CAGR limitado a [0, cagr_cap]."""
+    weights = weights or SCORE_WEIGHTS
+    return (dy_12m * weights['dy']) + (consistencia * weights['consistencia']) + \
+           (np.clip(cagr, 0, cagr_cap) * weights['cagr'])
+
+
+def metrics_from_aggregates(aggregates, prices, years=5, weights=None, cagr_cap=CAGR_CAP):
+    """DY, consistência, CAGR e score a partir dos agregados e de um vetor de preços.
+
+    Só divisões e somas vetorizadas: é o que roda quando apenas os preços mudam.
+    Retorna DataFrame indexado por ticker (na ordem de `prices`) com os tickers
+    que têm preço > 0 e agregados.
+    """
+    prices = pd.Series(prices, dtype=float)
+    prices = prices[prices > 0]
+
+    ordem = prices.index[aggregates.index.get_indexer(prices.index) >= 0]
+    agregados = aggregates.reindex(ordem)
+    preco = prices.reindex(ordem)
+
+    dy_12m = agregados['soma_12m'] / preco * 100
+    dy_medio = agregados['media_anual'] / preco * 100
+    anos_com_div = agregados['anos_com_div'].astype(int)
+    consistencia = anos_com_div / years * 100
+    cagr = agregados['cagr'].astype(float)
+
+    score = composite_score(dy_12m, consistencia, cagr, weights, cagr_cap)
+
+    result = pd.DataFrame({
+        'dy_12m': dy_12m.round(2),
+        'dy_medio': dy_medio.round(2),
+        'consistencia': consistencia.round(1),
+        'cagr_dividendos': cagr.round(2),
+        'anos_com_div': anos_com_div,
+        'score': score.round(2)
+    })
+    result.index.name = 'ticker'
+    return result
+
+
+def compute_metrics_batch(dividends_long, prices, years=5, as_of=None, weights=None, cagr_cap=CAGR_CAP):
+    """Calcula as métricas de dividendos de todos os tickers de uma vez.
+
+    dividends_long: DataFrame com colunas ticker, date, amount.
+    prices: Series ticker -> preço atual.
+    Retorna DataFrame indexado por ticker (na ordem de `prices`) apenas com
+    os tickers que têm preço > 0 e dividendos no período.
+    """
+    prices = pd.Series(prices, dtype=float)
+    prices = prices[prices > 0]
+    dividends_long = dividends_long[dividends_long['ticker'].isin(prices.index)]
+
+    aggregates = compute_dividend_aggregates(dividends_long, years, as_of)
+    if aggregates.empty:
+        return pd.DataFrame(columns=METRIC_COLUMNS, index=pd.Index([], name='ticker'))
+    return metrics_from_aggregates(aggregates, prices, years, weights, cagr_cap)
+
+
+def _assemble_ranking(base, historico, years=5, as_of=None, weights=None):
+    """Ranking com as colunas descritivas de `base` (uma linha por ticker) e as métricas.
+
+    Os históricos ficam no DividendHistoryStore associado ao DataFrame
+    (historico_dividendos.attach_history), não numa coluna.
+    """
+    prices = pd.Series(base['preco'].to_numpy(dtype=float), index=base['ticker'].to_numpy(dtype=object))
+    metrics = compute_metrics_batch(historico.to_long(prices.index), prices, years, as_of, weights)
+    if metrics.empty:
+        return pd.DataFrame()
+
+    base = base.set_index('ticker', drop=False).loc[metrics.index]
+    ranking = pd.concat([base, metrics], axis=1).reset_index(drop=True)
+    return attach_history(ranking, historico.subset(metrics.index))
+
+
+def build_ranking(records, years=5, as_of=None, weights=None):
+    """Monta o DataFrame de ranking a partir dos registros baixados.
+
+    Cada registro traz ticker, preco, dividends e campos descritivos (nome,
+    setor, categoria...), que são mantidos na ordem em que aparecem.
+    """
+    records = [r for r in records if r]
+    if not records:
+        return pd.DataFrame()
+
+    base = pd.DataFrame([{k: v for k, v in r.items() if k != 'dividends'} for r in records])
+    return _assemble_ranking(base.drop_duplicates('ticker'), DividendHistoryStore.from_records(records),
+                             years, as_of, weights)
+
+
+def rescore_ranking(df_ranking, years=5, as_of=None, weights=None):
+    """Recalcula as métricas de um ranking já montado, sem acessar a rede."""
+    if df_ranking is None or df_ranking.empty:
+        return df_ranking
+    base = df_ranking[[c for c in df_ranking.columns if c not in METRIC_COLUMNS]]
+    return _assemble_ranking(base, get_history_store(df_ranking), years, as_of, weights)
+
+
+def ranking_aggregates(df_ranking, years=5, as_of=None):
+    """Agregados de dividendos dos tickers de um ranking já montado (store de históricos)."""
+    if df_ranking is None or df_ranking.empty:
+        return compute_dividend_aggregates(records_to_long([]), years, as_of)
+    historico = get_history_store(df_ranking)
+    return compute_dividend_aggregates(historico.to_long(df_ranking['ticker']), years, as_of)
+
+
+def ranking_aggregate_validity(df_ranking, years=5, as_of=None):
+    """aggregate_validity dos tickers de um ranking já montado."""
+    if df_ranking is None or df_ranking.empty:
+        return aggregate_validity(records_to_long([]), years, as_of)
+    historico = get_history_store(df_ranking)
+    return aggregate_validity(historico.to_long(df_ranking['ticker']), years, as_of)
+
+
+def reprice_ranking(df_ranking, prices, aggregates, years=5, weights=None):
+    """Atualiza preço, DY e score do ranking com novos preços, sem recalcular dividendos.
+
+    Tickers sem preço novo mantêm o preço anterior; tickers sem agregados
+    mantêm as métricas anteriores. A ordem das linhas é preservada.
+    """
+    if df_ranking is None or df_ranking.empty:
+        return df_ranking
+
+    precos_novos = pd.Series(prices, dtype=float)
+    precos_novos = precos_novos[precos_novos > 0]
+    tickers = pd.Index(df_ranking['ticker'].to_numpy(dtype=object))
+
+    # Posições por hash (get_indexer), sem laço por ticker; -1 (ausente) cai no NaN acrescentado ao fim
+    pos_preco = precos_novos.index.get_indexer(tickers)
+    preco = np.where(pos_preco >= 0, np.append(precos_novos.to_numpy(), np.nan)[pos_preco],
+                     df_ranking['preco'].to_numpy(dtype=float))
+
+    metrics = metrics_from_aggregates(aggregates, pd.Series(preco, index=tickers), years, weights)
+    pos_metricas = metrics.index.get_indexer(tickers)
+    com_agregados = pos_metricas >= 0
+
+    repriced = df_ranking.copy()
+    repriced['preco'] = preco
+    for coluna in METRIC_COLUMNS:
+        novos = np.append(metrics[coluna].to_numpy(dtype=float), np.nan)[pos_metricas]
+        repriced[coluna] = np.where(com_agregados, novos, repriced[coluna].to_numpy()).astype(repriced[coluna].dtype)
+    return repriced
@@ -0,0 +1,81 @@
+"""
+Motor de análise concorrente de tickers.
+
+Distribui a busca/cálculo de métricas de cada ticker por um pool limitado de
+threads (as chamadas ao Yahoo Finance são dominadas por I/O) e devolve os
+resultados à medida que ficam prontos, para alimentar a barra de progresso.
+
+A função de análise é injetada, então o motor pode ser exercitado com um
+provedor de dados local/falso, sem rede.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_MAX_WORKERS = 8
+MAX_WORKERS_LIMIT = 32
+
+
+def _normalize_workers(max_workers):
+    """Garante um número de workers entre 1 e MAX_WORKERS_LIMIT."""
+    try:
+        max_workers = int(max_workers)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_WORKERS
+    return max(1, min(max_workers, MAX_WORKERS_LIMIT))
+
+
+def iter_analysis_results(tickers, analyze_fn, max_workers=DEFAULT_MAX_WORKERS):
+    """Executa analyze_fn(ticker) em paralelo e gera (ticker, resultado, erro) na ordem de conclusão.
+
+    No máximo 2 * max_workers tarefas ficam pendentes ao mesmo tempo, para
+    que universos grandes não criem milhares de futures de uma vez.
+    """
+    tickers = list(tickers)
+    if not tickers:
+        return
+
+    max_workers = _normalize_workers(max_workers)
+    max_pendentes = max_workers * 2
+    proximo = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pendentes = {}
+
+        while proximo < len(tickers) or pendentes:
+            # Completar a janela de tarefas em andamento
+            while proximo < len(tickers) and len(pendentes) < max_pendentes:
+                ticker = tickers[proximo]
+                pendentes[executor.submit(analyze_fn, ticker)] = ticker
+                proximo += 1
+
+            concluidos, _ = wait(list(pendentes), return_when=FIRST_COMPLETED)
+            for future in concluidos:
+                ticker = pendentes.pop(future)
+                try:
+                    yield ticker, future.result(), None
+                except Exception as e:
+                    yield ticker, None, e
+
+
+def run_concurrent_analysis(tickers, analyze_fn, max_workers=DEFAULT_MAX_WORKERS, on_result=None):
+    """Analisa todos os tickers e retorna (resultados, tickers_com_falha).
+
+    on_result(concluidos, total, ticker, resultado, erro) é chamado na thread
+    de quem chamou a função a cada ticker finalizado.
+    """
+    tickers = list(tickers)
+    results = []
+    failed_tickers = []
+    total = len(tickers)
+
+    for concluidos, (ticker, resultado, erro) in enumerate(
+            iter_analysis_results(tickers, analyze_fn, max_workers), start=1):
+        if resultado and erro is None:
+            results.append(resultado)
+        else:
+            failed_tickers.append(ticker)
+
+        if on_result:
+            on_result(concluidos, total, ticker, resultado, erro)
+
+    return results, failed_tickers
@@ -0,0 +1,141 @@
+"""
+Otimizador de carteira com restrições e lotes inteiros.
+
+Maximiza a renda esperada em dividendos (valor investido × DY 12M) sujeita a:
+- orçamento (capital total);
+- lote de negociação de cada ativo (quantidades múltiplas do lote);
+- limite de peso por ativo e por setor.
+
+Como as restrições de limite formam uma família aninhada (ativo dentro de
+setor, setor dentro do orçamento), a alocação gulosa em ordem decrescente de
+renda por real investido é ótima para a versão contínua. A versão inteira
+compra, em cada ativo, o máximo de lotes que cabe nos limites restantes; o
+caixa que sobra pelo arredondamento de lotes segue para os próximos ativos
+da fila, em vez de ficar parado.
+
+optimize_portfolio monta a tabela da carteira a partir do ranking, no modo
+proporcional ao score (top 10) ou no modo de renda máxima acima.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_PESO_ATIVO = 0.20
+DEFAULT_MAX_PESO_SETOR = 0.40
+SETOR_DESCONHECIDO = 'N/A'
+
+
+def _sector_codes(setores):
+    """Códigos inteiros por setor; setores desconhecidos não são agrupados entre si."""
+    setores = pd.Series(setores).fillna(SETOR_DESCONHECIDO).astype(str).reset_index(drop=True)
+    rotulos = setores.where(setores != SETOR_DESCONHECIDO,
+                            SETOR_DESCONHECIDO + '#' + setores.index.astype(str))
+    codigos, _ = pd.factorize(rotulos)
+    return codigos
+
+
+def lot_sizes(categorias, lote_acoes=100):
+    """Lote de negociação por ativo: ações usam o lote informado; FIIs, BDRs e ETFs, 1."""
+    categorias = pd.Series(categorias).reset_index(drop=True)
+    return np.where(categorias == 'Ação', int(lote_acoes), 1)
+
+
+def solve_income_allocation(precos, dy, lotes, setores, capital_total,
+                            max_peso_ativo=DEFAULT_MAX_PESO_ATIVO,
+                            max_peso_setor=DEFAULT_MAX_PESO_SETOR):
+    """Quantidades inteiras (múltiplas do lote) que maximizam a renda esperada.
+
+    precos, dy (% a.a.), lotes e setores são sequências alinhadas por ativo.
+    Retorna um array de quantidades.
+    """
+    precos = np.asarray(precos, dtype=float)
+    dy = np.asarray(dy, dtype=float)
+    lotes = np.asarray(lotes, dtype=int)
+    codigos = _sector_codes(setores)
+
+    n = len(precos)
+    quantidades = np.zeros(n, dtype=np.int64)
+    if n == 0 or capital_total <= 0:
+        return quantidades
+
+    custo_lote = precos * lotes
+    limite_ativo = max_peso_ativo * capital_total
+    espaco_setor = np.full(codigos.max() + 1, max_peso_setor * capital_total)
+    investido = np.zeros(n)
+    caixa = float(capital_total)
+
+    # Maior renda por real investido primeiro; empate favorece lote mais barato
+    ordem = np.lexsort((custo_lote, -dy))
+    elegiveis = ordem[(dy[ordem] > 0) & (custo_lote[ordem] > 0)]
+
+    for i in elegiveis:
+        disponivel = min(caixa, limite_ativo - investido[i], espaco_setor[codigos[i]])
+        n_lotes = int(np.floor(disponivel / custo_lote[i] + 1e-9))
+        if n_lotes <= 0:
+            continue
+        valor = n_lotes * custo_lote[i]
+        quantidades[i] += n_lotes * lotes[i]
+        investido[i] += valor
+        espaco_setor[codigos[i]] -= valor
+        caixa -= valor
+
+    return quantidades
+
+
+def optimize_portfolio(df_stocks, capital_total, min_acoes_por_empresa=100, modo='proporcional',
+                       max_peso_ativo=DEFAULT_MAX_PESO_ATIVO, max_peso_setor=DEFAULT_MAX_PESO_SETOR):
+    """Otimiza o portfólio para maximizar DY e diversificação.
+
+    modo='proporcional' distribui o capital entre os 10 melhores scores;
+    modo='renda' maximiza a renda esperada respeitando orçamento, lotes e
+    limites de peso por ativo/setor.
+    """
+    if df_stocks.empty or capital_total <= 0:
+        return None
+
+    if modo == 'renda':
+        df_selected = df_stocks.copy()
+        df_selected['quantidade'] = solve_income_allocation(
+            df_selected['preco'], df_selected['dy_12m'],
+            lot_sizes(df_selected['categoria'], min_acoes_por_empresa), df_selected['setor'],
+            capital_total, max_peso_ativo, max_peso_setor
+        )
+        df_selected = df_selected[df_selected['quantidade'] > 0]
+        df_selected = df_selected.sort_values('dy_12m', ascending=False)
+    else:
+        # Ordenar por score
+        df_sorted = df_stocks.sort_values('score', ascending=False).copy()
+
+        # Selecionar top ações (máximo 10 para diversificação)
+        max_acoes = min(10, len(df_sorted))
+        df_selected = df_sorted.head(max_acoes).copy()
+
+        # Distribuir capital proporcionalmente ao score
+        df_selected['peso'] = df_selected['score'] / df_selected['score'].sum()
+        df_selected['capital_alocado'] = df_selected['peso'] * capital_total
+
+        # Calcular quantidade de ações (lotes de 100 para ações, 1 para FIIs/BDRs/ETFs);
+        # quem não completa um lote fica com um lote
+        lotes = lot_sizes(df_selected['categoria'], min_acoes_por_empresa)
+        qtd_ideal = (df_selected['capital_alocado'] / df_selected['preco']).to_numpy()
+        qtd_lotes = (qtd_ideal // lotes) * lotes
+        df_selected['quantidade'] = np.where(qtd_lotes > 0, qtd_lotes, lotes).astype(int)
+
+    # Recalcular valores reais
+    df_selected['valor_investido'] = df_selected['quantidade'] * df_selected['preco']
+
+    # Remover linhas com valor zero
+    df_selected = df_selected[df_selected['valor_investido'] > 0]
+
+    if df_selected.empty:
+        return None
+
+    df_selected['percentual_carteira'] = (df_selected['valor_investido'] / df_selected['valor_investido'].sum()) * 100
+
+    # Dividendos esperados (baseado em DY 12m)
+    df_selected['dividendos_anuais_estimados'] = df_selected['valor_investido'] * (df_selected['dy_12m'] / 100)
+    df_selected['dividendos_mensais_estimados'] = df_selected['dividendos_anuais_estimados'] / 12
+
+    return df_selected[['ticker', 'nome', 'categoria', 'setor', 'preco', 'quantidade', 'valor_investido',
+                        'percentual_carteira', 'dy_12m', 'dividendos_anuais_estimados',
+                        'dividendos_mensais_estimados', 'score']]
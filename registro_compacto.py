@@ -0,0 +1,52 @@
+"""
+Registros compactos e serializáveis dos dados de um ticker.
+
+Em vez de guardar objetos yf.Ticker (que carregam sessão HTTP e frames
+carregados sob demanda) em st.cache_resource, o que fica em cache é apenas
+um dict pequeno com as informações e os dividendos como dois arrays:
+datas em int64 (nanossegundos, sem fuso) e valores em float64. A Series do
+pandas é remontada na saída do cache, quando necessária.
+"""
+
+import numpy as np
+import pandas as pd
+
+DIVIDENDS_KEY = 'dividends'
+
+
+def dividends_to_arrays(dividends):
+    """(datas int64 em ns, valores float64) da série de dividendos, só eventos > 0."""
+    if dividends is None or len(dividends) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+    index = pd.DatetimeIndex(dividends.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    valores = np.asarray(dividends.values, dtype=np.float64)
+    datas = index.values.astype('datetime64[ns]').astype(np.int64)
+    validos = valores > 0
+    return datas[validos], valores[validos]
+
+
+def arrays_to_dividends(datas, valores):
+    """Remonta a série de dividendos a partir dos arrays compactos."""
+    index = pd.DatetimeIndex(np.asarray(datas, dtype=np.int64).astype('datetime64[ns]'))
+    return pd.Series(np.asarray(valores, dtype=np.float64), index=index, name='Dividends')
+
+
+def compact_record(record, key=DIVIDENDS_KEY):
+    """Troca a série `record[key]` pelos arrays `div_datas`/`div_valores`."""
+    if record is None:
+        return None
+    compacto = {k: v for k, v in record.items() if k != key}
+    compacto['div_datas'], compacto['div_valores'] = dividends_to_arrays(record.get(key))
+    return compacto
+
+
+def expand_record(record, key=DIVIDENDS_KEY):
+    """Inverso de compact_record: devolve o registro com a série de dividendos em `key`."""
+    if record is None:
+        return None
+    expandido = {k: v for k, v in record.items() if k not in ('div_datas', 'div_valores')}
+    expandido[key] = arrays_to_dividends(record['div_datas'], record['div_valores'])
+    return expandido
+
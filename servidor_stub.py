@@ -0,0 +1,145 @@
+"""
+Servidor HTTP local que imita o endpoint chart do Yahoo (/v8/finance/chart/<ticker>).
+
+Serve os dados de dados_sinteticos.SyntheticMarket, com latência, taxa de
+erros 429 e tickers que sempre falham (503) configuráveis, para exercitar o cliente_mercado (pool, limite de
+taxa, backoff) sem rede.
+
+Uso:
+    python servidor_stub.py [--porta 8765] [--tickers 450] [--falhas 0.05] [--latencia 50]
+    DIVIDENDOS_YAHOO_URL=http://127.0.0.1:8765 python snapshot_ranking.py --async
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from dados_sinteticos import SyntheticMarket
+
+CHART_PREFIX = "/v8/finance/chart/"
+FUSO = "America/Sao_Paulo"
+
+
+def _epoch(index):
+    """Timestamps (s) do pregão às 10h no horário de Brasília, como o Yahoo devolve."""
+    return ((index + pd.Timedelta(hours=10)).tz_localize(FUSO).tz_convert("UTC")
+            .as_unit("s").asi8.tolist())
+
+
+def chart_payload(market, ticker, period1=None, period2=None):
+    """Resposta no formato do endpoint chart para o ticker (None se desconhecido)."""
+    frame = market.frame(ticker)
+    if frame is None:
+        return None
+    if period1 is not None:
+        frame = frame[frame.index >= pd.Timestamp(period1, unit="s").normalize()]
+    if period2 is not None:
+        frame = frame[frame.index < pd.Timestamp(period2, unit="s")]
+
+    timestamps = _epoch(frame.index)
+    pagamentos = frame[frame["Dividends"] > 0]
+    dividendos = {
+        str(ts): {"amount": float(valor), "date": ts}
+        for ts, valor in zip(_epoch(pagamentos.index), pagamentos["Dividends"])
+    }
+    closes = frame["Close"].round(4).tolist()
+    return {"chart": {"result": [{
+        "meta": {"symbol": ticker, "currency": "BRL", "exchangeTimezoneName": FUSO,
+                 "regularMarketPrice": closes[-1] if closes else None},
+        "timestamp": timestamps,
+        "events": {"dividends": dividendos},
+        "indicators": {
+            "quote": [{"close": closes, "volume": frame["Volume"].tolist()}],
+            "adjclose": [{"adjclose": closes}]
+        }
+    }], "error": None}}
+
+
+def make_handler(market, fail_rate=0.0, latency=0.0, seed=0, fail_tickers=()):
+    fail_tickers = frozenset(fail_tickers)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class ChartHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for nome, valor in (headers or {}).items():
+                self.send_header(nome, valor)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if not url.path.startswith(CHART_PREFIX):
+                self._send_json(404, {"erro": "rota desconhecida"})
+                return
+            if latency:
+                time.sleep(latency)
+            if url.path[len(CHART_PREFIX):] in fail_tickers:
+                self._send_json(503, {"erro": "Service Unavailable"}, {"Retry-After": "0"})
+                return
+            with rng_lock:
+                falhar = rng.random() < fail_rate
+            if falhar:
+                self._send_json(429, {"erro": "Too Many Requests"}, {"Retry-After": "0"})
+                return
+
+            query = parse_qs(url.query)
+            period1 = int(query["period1"][0]) if "period1" in query else None
+            period2 = int(query["period2"][0]) if "period2" in query else None
+            payload = chart_payload(market, url.path[len(CHART_PREFIX):], period1, period2)
+            if payload is None:
+                self._send_json(404, {"chart": {"result": None, "error": {"code": "Not Found"}}})
+            else:
+                self._send_json(200, payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ChartHandler
+
+
+def start_stub_server(market, port=0, fail_rate=0.0, latency=0.0, fail_tickers=()):
+    """Sobe o servidor numa thread em segundo plano. Retorna (servidor, url_base)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port),
+                                 make_handler(market, fail_rate, latency, fail_tickers=fail_tickers))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que imita o endpoint chart do Yahoo.")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--tickers", type=int, default=450, help="Tamanho do universo sintético")
+    parser.add_argument("--anos", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--falhas", type=float, default=0.0, help="Fração de respostas 429")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência por requisição (ms)")
+    args = parser.parse_args(argv)
+
+    market = SyntheticMarket(args.tickers, args.anos, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", args.porta),
+                                 make_handler(market, args.falhas, args.latencia / 1000))
+    print(f"Servindo {len(market.tickers)} tickers em http://127.0.0.1:{args.porta} "
+          f"(ex.: {CHART_PREFIX}{market.tickers[0]})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+"""
+Simulação histórica e calendário de dividendos do portfólio.
+
+Em vez de percorrer cada evento de cada ativo em Python, os dividendos por
+ação (lidos do store colunar de históricos do portfólio, só a janela pedida)
+são alinhados numa matriz (ativos × datas) e multiplicados pelo vetor
+de quantidades; as agregações mensais/anuais são feitas de uma vez com
+groupby.
+"""
+
+import calendar
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from historico_dividendos import get_history_store
+
+
+def _dividend_events(portfolio_df, start_date):
+    """Eventos do portfólio em formato longo: (posição, data, valor por ação) a partir de start_date."""
+    # Só o trecho a partir de start_date de cada ativo, localizado por busca binária no store
+    posicoes, datas, valores = get_history_store(portfolio_df).events(portfolio_df['ticker'], inicio=start_date)
+    return posicoes, datas.astype('datetime64[ns]'), valores
+
+
+def build_dividend_matrix(portfolio_df, start_date):
+    """Matriz (posições × datas) de dividendos por ação e as datas correspondentes."""
+    posicoes, datas, valores = _dividend_events(portfolio_df, start_date)
+    datas_unicas, codigo_data = np.unique(datas, return_inverse=True)
+
+    matriz = np.zeros((len(portfolio_df), len(datas_unicas)))
+    np.add.at(matriz, (posicoes, codigo_data), valores)
+    return matriz, pd.DatetimeIndex(datas_unicas)
+
+
+def simulate_portfolio_history(portfolio_df, years=5):
+    """Simula o histórico do portfólio nos últimos N anos."""
+    if portfolio_df is None or portfolio_df.empty:
+        return None, None
+
+    # Preparar dados históricos
+    end_date = datetime.today()
+    start_date = end_date - timedelta(days=years*365)
+
+    matriz, datas = build_dividend_matrix(portfolio_df, start_date)
+    if len(datas) == 0:
+        return pd.DataFrame([]), pd.DataFrame([])
+
+    # Dividendos recebidos em cada data = dividendos por ação × quantidade
+    quantidades = portfolio_df['quantidade'].to_numpy(dtype=float)
+    recebido = pd.Series(quantidades @ matriz, index=datas)
+
+    mensal = recebido.groupby(datas.to_period('M')).sum()
+    anual = recebido.groupby(datas.year).sum()
+
+    df_monthly = pd.DataFrame({
+        'mes': list(mensal.index.strftime('%Y-%m')),
+        'dividendos': mensal.values
+    })
+
+    df_annual = pd.DataFrame({
+        'ano': anual.index.astype('int64'),
+        'dividendos': anual.values
+    })
+
+    return df_monthly, df_annual
+
+
+def create_dividend_calendar(portfolio_df):
+    """Cria calendário de pagamento de dividendos."""
+    if portfolio_df is None or portfolio_df.empty:
+        return None
+
+    # Analisar últimos 24 meses para identificar padrão
+    end_date = datetime.today()
+    start_date = end_date - timedelta(days=730)
+
+    posicoes, datas, valores = _dividend_events(portfolio_df, start_date)
+
+    eventos = pd.DataFrame({
+        'mes_num': pd.DatetimeIndex(datas).month,
+        'ticker': portfolio_df['ticker'].to_numpy()[posicoes],
+        'valor': valores * portfolio_df['quantidade'].to_numpy(dtype=float)[posicoes]
+    })
+
+    # Média por (mês, ativo) e soma por mês, preservando a ordem dos ativos no portfólio
+    media_por_ativo = eventos.groupby(['mes_num', 'ticker'], sort=False)['valor'].mean().reset_index()
+    por_mes = media_por_ativo.groupby('mes_num', sort=False)
+    total_por_mes = por_mes['valor'].sum().to_dict()
+    pagantes_por_mes = por_mes['ticker'].agg(
+        lambda tickers: ', '.join(t.replace('.SA', '') for t in tickers)
+    ).to_dict()
+
+    monthly_summary = []
+    for month in range(1, 13):
+        monthly_summary.append({
+            'mes_num': month,
+            'mes': calendar.month_name[month],
+            'valor_estimado': total_por_mes.get(month, 0),
+            'acoes_pagantes': pagantes_por_mes.get(month, 'Nenhuma')
+        })
+
+    return pd.DataFrame(monthly_summary)
@@ -0,0 +1,255 @@
+"""
+Snapshot pré-calculado do ranking de dividendos.
+
+Roda a análise completa do universo B3 fora do Streamlit (por exemplo via
+cron) e grava um arquivo versionado com o ranking. Os apps carregam o
+snapshot mais recente em st.session_state['df_ranking'] ao iniciar, então
+a página abre em menos de um segundo e o trabalho pesado fica offline.
+
+Com --precos, apenas os preços do snapshot mais recente são atualizados: os
+agregados de dividendos ficam gravados no armazém local e DY/score são
+re-derivados em lote (metricas_lote.reprice_ranking), sem baixar histórico.
+
+Na análise completa, tickers sem cotação em análises seguidas ficam em
+quarentena (manutencao_universo) e só são reconsultados na data de
+reavaliação; --incluir-quarentena força a consulta de todos. Tickers sem
+dividendos/preço ficam no cache negativo (cache_compartilhado) e também são
+pulados até o TTL do motivo vencer, salvo com --sem-cache-negativo.
+
+Uso:
+    python snapshot_ranking.py [--workers 8] [--years 5] [--output dados/snapshots] [--async] [--precos]
+                               [--incluir-quarentena] [--sem-cache-negativo]
+
+Exemplo de crontab (análise completa em dias úteis às 19h; preços a cada 15 min no pregão):
+    0 19 * * 1-5 cd /caminho/dividendos && python snapshot_ranking.py
+    */15 10-17 * * 1-5 cd /caminho/dividendos && python snapshot_ranking.py --precos
+"""
+
+import argparse
+import glob
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+
+from armazem_dados import DATA_DIR, get_market_store
+from cache_compartilhado import MOTIVO_ERRO, get_negative_cache
+from cadastro_ativos import get_cadastro
+from cliente_mercado import get_market_client
+from download_lote import (batch_miss_reason, download_batch, fetch_batch_record, fetch_latest_prices,
+                           fetch_stock_metadata, BATCH_SIZE)
+from historico_dividendos import get_history_store
+from manutencao_universo import describe_universe_report, get_universe_health
+from metricas_lote import (aggregate_validity, build_ranking, compute_dividend_aggregates, ranking_aggregate_validity,
+                           ranking_aggregates, reprice_ranking)
+from motor_analise import run_concurrent_analysis, DEFAULT_MAX_WORKERS
+from universo_b3 import get_all_b3_tickers
+
+# v2: históricos de dividendos no store colunar (df.attrs), sem a coluna dividends_history
+# v3: store serializado pelos arrays base (o índice por data é refeito na leitura)
+SNAPSHOT_VERSION = 3
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+SNAPSHOT_PREFIX = f"ranking_v{SNAPSHOT_VERSION}_"
+SNAPSHOTS_TO_KEEP = 10
+ASYNC_BATCH_SIZE = 5000
+
+
+def run_ranking_analysis(tickers=None, years=5, max_workers=DEFAULT_MAX_WORKERS, store=None, on_progress=None,
+                         download_fn=None, metadata_fn=fetch_stock_metadata, batch_size=BATCH_SIZE, saude=None,
+                         negativos=None):
+    """Analisa os tickers (padrão: toda a B3) e retorna (df_ranking, tickers_com_falha).
+
+    download_fn/metadata_fn permitem trocar o Yahoo por dados locais (ex.: dados_sinteticos)
+    ou pelo cliente assíncrono (cliente_mercado). Com `saude` (UniverseHealth), os tickers
+    sem cotação recente no lote somam uma falha para a quarentena; com `negativos`
+    (NegativeCache), os tickers sem registro são gravados com o motivo.
+    """
+    tickers = list(tickers) if tickers is not None else get_all_b3_tickers()
+    batch = download_batch(tickers, years, batch_size, download_fn=download_fn, store=store)
+    if saude is not None:
+        saude.record_batch(batch, tickers)
+
+    motivos = {}
+
+    def on_result(concluidos, total, ticker, record, erro):
+        if negativos is not None and not record:
+            motivos[ticker] = MOTIVO_ERRO if erro is not None else batch_miss_reason(batch, ticker, years)
+        if on_progress:
+            on_progress(concluidos, total, ticker, record, erro)
+
+    records, failed_tickers = run_concurrent_analysis(
+        tickers, lambda ticker: fetch_batch_record(ticker, batch, years, metadata_fn),
+        max_workers, on_result
+    )
+    # Nome/setor aprendidos do .info vão para o cadastro numa gravação só
+    get_cadastro().flush()
+    if negativos is not None:
+        negativos.record({t: m for t, m in motivos.items() if m is not None}, years)
+    df_ranking = build_ranking(records, years)
+    if store is not None and not df_ranking.empty:
+        hoje = datetime.today()
+        store.save_aggregates(ranking_aggregates(df_ranking, years, hoje), years, hoje,
+                              ranking_aggregate_validity(df_ranking, years, hoje))
+    return df_ranking, failed_tickers
+
+
+def refresh_ranking_prices(df_ranking, years=5, store=None, download_fn=None, batch_size=BATCH_SIZE):
+    """Atualiza preço, DY e score do ranking baixando apenas as cotações recentes.
+
+    Os agregados de dividendos vêm do armazém enquanto valem (mesmo último
+    evento e nenhum evento entrando ou saindo das janelas desde o cálculo);
+    os demais são calculados a partir dos históricos do ranking (store em
+    df.attrs) e gravados. Retorna (df_ranking, n_precos).
+    """
+    if df_ranking is None or df_ranking.empty:
+        return df_ranking, 0
+
+    hoje = datetime.today()
+    tickers = df_ranking['ticker'].tolist()
+    dividendos = get_history_store(df_ranking).to_long(tickers)
+    validity = aggregate_validity(dividendos, years, hoje)
+    aggregates = store.read_aggregates(years, hoje, validity) if store is not None else None
+    if aggregates is None or len(aggregates) < len(validity):
+        aggregates = compute_dividend_aggregates(dividendos, years, hoje)
+        if store is not None:
+            store.save_aggregates(aggregates, years, hoje, validity)
+
+    prices = fetch_latest_prices(tickers, download_fn, batch_size)
+    return reprice_ranking(df_ranking, prices, aggregates, years), len(prices)
+
+
+def save_snapshot(df_ranking, failed_tickers=None, output_dir=SNAPSHOT_DIR, keep=SNAPSHOTS_TO_KEEP):
+    """Grava o snapshot versionado e remove os mais antigos. Retorna o caminho do arquivo."""
+    os.makedirs(output_dir, exist_ok=True)
+    gerado_em = datetime.now()
+    path = os.path.join(output_dir, f"{SNAPSHOT_PREFIX}{gerado_em.strftime('%Y%m%dT%H%M%S')}.pkl")
+
+    payload = {
+        'versao': SNAPSHOT_VERSION,
+        'gerado_em': gerado_em,
+        'total_ativos': len(df_ranking),
+        'falhas': list(failed_tickers or []),
+        'ranking': df_ranking
+    }
+
+    # Gravar em arquivo temporário e renomear, para o app nunca ler um arquivo pela metade
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    for antigo in list_snapshots(output_dir)[:-keep]:
+        try:
+            os.remove(antigo)
+        except OSError:
+            pass
+
+    return path
+
+
+def list_snapshots(snapshot_dir=SNAPSHOT_DIR):
+    """Caminhos dos snapshots da versão atual, do mais antigo ao mais recente."""
+    return sorted(glob.glob(os.path.join(snapshot_dir, f"{SNAPSHOT_PREFIX}*.pkl")))
+
+
+_snapshot_carregado = {}
+_snapshot_lock = threading.Lock()
+
+
+def load_latest_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Carrega o snapshot mais recente (dict com 'ranking', 'gerado_em'...) ou None.
+
+    O resultado fica em memória por processo enquanto o arquivo não muda, então
+    todas as sessões do app compartilham o mesmo ranking e store de históricos.
+    """
+    for path in reversed(list_snapshots(snapshot_dir)):
+        try:
+            chave = (path, os.path.getmtime(path))
+        except OSError:
+            continue
+        with _snapshot_lock:
+            if _snapshot_carregado.get('chave') == chave:
+                return _snapshot_carregado['payload']
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.load(f)
+        except Exception:
+            continue
+        if payload.get('versao') == SNAPSHOT_VERSION and isinstance(payload.get('ranking'), pd.DataFrame):
+            with _snapshot_lock:
+                _snapshot_carregado.update(chave=chave, payload=payload)
+            return payload
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera o snapshot do ranking de dividendos da B3.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="Downloads simultâneos")
+    parser.add_argument("--years", type=int, default=5, help="Anos de histórico de dividendos")
+    parser.add_argument("--output", default=SNAPSHOT_DIR, help="Diretório dos snapshots")
+    parser.add_argument("--async", dest="usar_async", action="store_true",
+                        help="Baixar cotações com o cliente assíncrono (limite de taxa e backoff)")
+    parser.add_argument("--precos", action="store_true",
+                        help="Só atualizar os preços (DY e score) do snapshot mais recente")
+    parser.add_argument("--incluir-quarentena", action="store_true",
+                        help="Consultar também os tickers em quarentena por falta de cotação")
+    parser.add_argument("--sem-cache-negativo", action="store_true",
+                        help="Consultar também os tickers gravados sem dividendos/preço no cache negativo")
+    args = parser.parse_args(argv)
+
+    download_fn, batch_size = None, BATCH_SIZE
+    if args.usar_async:
+        # O cliente tem fila própria: um único grupo deixa todos os tickers pendentes nela
+        download_fn, batch_size = get_market_client().download, ASYNC_BATCH_SIZE
+
+    inicio = time.time()
+
+    if args.precos:
+        snapshot = load_latest_snapshot(args.output)
+        if snapshot is None:
+            print("Nenhum snapshot para atualizar; rode a análise completa primeiro.", file=sys.stderr)
+            return 1
+        df_ranking, n_precos = refresh_ranking_prices(snapshot['ranking'], args.years, get_market_store(),
+                                                      download_fn, batch_size)
+        path = save_snapshot(df_ranking, snapshot['falhas'], args.output)
+        print(f"Snapshot gravado em {path}: {n_precos}/{len(df_ranking)} preços atualizados, "
+              f"{time.time() - inicio:.1f}s")
+        return 0
+
+    def on_progress(concluidos, total, ticker, record, erro):
+        if concluidos % 50 == 0 or concluidos == total:
+            print(f"[{concluidos}/{total}] {ticker}", flush=True)
+
+    saude = get_universe_health()
+    tickers, relatorio = saude.effective_universe(get_all_b3_tickers(), args.incluir_quarentena)
+    print(f"Universo: {describe_universe_report(relatorio)}", flush=True)
+
+    negativos = get_negative_cache()
+    if not args.sem_cache_negativo:
+        conhecidos = negativos.lookup(tickers, args.years)
+        tickers = [t for t in tickers if t not in conhecidos]
+        print(f"Cache negativo: {len(conhecidos)} tickers pulados "
+              f"({', '.join(f'{n} {m}' for m, n in Counter(conhecidos.values()).items()) or 'nenhum'})", flush=True)
+
+    df_ranking, failed_tickers = run_ranking_analysis(
+        tickers, years=args.years, max_workers=args.workers, store=get_market_store(), on_progress=on_progress,
+        download_fn=download_fn, batch_size=batch_size, saude=saude, negativos=negativos
+    )
+
+    if df_ranking.empty:
+        print("Nenhum ativo com dados de dividendos; snapshot não gravado.", file=sys.stderr)
+        return 1
+
+    path = save_snapshot(df_ranking, failed_tickers, args.output)
+    print(f"Snapshot gravado em {path}: {len(df_ranking)} ativos, "
+          f"{len(failed_tickers)} falhas, {time.time() - inicio:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
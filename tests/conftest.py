@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Os módulos do app ficam na raiz; DATA_DIR é lido na importação, então os
+# testes apontam para um diretório temporário antes de qualquer import.
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("DIVIDENDOS_DATA_DIR", tempfile.mkdtemp(prefix="dividendos_testes_"))
@@ -0,0 +1,47 @@
+import pandas as pd
+
+from armazem_dados import MarketDataStore, get_prices_incremental
+
+
+def _precos(inicio, fim):
+    datas = pd.bdate_range(inicio, fim)
+    return pd.DataFrame({"Close": 10.0, "Volume": 100}, index=datas)
+
+
+def test_busca_que_falhou_nao_registra_cobertura(tmp_path):
+    store = MarketDataStore(str(tmp_path / "mercado.sqlite"))
+
+    get_prices_incremental(store, "AAAA3", "2024-01-01", "2024-03-28", lambda inicio, fim: None)
+
+    assert store.get_coverage("AAAA3", "precos") is None
+    chamadas = []
+
+    def fetch_range(inicio, fim):
+        chamadas.append((inicio, fim))
+        return _precos(inicio, fim)
+
+    precos = get_prices_incremental(store, "AAAA3", "2024-01-01", "2024-03-28", fetch_range)
+
+    assert len(chamadas) == 1
+    assert not precos.empty
+    assert store.get_coverage("AAAA3", "precos")[:2] == (pd.Timestamp("2024-01-01"),
+                                                         pd.Timestamp("2024-03-28"))
+
+
+def test_extensao_que_falhou_mantem_cobertura_anterior(tmp_path):
+    store = MarketDataStore(str(tmp_path / "mercado.sqlite"))
+    get_prices_incremental(store, "AAAA3", "2024-02-01", "2024-03-28", _precos)
+
+    get_prices_incremental(store, "AAAA3", "2024-01-01", "2024-04-30", lambda inicio, fim: None)
+
+    assert store.get_coverage("AAAA3", "precos")[:2] == (pd.Timestamp("2024-02-01"),
+                                                         pd.Timestamp("2024-03-28"))
+
+
+def test_trecho_vazio_confirmado_entra_na_cobertura(tmp_path):
+    store = MarketDataStore(str(tmp_path / "mercado.sqlite"))
+
+    get_prices_incremental(store, "AAAA3", "2024-01-01", "2024-03-28",
+                           lambda inicio, fim: _precos(inicio, fim).iloc[:0])
+
+    assert store.get_coverage("AAAA3", "precos") is not None
@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_compartilhado import LRUCache, SQLiteCacheBackend, TieredCache, _local_signing_key
+
+
+def test_clear_local_preserva_camada_compartilhada(tmp_path):
+    compartilhada = SQLiteCacheBackend(str(tmp_path / "cache.sqlite"))
+    cache = TieredCache(LRUCache(), compartilhada)
+    cache.set("chave", b"valor", 60)
+
+    cache.clear(compartilhada=False)
+
+    assert len(cache.memory) == 0
+    assert cache.get("chave") == b"valor"
+
+    cache.clear()
+
+    assert cache.get("chave") is None
+
+
+def test_chave_local_e_criada_uma_vez_e_relida(tmp_path):
+    caminho = str(tmp_path / "cache.chave")
+
+    chave = _local_signing_key(caminho)
+
+    assert len(chave) == 32
+    assert _local_signing_key(caminho) == chave
+    assert os.stat(caminho).st_mode & 0o777 == 0o600
+    assert os.listdir(tmp_path) == ["cache.chave"]
+
+
+def test_chave_local_concorrente_e_a_mesma_para_todos(tmp_path):
+    caminho = str(tmp_path / "cache.chave")
+
+    with ThreadPoolExecutor(16) as pool:
+        chaves = set(pool.map(lambda _: _local_signing_key(caminho), range(64)))
+
+    assert len(chaves) == 1
+    assert len(chaves.pop()) == 32
@@ -0,0 +1,42 @@
+import pytest
+
+from cache_compartilhado import MOTIVO_ERRO
+from cliente_mercado import MarketDataClient
+from dados_sinteticos import SyntheticMarket
+from download_lote import batch_miss_reason, download_batch
+from servidor_stub import start_stub_server
+
+
+@pytest.fixture
+def mercado():
+    return SyntheticMarket(6, 2, 7)
+
+
+@pytest.fixture
+def cliente_com_falha(mercado):
+    falho = mercado.tickers[0]
+    server, url = start_stub_server(mercado, fail_tickers={falho})
+    cliente = MarketDataClient(base_url=url, rate=1000, max_retries=1, timeout=5)
+    yield cliente, falho
+    cliente.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_lista_tickers_que_falharam(mercado, cliente_com_falha):
+    cliente, falho = cliente_com_falha
+
+    data = cliente.download(mercado.tickers, start="2020-01-01")
+
+    assert data.attrs["falhas"] == [falho]
+    assert falho not in data.columns.get_level_values(0)
+
+
+def test_download_batch_trata_falha_do_cliente_como_erro_de_busca(mercado, cliente_com_falha):
+    cliente, falho = cliente_com_falha
+
+    batch = download_batch(mercado.tickers, years=2, download_fn=cliente.download)
+
+    assert batch.falhas == {falho}
+    assert batch_miss_reason(batch, falho, years=2) == MOTIVO_ERRO
+    assert set(batch) == set(mercado.tickers) - {falho}
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import motor_analise
+from motor_analise import iter_analysis_results, run_concurrent_analysis
+
+
+def _analise_falsa(ticker):
+    """ERRO* levanta exceção, VAZIO* não tem resultado, LENTO* demora; o resto responde na hora."""
+    if ticker.startswith("LENTO"):
+        time.sleep(0.2)
+    if ticker.startswith("ERRO"):
+        raise RuntimeError(f"falha em {ticker}")
+    if ticker.startswith("VAZIO"):
+        return None
+    return {"ticker": ticker}
+
+
+def test_resultados_e_falhas():
+    tickers = ["AAAA3", "ERRO1", "BBBB4", "VAZIO1", "LENTO1"]
+
+    resultados, falhas = run_concurrent_analysis(tickers, _analise_falsa, max_workers=3)
+
+    assert sorted(r["ticker"] for r in resultados) == ["AAAA3", "BBBB4", "LENTO1"]
+    assert sorted(falhas) == ["ERRO1", "VAZIO1"]
+
+
+def test_on_result_na_ordem_de_conclusao():
+    tickers = ["LENTO1"] + [f"T{i:02d}" for i in range(10)] + ["ERRO1"]
+    chamadas = []
+
+    run_concurrent_analysis(tickers, _analise_falsa, max_workers=4,
+                            on_result=lambda *args: chamadas.append(args))
+
+    assert [c[0] for c in chamadas] == list(range(1, len(tickers) + 1))
+    assert {c[1] for c in chamadas} == {len(tickers)}
+    assert sorted(c[2] for c in chamadas) == sorted(tickers)
+    # O ticker lento termina depois de todos os outros, mesmo tendo sido o primeiro enviado
+    assert chamadas[-1][2] == "LENTO1"
+    erros = {c[2]: c[4] for c in chamadas if c[4] is not None}
+    assert list(erros) == ["ERRO1"] and isinstance(erros["ERRO1"], RuntimeError)
+
+
+def test_limite_de_threads_e_de_tarefas_pendentes(monkeypatch):
+    enviados = []
+
+    class ExecutorContado(motor_analise.ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            enviados.append(args)
+            return super().submit(fn, *args, **kwargs)
+
+    monkeypatch.setattr(motor_analise, "ThreadPoolExecutor", ExecutorContado)
+    lock = threading.Lock()
+    em_andamento = [0, 0]  # atual, máximo
+
+    def analise(ticker):
+        with lock:
+            em_andamento[0] += 1
+            em_andamento[1] = max(em_andamento[1], em_andamento[0])
+        time.sleep(0.01)
+        with lock:
+            em_andamento[0] -= 1
+        return ticker
+
+    tickers = [f"T{i:03d}" for i in range(60)]
+    vistos = []
+    for ticker, resultado, erro in iter_analysis_results(tickers, analise, max_workers=3):
+        vistos.append(ticker)
+        assert len(enviados) - len(vistos) < 2 * 3
+
+    assert sorted(vistos) == tickers
+    assert em_andamento[1] <= 3
@@ -41,7 +41,7 @@ def get_tickers_fundamentus():
         "ELEK4.SA", "ELET3.SA", "ELET5.SA", "ELET6.SA", "ELMD3.SA",
         "EMBR3.SA", "EMGA2.SA", "EMGA3.SA", "EMGA4.SA", "ENJU3.SA",
         "ENMT3.SA", "ENMT4.SA", "ENEV3.SA", "ENGI3.SA", "ENGI4.SA",
-        "ENGI11.SA", "ENJU3.SA", "EQPA3.SA", "EQPA5.SA", "EQPA6.SA",
+        "ENGI11.SA", "EQPA3.SA", "EQPA5.SA", "EQPA6.SA",
         "EQPA7.SA", "EQTL3.SA", "ESPA3.SA", "ETER3.SA", "EUCA3.SA",
         "EUCA4.SA", "EVEN3.SA", "EZTC3.SA", "FESA3.SA", "FESA4.SA",
         "FHER3.SA", "FIEI3.SA", "FIQE3.SA", "FLRY3.SA", "FMID11.SA",
@@ -49,7 +49,7 @@ def get_tickers_fundamentus():
         "GARO3.SA", "GEPA3.SA", "GEPA4.SA", "GGBR3.SA", "GGBR4.SA",
         "GGPS3.SA", "GMAT3.SA", "GOAU3.SA", "GOAU4.SA", "GOLL4.SA",
         "GPAR3.SA", "GPCP3.SA", "GPIV33.SA", "GRND3.SA", "GSHP3.SA",
-        "GUAR3.SA", "GUFA3.SA", "GUFA4.SA", "GUAR3.SA", "HAPV3.SA",
+        "GUAR3.SA", "GUFA3.SA", "GUFA4.SA", "HAPV3.SA",
         "HBRE3.SA", "HBSA3.SA", "HETA3.SA", "HETA4.SA", "HGBS11.SA",
         "HGPO11.SA", "HGRE11.SA", "HGRU11.SA", "HOOT4.SA", "HPDV11.SA",
         "HYPE3.SA", "IGBR3.SA", "IGTA3.SA", "IGTI11.SA", "IGTI3.SA",
@@ -0,0 +1,88 @@
+"""
+Universo de tickers da B3 e categorização por tipo de ativo.
+
+O universo é estático durante a vida do processo: a lista ordenada e o mapa
+ticker -> categoria são montados uma vez (get_universe) e reaproveitados por
+todas as sessões e reruns do app, em vez de refazer set/sorted e categorizar
+ticker a ticker a cada clique. Ambos vêm do cadastro de ativos
+(cadastro_ativos), que guarda também setor, lote padrão e situação de
+listagem; as regras pelo código do ticker (category_from_symbol) só valem
+para tickers fora do cadastro.
+"""
+
+import threading
+
+# BDRs populares que podem não estar no Fundamentus
+BDRS_EXTRAS = [
+    "AAPL34.SA", "MSFT34.SA", "AMZO34.SA", "GOGL34.SA", "META34.SA",
+    "TSLA34.SA", "NVDC34.SA", "NFLX34.SA", "DIS34.SA", "COCA34.SA",
+    "NIKE34.SA", "VISA34.SA", "PYPL34.SA", "BABA34.SA", "DISB34.SA"
+]
+
+# ETFs populares que podem não estar no Fundamentus
+ETFS_EXTRAS = [
+    "BOVA11.SA", "SMAL11.SA", "IVVB11.SA", "SPXI11.SA", "MATB11.SA",
+    "PIBB11.SA", "ISUS11.SA", "FIND11.SA", "DIVO11.SA", "BOVX11.SA",
+    "GOVE11.SA", "BRAX11.SA", "XBOV11.SA", "BOVV11.SA"
+]
+
+# ETFs terminam em 11 como os FIIs; são reconhecidos pela lista
+_ETFS = frozenset(t.replace(".SA", "") for t in ETFS_EXTRAS)
+
+
+def _build_universe():
+    # Tickers ativos do cadastro (Fundamentus + ETFs/BDRs extras) e categoria de todos os cadastrados
+    from cadastro_ativos import get_cadastro
+    cadastro = get_cadastro()
+    categorias = {ticker: cadastro.category(ticker) for ticker in cadastro.tabela.index}
+    return tuple(cadastro.tickers()), categorias
+
+
+_universe = None
+_universe_lock = threading.Lock()
+
+
+def get_universe():
+    """Tickers ordenados (tupla) e mapa ticker -> categoria, montados uma vez por processo."""
+    global _universe
+    with _universe_lock:
+        if _universe is None:
+            _universe = _build_universe()
+        return _universe
+
+
+def get_all_b3_tickers():
+    """Retorna lista atualizada de tickers da B3 (Fundamentus + ETFs/BDRs)."""
+    return list(get_universe()[0])
+
+
+def tickers_by_category(categorias, setores=None):
+    """Tickers do universo nas `categorias` (e, se informados, nos `setores`), na ordem do universo."""
+    from cadastro_ativos import get_cadastro
+    return get_cadastro().tickers(categorias=categorias, setores=setores)
+
+
+def categorize_ticker(ticker):
+    """Categoria do ticker (Ação, FII, BDR ou ETF): do cadastro ou, fora dele, pelo código."""
+    categoria = get_universe()[1].get(ticker)
+    return categoria if categoria is not None else category_from_symbol(ticker)
+
+
+def category_from_symbol(ticker):
+    """Categoriza o ticker em: Ação, FII, BDR ou ETF, pelas regras do código."""
+    ticker_clean = ticker.replace(".SA", "").upper()
+
+    # ETFs específicos
+    if ticker_clean in _ETFS:
+        return "ETF"
+
+    # FIIs terminam em 11 (mas não são ETFs)
+    if ticker_clean.endswith("11"):
+        return "FII"
+
+    # BDRs terminam em 34 ou 35
+    if ticker_clean.endswith("34") or ticker_clean.endswith("35"):
+        return "BDR"
+
+    # Default: Ação
+    return "Ação"